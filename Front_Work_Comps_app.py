@@ -1,348 +1,27 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import pandas as pd
-import numpy as np
-import math
 import io
+import json
+import os
 
-# ==========================================
-# 1. HELPER FUNCTIONS
-# ==========================================
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculates distance in miles between two lat/lon points."""
-    try:
-        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-        lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        return c * 3956  # miles
-    except Exception:
-        return 999999
-        
-def norm_desc(s: str) -> str:
-    """Simple normalizer for description text (case-insensitive, strip spaces)."""
-    if pd.isna(s):
-        return ""
-    return str(s).strip().lower()
-
-def norm_class(v):
-    try:
-        return int(float(v))
-    except Exception:
-        return np.nan
-
-
-def tolerance_ok(subj_val, comp_val, pct=0.50):
-    if pd.isna(subj_val) or pd.isna(comp_val) or subj_val == 0:
-        return False
-    return abs(comp_val - subj_val) / subj_val <= pct
-
-
-def get_prefix_6(val):
-    if pd.isna(val):
-        return ""
-    clean = (
-        str(val)
-        .lower()
-        .replace(" ", "")
-        .replace(".", "")
-        .replace("-", "")
-        .replace(",", "")
-        .replace("/", "")
-    )
-    return clean[:6]
-
-
-def unique_ok(subject, candidate, chosen_comps, is_hotel):
-    """Prevent duplicates based on several keys."""
-    def norm(x): return str(x).strip().lower()
-    pairs = [(subject, candidate)] + [(c, candidate) for c in chosen_comps]
-    for a, b in pairs:
-        if norm(a.get("Property Account No", "")) == norm(b.get("Property Account No", "")):
-            return False
-        if len(get_prefix_6(a.get("Owner Name/ LLC Name", ""))) >= 4 and \
-           get_prefix_6(a.get("Owner Name/ LLC Name", "")) == get_prefix_6(b.get("Owner Name/ LLC Name", "")):
-            return False
-        if is_hotel:
-            if len(get_prefix_6(a.get("Hotel Name", ""))) >= 4 and \
-               get_prefix_6(a.get("Hotel Name", "")) == get_prefix_6(b.get("Hotel Name", "")):
-                return False
-            if len(get_prefix_6(a.get("Owner Street Address", ""))) >= 4 and \
-               get_prefix_6(a.get("Owner Street Address", "")) == get_prefix_6(b.get("Owner Street Address", "")):
-                return False
-        if len(get_prefix_6(a.get("Property Address", ""))) >= 4 and \
-           get_prefix_6(a.get("Property Address", "")) == get_prefix_6(b.get("Property Address", "")):
-            return False
-    return True
-
-
-# ---------- CLASS RULES ----------
-
-def class_ok_hotel(subj_c, comp_c):
-    subj_c = int(subj_c)
-    comp_c = int(comp_c)
-    if subj_c == 8:
-        return comp_c == 8
-    if comp_c == 8:
-        return False
-    if subj_c == 7:
-        return comp_c in (6, 7)
-    if subj_c == 6:
-        return comp_c in (5, 6, 7)
-    return (comp_c >= subj_c - 1) and (comp_c <= subj_c + 2)
-
-
-def class_ok_other(subj_c, comp_c):
-    try:
-        subj_c = int(subj_c)
-        comp_c = int(comp_c)
-    except Exception:
-        return False
-    return abs(comp_c - subj_c) <= 2
-
-
-# ==========================================
-# 2. CORE MATCHING LOGIC
-# ==========================================
-
-def find_comps(
-    srow,
-    src_df,
-    *,
-    is_hotel,
-    use_hotel_class_rule,
-    max_radius_miles,
-    max_gap_pct_main,
-    max_gap_pct_value,
-    max_gap_pct_size,
-    max_comps,
-    prop_type=None,
-    debug=False,
-):
-    """Single-mode matching using only miles as location filter."""
-
-    if is_hotel:
-        metric_field = "VPR"
-        size_field = "Rooms"
-        value_field = "Total Market value-2023"
-    else:
-        metric_field = "VPU"
-        ptype = (prop_type or "").strip().lower()
-        if ptype == "apartment":
-            size_field = "Units"
-        else:
-            size_field = "GBA"
-        value_field = "Total Market value-2023"
-
-    subj_class = srow.get("Class_Num")
-    subj_metric = srow.get(metric_field)
-    subj_value = srow.get(value_field)
-    subj_size = srow.get(size_field)
-    slat, slon = srow.get("lat"), srow.get("lon")
-
-    if pd.isna(subj_metric):
-        if debug:
-            print("DEBUG: subj_metric is NaN, aborting.")
-        return []
-
-    if debug:
-        print("\n========== DEBUG FOR SUBJECT ==========")
-        print("Account:", srow.get("Property Account No"))
-        print("Metric field:", metric_field, "subj_metric:", subj_metric)
-        print("Size field:", size_field, "subj_size:", subj_size)
-        print("Value field:", value_field, "subj_value:", subj_value)
-        print("Radius:", max_radius_miles,
-              "VPU band:", max_gap_pct_main,
-              "Value band:", max_gap_pct_value,
-              "Size band:", max_gap_pct_size)
-        print("Total source rows:", len(src_df))
-
-    total = len(src_df)
-    after_class = after_metric_exist = 0
-    after_metric_band = after_value_band = 0
-    after_size_band = after_distance = 0
-
-    candidates = []
-
-    for _, crow in src_df.iterrows():
-        comp_class = crow.get("Class_Num")
-
-        class_ok_flag = True
-        if is_hotel and use_hotel_class_rule:
-            if not class_ok_hotel(subj_class, comp_class):
-                class_ok_flag = False
-        else:
-            if pd.notna(subj_class) and pd.notna(comp_class):
-                if not class_ok_other(subj_class, comp_class):
-                    class_ok_flag = False
-
-        if not class_ok_flag:
-            continue
-        after_class += 1
-
-        comp_metric = crow.get(metric_field)
-        comp_value = crow.get(value_field)
-        comp_size = crow.get(size_field)
-
-        if pd.isna(comp_metric) or comp_metric > subj_metric:
-            continue
-        after_metric_exist += 1
-
-        if not tolerance_ok(subj_metric, comp_metric, max_gap_pct_main):
-            continue
-        after_metric_band += 1
-
-        if not tolerance_ok(subj_value, comp_value, max_gap_pct_value):
-            continue
-        after_value_band += 1
-
-        if not tolerance_ok(subj_size, comp_size, max_gap_pct_size):
-            continue
-        after_size_band += 1
-
-        clat, clon = crow.get("lat"), crow.get("lon")
-        dist_miles = 999
-        if pd.notna(slat) and pd.notna(slon) and pd.notna(clat) and pd.notna(clon):
-            dist_miles = haversine(slat, slon, clat, clon)
-
-        if dist_miles > max_radius_miles:
-            continue
-        after_distance += 1
-
-        match_type = f"Within {max_radius_miles} Miles"
-        metric_gap = float(subj_metric - comp_metric)
-
-        ccopy = crow.copy()
-        ccopy["Match_Method"] = match_type
-        ccopy["Distance_Calc"] = dist_miles if dist_miles != 999 else "N/A"
-        ccopy[f"{metric_field}_Diff"] = metric_gap
-
-        candidates.append(ccopy)
-
-    if debug:
-        print("Total candidates start:", total)
-        print("After class rule:", after_class)
-        print("After metric exists & <= subj:", after_metric_exist)
-        print("After VPU/VPR band:", after_metric_band)
-        print("After value band:", after_value_band)
-        print("After size band:", after_size_band)
-        print("After distance:", after_distance)
-        print("Final candidates list length:", len(candidates))
-        print("========================================")
-
-    if not candidates:
-        return []
-
-    subj_value = srow.get(value_field)
-
-    def market_diff(cand_row):
-        cv = cand_row.get(value_field)
-        if pd.isna(subj_value) or pd.isna(cv):
-            return float("inf")
-        return abs(float(cv) - float(subj_value))
-
-    rows_only = candidates[:]
-    rows_only.sort(key=lambda r: r.get(metric_field, 0.0), reverse=True)
-
-    top_metric = rows_only[0].get(metric_field)
-    top_group = [r for r in rows_only if r.get(metric_field) == top_metric]
-    comp1 = min(top_group, key=market_diff) if top_group else rows_only[0]
-    comp2 = rows_only[-1]
-    mid_index = len(rows_only) // 2
-    comp3 = rows_only[mid_index]
-
-    final_comps = []
-    chosen_rows = []
-
-    for crow in [comp1, comp2, comp3]:
-        if crow is None:
-            continue
-        if not unique_ok(srow, crow, chosen_rows, is_hotel=is_hotel):
-            continue
-        ccopy = crow.copy()
-        final_comps.append(ccopy)
-        chosen_rows.append(ccopy)
-        if len(final_comps) == max_comps:
-            break
-
-    return final_comps
-
-
-def find_comps_cascading(
-    srow,
-    src_df,
-    *,
-    is_hotel,
-    use_hotel_class_rule,
-    max_comps,
-    rule_sets,
-    prop_type=None,
-    debug=False,
-):
-    all_comps = []
-    chosen_rows = []
-
-    for idx_rules, rules in enumerate(rule_sets):
-        if len(all_comps) >= max_comps:
-            break
-
-        comps = find_comps(
-            srow,
-            src_df,
-            is_hotel=is_hotel,
-            use_hotel_class_rule=use_hotel_class_rule,
-            max_radius_miles=rules["max_radius_miles"],
-            max_gap_pct_main=rules["max_gap_pct_main"],
-            max_gap_pct_value=rules["max_gap_pct_value"],
-            max_gap_pct_size=rules["max_gap_pct_size"],
-            max_comps=max_comps,
-            prop_type=prop_type,
-            debug=debug and idx_rules == 0,
-        )
-
-        for crow in comps:
-            if len(all_comps) >= max_comps:
-                break
-            if not unique_ok(srow, crow, chosen_rows, is_hotel=is_hotel):
-                continue
-            ccopy = crow.copy()
-            ccopy["Rule_Set"] = rules["name"]
-            chosen_rows.append(ccopy)
-            all_comps.append(ccopy)
-
-    return all_comps
-
-
-OUTPUT_COLS_HOTEL = [
-    "Property Account No", "Hotel Name", "Rooms", "VPR", "Property Address",
-    "Property City", "Property County", "Property State", "Property Zip Code",
-    "Assessed Value-2023", "Market Value-2023", "Hotel Class", "description",
-    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
-    "Owner State", "Owner ZIP", "Contact Person", "Designation"
-]
-
-OUTPUT_COLS_OTHER = [
-    "Property Account No", "GBA", "VPU", "Property Address",
-    "Property City", "Property County", "Property State", "Property Zip Code",
-    "Assessed Value-2023", "Total Market value-2023", "description",
-    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
-    "Owner State", "Owner ZIP"
-]
-
-
-def get_val(row, col):
-    if col == "Hotel Class":
-        return row.get("Hotel class values", "")
-    if col == "Property County":
-        return row.get("Property County", row.get("County", ""))
-    return row.get(col, "")
+import pandas as pd
 
+from comps_cache import CompCache, PoolCache, file_digest
+from comps_engine import (
+    PROPERTY_TYPE_COL,
+    PROPERTY_TYPES,
+    RULE_SETS,
+    SELECTION_STRATEGIES,
+    default_overpaid_base,
+    iter_result_frames,
+)
+from comps_jobs import FINISHED, JobRunner, JobStore, batch_job, import_job, job_eta, match_job
+from comps_output import OUTPUT_FORMATS, write_results_file, write_results_workbook
+from comps_store import list_stores, store_path
+from comps_timing import StageTimer, combined
 
 # ==========================================
-# 3. STREAMLIT APP
+# STREAMLIT APP (matching engine: comps_engine.py)
 # ==========================================
 
 st.set_page_config(page_title="Comp Matcher", layout="wide")
@@ -577,9 +256,25 @@ st.markdown(
 
 st.sidebar.header("⚙️ Configuration")
 
+batch_mode = st.sidebar.checkbox(
+    "Batch: every property type",
+    value=False,
+    help="Match hotels, apartments, office, warehouse and retail in one run: both files "
+         "are read once, split on their property type column, and each type is matched "
+         "with its own rules. The workbook gets a sheet per type.",
+)
+type_col = PROPERTY_TYPE_COL
+if batch_mode:
+    type_col = st.sidebar.text_input(
+        "Property Type Column",
+        value=PROPERTY_TYPE_COL,
+        help="Column naming each row's type: Hotel, Apartment, Office, Warehouse or Retail.",
+    )
+
 prop_type = st.sidebar.radio(
     "Property Type",
-    ["Hotel", "Apartment", "Office", "Warehouse", "Retail"],
+    PROPERTY_TYPES,
+    disabled=batch_mode,
     help="Hotel uses VPR & Rooms; Apartment uses VPU & Units; others use VPU & GBA.",
 )
 
@@ -608,31 +303,6 @@ if rule_mode == "Dynamic":
 # main metric name
 main_metric_name = "VPR" if is_hotel else "VPU"
 
-# distance + bands for primary (single) mode – used when cascading is OFF
-MAIN_BAND = 0.50  # 50–100% VPU/VPR
-
-if rule_mode == "Static":
-    max_gap_pct_main = MAIN_BAND
-    max_gap_pct_value = 0.50
-    max_gap_pct_size = 0.50
-    max_radius = 7.0
-else:
-    if category == "Category 1":
-        max_gap_pct_main = MAIN_BAND
-        max_gap_pct_value = 0.80
-        max_gap_pct_size = 0.80
-        max_radius = 10.0
-    elif category == "Category 2":
-        max_gap_pct_main = MAIN_BAND
-        max_gap_pct_value = 1.20
-        max_gap_pct_size = 1.20
-        max_radius = 15.0
-    else:
-        max_gap_pct_main = MAIN_BAND
-        max_gap_pct_value = 1.50
-        max_gap_pct_size = 1.50
-        max_radius = 15.0
-
 # --- Cascading switch ---
 use_cascading = st.sidebar.checkbox(
     "Use Cascading Matching (Static → Cat1 → Cat2 → Cat3)",
@@ -649,6 +319,31 @@ max_comps = st.sidebar.number_input(
     max_value=20,
 )
 
+# --- Comp selection ---
+selection = st.sidebar.selectbox(
+    "Comp Selection",
+    list(SELECTION_STRATEGIES),
+    format_func=lambda name: SELECTION_STRATEGIES[name]["label"],
+    help="Classic picks the highest, lowest and middle metric in each rule tier. Scored picks "
+    "the closest matches by distance, metric gap and value gap, filling Max Comps from the "
+    "tightest tier before relaxing to the next.",
+)
+
+# --- Parallel matching ---
+use_parallel = st.sidebar.checkbox(
+    "Use Parallel Matching",
+    value=False,
+    help="Spread subjects over several worker processes (useful for large subject files).",
+)
+n_workers = st.sidebar.number_input(
+    "Worker Processes",
+    value=os.cpu_count() or 1,
+    step=1,
+    min_value=1,
+    max_value=max(os.cpu_count() or 1, 1) * 2,
+    disabled=not use_parallel,
+)
+
 # --- Read‑only rules text ---
 with st.sidebar.expander("📏Comparable Rules ", expanded=False):
 
@@ -747,12 +442,16 @@ use_overpaid = st.sidebar.checkbox(
 
 overpaid_base_dim = None
 if use_overpaid:
-    overpaid_base_dim = st.sidebar.radio(
-        "Use Rooms / Units / GBA?",
-        ["Rooms", "Units", "GBA"],
-        index=0 if is_hotel else 1,
-        help="Hotel: usually Rooms; Apartments: Units; Other properties: GBA.",
-    )
+    if batch_mode:
+        st.sidebar.caption("Batch runs use Rooms for Hotel, Units for Apartment and GBA for the other types.")
+    else:
+        overpaid_base_choices = ["Rooms", "Units", "GBA"]
+        overpaid_base_dim = st.sidebar.radio(
+            "Use Rooms / Units / GBA?",
+            overpaid_base_choices,
+            index=overpaid_base_choices.index(default_overpaid_base(prop_type)),
+            help="Hotel: usually Rooms; Apartments: Units; Other properties: GBA.",
+        )
 
     overpaid_pct = st.sidebar.number_input(
         "Overpaid Percentage (%)",
@@ -766,45 +465,97 @@ else:
     overpaid_pct = 0.0
     overpaid_base_dim = None
 
+# --- Results file ---
+st.sidebar.markdown("### 📤 Results File")
+output_fmt = st.sidebar.selectbox(
+    "Download Format",
+    list(OUTPUT_FORMATS),
+    format_func=lambda f: OUTPUT_FORMATS[f][0],
+    disabled=batch_mode,
+    help="Rows are written to the file as subjects finish, so large runs "
+         "don't hold the whole results table in memory.",
+)
+if batch_mode:
+    output_fmt = "xlsx"
+    st.sidebar.caption("Batch runs download one Excel workbook with a sheet per property type.")
+
+# --- Performance ---
+st.sidebar.markdown("### ⏱️ Performance")
+capture_profile = st.sidebar.checkbox(
+    "Capture cProfile",
+    value=False,
+    help="Profile every function call during the run (slower). The report "
+         "appears in the Performance panel under the results.",
+)
+
+# --- Data Source cache ---
+st.sidebar.markdown("### 🗄️ Data Source Cache")
+use_pool_cache = st.sidebar.checkbox(
+    "Reuse parsed Data Source",
+    value=True,
+    help="Stores the normalized Data Source on disk, keyed by file contents, "
+         "so re-running against the same roll skips file parsing.",
+)
+pool_cache = PoolCache()
+cached_pools = pool_cache.entries()
+st.sidebar.caption(
+    f"{len(cached_pools)} cached pool(s), "
+    f"{sum(size for _, size, _ in cached_pools) / 1024 / 1024:.1f} MB "
+    f"of {pool_cache.max_bytes / 1024 / 1024:.0f} MB"
+)
+if st.sidebar.button("🧹 Clear Data Source Cache"):
+    removed = pool_cache.clear()
+    st.sidebar.success(f"Removed {removed} cached pool(s).")
+
+use_comp_cache = st.sidebar.checkbox(
+    "Reuse comps for unchanged subjects",
+    value=True,
+    help="Remembers each subject's comps, keyed by its matching fields, the "
+         "Data Source contents and the rule settings, so a rerun after "
+         "editing or adding a few subjects only matches those rows.",
+)
+comp_cache = CompCache()
+st.sidebar.caption(
+    f"{comp_cache.entries()} cached subject(s), "
+    f"{comp_cache.size_bytes() / 1024 / 1024:.1f} MB "
+    f"of {comp_cache.max_bytes / 1024 / 1024:.0f} MB"
+)
+if st.sidebar.button("🧹 Clear Subject Comps Cache"):
+    removed = comp_cache.clear()
+    st.sidebar.success(f"Removed {removed} cached subject(s).")
+
+# --- Data Source store ---
+st.sidebar.markdown("### 🗃️ Data Source Store")
+stores = [s for s in list_stores() if (s.info()["prop_type"] == "Hotel") == is_hotel]
+use_store = st.sidebar.checkbox(
+    "Match against an imported Data Source",
+    value=False,
+    disabled=not stores or batch_mode,
+    help="Reads only the rows of an imported roll that the subjects can match "
+         "(by location and the rule bands) instead of loading the whole file. "
+         "Import a roll with the button below or comps_store.py.",
+)
+src_store = None
+store_shards = False
+if use_store and stores and not batch_mode:
+    stores_by_path = {s.path: s for s in stores}
+    src_store = stores_by_path[st.sidebar.selectbox(
+        "Store",
+        list(stores_by_path),
+        format_func=lambda path: f"{stores_by_path[path].name} ({stores_by_path[path].info()['rows']:,} rows)",
+    )]
+    store_shards = st.sidebar.checkbox(
+        "Load the store tile by tile",
+        value=False,
+        help="Matches subjects area by area, holding only the map tiles the "
+             "current subjects can reach and dropping them once matched. Uses "
+             "less memory for statewide rolls; runs in one process without "
+             "the subject comps cache.",
+    )
+
 # ---------- Build rule_sets for cascading ----------
 
-rule_sets = [
-    {
-        "name": "Static_7mi",
-        "max_radius_miles": 7.0,
-        "max_gap_pct_main": MAIN_BAND,
-        "max_gap_pct_value": 0.50,
-        "max_gap_pct_size": 0.50,
-    },
-    {
-        "name": "Static_15mi",
-        "max_radius_miles": 15.0,
-        "max_gap_pct_main": MAIN_BAND,
-        "max_gap_pct_value": 0.50,
-        "max_gap_pct_size": 0.50,
-    },    
-    {
-        "name": "Category 1",
-        "max_radius_miles": 10.0,
-        "max_gap_pct_main": MAIN_BAND,
-        "max_gap_pct_value": 0.80,
-        "max_gap_pct_size": 0.80,
-    },
-    {
-        "name": "Category 2",
-        "max_radius_miles": 15.0,
-        "max_gap_pct_main": MAIN_BAND,
-        "max_gap_pct_value": 1.20,
-        "max_gap_pct_size": 1.20,
-    },
-    {
-        "name": "Category 3",
-        "max_radius_miles": 15.0,
-        "max_gap_pct_main": MAIN_BAND,
-        "max_gap_pct_value": 1.50,
-        "max_gap_pct_size": 1.50,
-    },
-]
+rule_sets = RULE_SETS
 
 # ---------- INSTRUCTION / RULES BOX ----------
 st.markdown(
@@ -838,7 +589,7 @@ st.markdown(
         <li>Set <b>Max Comps per Subject</b> and, if needed, enable
             <b>Overpaid Analysis</b> in the sidebar.
         </li>
-        <li>Prepare two Excel files:
+        <li>Prepare two files (Excel .xlsx, CSV or Parquet):
             <span style="font-size:12px;">
               <b>Subject file</b> = properties you want comps for,
               <b>Data Source file</b> = large pool of potential comps.
@@ -847,20 +598,29 @@ st.markdown(
               <b>VPR or VPU</b>, and <b>Rooms / Units / GBA</b>.
             </span>
         </li>
-        <li>In <b>Step 1: Upload Files</b>, upload the Subject Excel on the left
-            and the Data Source Excel on the right, then click
-            <b>🚀 Run Matching</b>.
+        <li>In <b>Step 1: Upload Files</b>, upload the Subject file on the left
+            and the Data Source file on the right, then click
+            <b>🚀 Run Matching</b>. Matching runs in the background with a
+            progress bar, time estimate and <b>⏹️ Cancel Matching</b> button;
+            changing settings meanwhile doesn't stop it.
         </li>
         <li>Check the <b>Diagnostics / Hints</b> section for missing columns,
             null values, or dropped rows.
         </li>
         <li>Scroll down to review the preview table and click
-            <b>📥 Download Results (Excel)</b> to save the full output.
+            <b>📥 Download Results</b> to save the full output
+            (Excel, CSV or Parquet, chosen under <b>Results File</b> in the sidebar).
         </li>
       </ol>
       <div style="margin-top:8px; font-size:12px; color:#666;">
         💡 <b>Tips</b>:
         Include latitude/longitude to enable distance‑based matching.<br>
+        Matching often against the same large roll? Upload it once and click
+        <b>📥 Import Uploaded Data Source</b>, then tick it under
+        <b>Data Source Store</b>: runs read only the rows near the subjects.<br>
+        Rolls mixing property types? Tick <b>Batch: every property type</b>: both files
+        are read once and split on their <b>Property Type</b> column, with a results
+        sheet per type.<br>
         Cascading Matching first uses 7‑mile Static comps, then extends to 15 miles
         and Dynamic categories to fill any missing comps.
       </div>
@@ -874,299 +634,378 @@ st.markdown("### Step 1: Upload Files")
 col1, col2 = st.columns(2)
 
 with col1:
-    st.info("Upload Subject Excel")
-    subj_file = st.file_uploader("Subject File (.xlsx)", type=["xlsx"], key="subj_file")
+    st.info("Upload Subject File")
+    subj_file = st.file_uploader(
+        "Subject File (.xlsx, .csv, .parquet)", type=["xlsx", "csv", "parquet"], key="subj_file"
+    )
 
 with col2:
-    st.info("Upload Data Source Excel")
-    src_file = st.file_uploader("Data Source File (.xlsx)", type=["xlsx"], key="src_file")
+    if src_store is not None:
+        st.info(f"Data Source: imported store {src_store.name}")
+        st.caption(
+            f"{src_store.info()['rows']:,} {src_store.info()['prop_type']} rows from "
+            f"{src_store.info()['source'] or 'an uploaded file'}. Untick the store in the sidebar to upload a file."
+        )
+        src_file = None
+    else:
+        st.info("Upload Data Source File")
+        src_file = st.file_uploader(
+            "Data Source File (.xlsx, .csv, .parquet)", type=["xlsx", "csv", "parquet"], key="src_file"
+        )
 
-# ---------- PROCESS ----------
+# ---------- BACKGROUND MATCHING JOBS ----------
+
+
+@st.cache_resource
+def job_runner():
+    # One runner per server process: a job keeps going across reruns and page
+    # reloads, and finished results stay in its store for download.
+    return JobRunner(JobStore())
+
+
+def detached_upload(upload):
+    """In-memory copy of an upload for a job to read after this script run ends."""
+    data = io.BytesIO(upload.getvalue())
+    data.name = upload.name
+    return data
+
+
+JOB_PHASES = {
+    "read": "Reading the input files…",
+    "store": "Reading matchable rows from the store…",
+    "import": "Importing the Data Source…",
+    "validate": "Checking required columns…",
+    "match": "Scanning the Data Source…",
+}
+
+
+@st.fragment(run_every=1.0)
+def show_job_status(job_id):
+    """Progress card for a queued/running job, refreshed every second; reruns the page when it ends."""
+    job = job_runner().store.get(job_id)
+    if job is None or job["status"] in FINISHED:
+        st.rerun()
+
+    phase = JOB_PHASES.get(job["phase"], "Waiting for an earlier run to finish…")
+    body = "Started"
+    if job["phase"] == "match" and job["total"]:
+        body = f"Candidates found for <strong>{job['done']} of {job['total']}</strong> subjects"
+    elif job["phase"] == "import" and job["total"]:
+        body = f"Wrote <strong>{job['done']:,} of {job['total']:,}</strong> rows"
+    elif job["phase"] == "store" and job["total"]:
+        body = f"Ran <strong>{job['done']} of {job['total']}</strong> area queries"
+    eta = job_eta(job)
+    if eta is not None:
+        body += f" · about {int(eta // 60)}m {int(eta % 60):02d}s left"
+    st.markdown(
+        f"""
+        <div class="status-card">
+          <div class="status-title">
+            <span class="status-pill">{job["status"].upper()}</span>
+            {phase}
+          </div>
+          <div class="status-body">{body}</div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    st.progress(job["done"] / job["total"] if job["total"] else 0.0)
+    if st.button("⏹️ Cancel Import" if job["kind"] == "import" else "⏹️ Cancel Matching", key=f"cancel_{job_id}"):
+        job_runner().cancel(job_id)
+        st.rerun()
+
+
+def show_diagnostics(report, expanded=False, title="Diagnostics / Hints"):
+    """The validate_frames() report of a finished run."""
+    with st.expander(title, expanded=expanded):
+        if report["missing_subj_cols"]:
+            st.error(f"Subject file is missing required columns: {report['missing_subj_cols']}")
+        if report["missing_src_cols"]:
+            st.error(f"Data Source file is missing required columns: {report['missing_src_cols']}")
+        if report["missing_subj_cols"] or report["missing_src_cols"]:
+            return
+
+        st.write("### Null / invalid counts in required columns (Subject)")
+        for c, n in report["subj_nulls"].items():
+            st.write(f"- {c}: {n} nulls")
+
+        st.write("### Null / invalid counts in required columns (Source)")
+        for c, n in report["src_nulls"].items():
+            st.write(f"- {c}: {n} nulls")
+
+        st.write(f"Subject rows before filter: {report['subj_before']}, after filter: {report['subj_after']}")
+        st.write(f"Source rows before filter: {report['src_before']}, after filter: {report['src_after']}")
+
+        if report["subj_after"] == 0:
+            st.error(
+                "All subject rows were dropped because at least one required column "
+                "is null or invalid on every row. Check the null counts above and fix "
+                "those columns in Excel."
+            )
 
-if subj_file is not None and src_file is not None:
-    if st.button("🚀 Run Matching", type="primary"):
-        with st.spinner("Processing..."):
-            try:
-                subj = pd.read_excel(subj_file)
-                src = pd.read_excel(src_file)
-
-                subj.columns = subj.columns.str.strip()
-                src.columns = src.columns.str.strip()
-
-                desc_col = "description"
-                
-                if desc_col in subj.columns and desc_col in src.columns and prop_type != "Hotel":
-                    subj["_desc_norm"] = subj[desc_col].apply(norm_desc)
-                    src["_desc_norm"]  = src[desc_col].apply(norm_desc)
-                    
-                for df in (subj, src):
-                    if "Property Account No" in df.columns:
-                        df["Property Account No"] = (
-                            df["Property Account No"]
-                            .astype(str)
-                            .str.strip()
-                        )
-                    elif "Concat" in df.columns:
-                        df["Property Account No"] = (
-                            df["Concat"].astype(str).str.extract(r"(\d+)", expand=False)
-                        )
-
-                    if "Hotel class values" in df.columns:
-                        df["Class_Num"] = df["Hotel class values"].apply(norm_class)
-                    elif "Class" in df.columns:
-                        df["Class_Num"] = df["Class"].apply(norm_class)
-                    else:
-                        df["Class_Num"] = np.nan
-
-                    for c in ["Property Zip Code", "Rooms", "Units", "GBA", "VPR", "VPU",
-                              "Market Value-2023", "Total Market value-2023", "lat", "lon"]:
-                        if c in df.columns:
-                            df[c] = pd.to_numeric(df[c], errors="coerce")
-
-                    if "lon" in df.columns:
-                        df["lon"] = df["lon"].apply(
-                            lambda x: -abs(x) if pd.notna(x) else x
-                        )
-
-                if is_hotel:
-                    required_cols = ["Property Zip Code", "Class_Num", "VPR", "Rooms"]
-                else:
-                    if prop_type == "Apartment":
-                        required_cols = ["Property Zip Code", "VPU", "Units"]
-                    else:
-                        required_cols = ["Property Zip Code", "VPU", "GBA"]
-
-                st.subheader("Diagnostics / Hints")
-
-                missing_subj_cols = [c for c in required_cols if c not in subj.columns]
-                missing_src_cols = [c for c in required_cols if c not in src.columns]
-
-                if missing_subj_cols:
-                    st.error(f"Subject file is missing required columns: {missing_subj_cols}")
-                if missing_src_cols:
-                    st.error(f"Data Source file is missing required columns: {missing_src_cols}")
-
-                if missing_subj_cols or missing_src_cols:
-                    st.stop()
-
-                before_subj = len(subj)
-                before_src = len(src)
-
-                st.write("### Null / invalid counts in required columns (Subject)")
-                for c in required_cols:
-                    if c in subj.columns:
-                        st.write(f"- {c}: {subj[c].isna().sum()} nulls")
-
-                st.write("### Null / invalid counts in required columns (Source)")
-                for c in required_cols:
-                    if c in src.columns:
-                        st.write(f"- {c}: {src[c].isna().sum()} nulls")
-
-                subj_valid = subj.dropna(subset=[c for c in required_cols if c in subj.columns])
-                src_valid = src.dropna(subset=[c for c in required_cols if c in src.columns])
-
-                st.write(f"Subject rows before filter: {before_subj}, after filter: {len(subj_valid)}")
-                st.write(f"Source rows before filter: {before_src}, after filter: {len(src_valid)}")
-
-                if len(subj_valid) == 0:
-                    st.error(
-                        "All subject rows were dropped because at least one required column "
-                        "is null or invalid on every row. Check the null counts above and fix "
-                        "those columns in Excel."
-                    )
-
-                subj = subj_valid
-                src = src_valid
-
-                if len(subj) == 0 or len(src) == 0:
-                    st.stop()
-
-                if is_hotel:
-                    OUTPUT_COLS = OUTPUT_COLS_HOTEL
-                    metric_field = "VPR"
-                else:
-                    OUTPUT_COLS = OUTPUT_COLS_OTHER
-                    metric_field = "VPU"
-
-                results = []
-                total_subj = len(subj)
-                prog_bar = st.progress(0)
-                status_text = st.empty()
-
-                for i, (_, srow) in enumerate(subj.iterrows()):
-
-                    status_text.markdown(
-                        f"""
-                        <div class="status-card">
-                          <div class="status-title">
-                            <span class="status-pill">RUNNING</span>
-                            Matching subjects in the background…
-                          </div>
-                          <div class="status-body">
-                            Processing subject <strong>{i+1} of {total_subj}</strong><br>
-                            Account: <strong>{srow.get('Property Account No', 'N/A')}</strong>
-                          </div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
-
-                    src_candidates = src
-
-                    types_with_desc_rule = ("Retail", "Warehouse")  # adjust as needed
-
-                    if (
-                        prop_type in types_with_desc_rule
-                        and "_desc_norm" in subj.columns
-                        and "_desc_norm" in src.columns
-                    ):
-                        subj_desc = srow.get("_desc_norm", "")
-                        if subj_desc:
-                            src_candidates = src_candidates[src_candidates["_desc_norm"] == subj_desc]
-                        else:
-                            src_candidates = src_candidates.iloc[0:0]
-
-
-                    if use_cascading:
-                        comps = find_comps_cascading(
-                            srow,
-                            src_candidates,
-                            is_hotel=is_hotel,
-                            use_hotel_class_rule=use_hotel_class_rule,
-                            max_comps=max_comps,
-                            rule_sets=rule_sets,
-                        )
-                    else:
-                        comps = find_comps(
-                            srow,
-                            src_candidates,
-                            is_hotel=is_hotel,
-                            use_hotel_class_rule=use_hotel_class_rule,
-                            max_radius_miles=max_radius,
-                            max_gap_pct_main=max_gap_pct_main,
-                            max_gap_pct_value=max_gap_pct_value,
-                            max_gap_pct_size=max_gap_pct_size,
-                            max_comps=max_comps,
-                        )
-
-                    row = {}
-                    for c in OUTPUT_COLS:
-                        row[f"Subject_{c}"] = get_val(srow, c)
-
-                    for k in range(max_comps):
-                        prefix = f"Comp{k+1}"
-                        if k < len(comps):
-                            crow = comps[k]
-                            for c in OUTPUT_COLS:
-                                row[f"{prefix}_{c}"] = get_val(crow, c)
-                            row[f"{prefix}_Match_Method"] = crow.get("Match_Method", "N/A")
-                            row[f"{prefix}_Rule_Set"] = crow.get("Rule_Set", rule_mode)
-                            d = crow.get("Distance_Calc", "N/A")
-                            row[f"{prefix}_Distance_Miles"] = (
-                                f"{d:.2f}" if isinstance(d, (int, float)) else d
-                            )
-                            diff = crow.get(f"{metric_field}_Diff", "")
-                            row[f"{prefix}_{metric_field}_Gap"] = (
-                                f"{diff:.2f}" if isinstance(diff, (int, float)) else diff
-                            )
-                        else:
-                            for c in OUTPUT_COLS:
-                                row[f"{prefix}_{c}"] = ""
-                            row[f"{prefix}_Match_Method"] = ""
-                            row[f"{prefix}_Rule_Set"] = ""
-                            row[f"{prefix}_Distance_Miles"] = ""
-                            row[f"{prefix}_{metric_field}_Gap"] = ""
-
-                    # --- Overpaid calculation (optional) ---
-                    if use_overpaid:
-                        comp_metrics = []
-                        for k2 in range(max_comps):
-                            p2 = f"Comp{k2+1}"
-                            col_name = f"{p2}_{metric_field}"
-                            val = row.get(col_name, None)
-                            if val not in (None, "", "N/A"):
-                                try:
-                                    comp_metrics.append(float(val))
-                                except Exception:
-                                    pass
-
-                        if len(comp_metrics) > 0:
-                            median_metric = float(pd.Series(comp_metrics).median())
-
-                            if overpaid_base_dim:
-                                if overpaid_base_dim == "Rooms":
-                                    subj_dim = srow.get("Rooms", 0)
-                                elif overpaid_base_dim == "Units":
-                                    subj_dim = srow.get("Units", 0)
-                                else:
-                                    subj_dim = srow.get("GBA", 0)
-                            else:
-                                subj_dim = 0
-
-                            try:
-                                subj_dim = float(subj_dim)
-                            except Exception:
-                                subj_dim = 0.0
-
-                            step2_val = median_metric * subj_dim
-                            step3_val = step2_val * overpaid_pct
-
-                            if is_hotel:
-                                subj_mv = srow.get("Market Value-2023", 0)
-                            else:
-                                subj_mv = srow.get("Total Market value-2023", 0)
-                            try:
-                                subj_mv = float(subj_mv)
-                            except Exception:
-                                subj_mv = 0.0
-                            step4_val = subj_mv * overpaid_pct
-
-                            overpaid_val = step4_val - step3_val
-                        else:
-                            overpaid_val = ""
-
-                        row["Subject_Overpaid_Value"] = overpaid_val
-                    else:
-                        row["Subject_Overpaid_Value"] = ""
-
-                    results.append(row)
-                    prog_bar.progress((i + 1) / total_subj)
-
-                status_text.markdown(
-                    """
-                    <div class="status-card">
-                      <div class="status-title">
-                        <span class="status-pill" style="background:#0b7a3a;">DONE</span>
-                        Matching complete
-                      </div>
-                      <div class="status-body">
-                        ✅ All subjects processed. Scroll down to review the preview table or download the full Excel results.
-                      </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
 
-                df_final = pd.DataFrame(results)
+def show_performance(timer):
+    """Stage timings, cProfile report and trace download for a run plus its latest results file."""
+    with st.expander("⏱️ Performance", expanded=False):
+        st.caption(
+            f"Wall time {timer.elapsed:.2f}s (matching run plus the latest results file). "
+            "Nested stages (e.g. match.scan inside match) are included in their parent's time."
+        )
+        perf = pd.DataFrame(timer.summary())
+        if not perf.empty:
+            perf["share"] = (perf["share"] * 100).round(1).astype(str) + "%"
+        st.dataframe(perf)
+        profile_report = timer.profile_text()
+        if profile_report:
+            st.code(profile_report)
+        st.download_button(
+            label="📥 Download Timing Trace (JSON)",
+            data=json.dumps(timer.trace(), indent=1),
+            file_name="comps_timing_trace.json",
+            mime="application/json",
+        )
+
+
+def show_batch_results(last_match):
+    """Diagnostics per property type, previews and the workbook download of a finished batch run."""
+    skipped = last_match["skipped"]
+    if skipped["subj"] or skipped["src"]:
+        st.warning(
+            f"Skipped {skipped['subj']} subject and {skipped['src']} source rows whose "
+            f"{type_col} isn't one of {', '.join(PROPERTY_TYPES)}."
+        )
+    batch = last_match["batch"]
+    for ptype, part in batch.items():
+        show_diagnostics(part["report"], expanded=part["comp_table"] is None, title=f"Diagnostics / Hints: {ptype}")
+    matched = {ptype: part for ptype, part in batch.items() if part["comp_table"] is not None}
+    if not matched:
+        st.error("Nothing to match for any property type; check the diagnostics above.")
+        return
+
+    output_key = (use_overpaid, overpaid_pct)
+    if last_match["output"] is None or last_match["output"][0] != output_key:
+        output_timer = StageTimer(profile=capture_profile)
+        sheets = (
+            (ptype, iter_result_frames(
+                part["subj"],
+                part["src"],
+                prop_type=ptype,
+                use_cascading=use_cascading,
+                max_comps=max_comps,
+                rule_mode=rule_mode,
+                category=category,
+                rule_sets=rule_sets,
+                use_overpaid=use_overpaid,
+                overpaid_base_dim=default_overpaid_base(ptype),
+                overpaid_pct=overpaid_pct,
+                comp_table=part["comp_table"],
+            ))
+            for ptype, part in matched.items()
+        )
+        buffer = io.BytesIO()
+        with output_timer.activate():
+            previews = write_results_workbook(sheets, buffer)
+        last_match["output"] = (output_key, previews, buffer.getvalue(), output_timer)
+    _, previews, result_file, output_timer = last_match["output"]
+
+    subjects = sum(len(part["subj"]) for part in matched.values())
+    st.success(f"✅ Done! Processed {subjects} subjects of {len(matched)} property types.")
+    for ptype, preview in previews.items():
+        st.markdown(f"**{ptype}**: {len(matched[ptype]['subj'])} subjects")
+        st.dataframe(preview)
+
+    label, mime = OUTPUT_FORMATS["xlsx"]
+    st.download_button(
+        label=f"📥 Download Results ({label}, a sheet per property type)",
+        data=result_file,
+        file_name="Automated_Comps_Results.xlsx",
+        mime=mime,
+    )
+    show_performance(combined([last_match["timer"], output_timer]))
+
+
+# ---------- IMPORT ----------
+
+if not batch_mode and src_file is not None and st.sidebar.button("📥 Import Uploaded Data Source"):
+    st.session_state["import_job"] = job_runner().submit(
+        "import",
+        import_job,
+        detached_upload(src_file),
+        label=f"{src_file.name} ({prop_type})",
+        prop_type=prop_type,
+        path=store_path(f"{prop_type} - {os.path.splitext(src_file.name)[0]}"),
+    )
+
+import_job_record = job_runner().store.get(st.session_state.get("import_job"))
+if import_job_record is not None:
+    with st.sidebar:
+        if import_job_record["status"] not in FINISHED:
+            show_job_status(import_job_record["id"])
+        elif import_job_record["status"] == "failed":
+            st.error(f"Import failed: {import_job_record['error']}")
+        elif import_job_record["status"] == "done":
+            st.success(f"Imported {import_job_record['label']}; tick the store above to match against it.")
 
-                st.success(f"✅ Done! Processed {total_subj} subjects.")
-                st.dataframe(df_final.head())
+# ---------- PROCESS ----------
 
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-                    df_final.to_excel(writer, index=False)
+if subj_file is not None and (src_file is not None or src_store is not None):
+    # Results stay on screen across reruns while the inputs and matching
+    # settings are unchanged; output-only settings (overpaid analysis, file
+    # format) just rebuild the results file from the stored comps.
+    if src_store is not None:
+        src_key = f"store:{src_store.path}:{src_store.info()['imported']}"
+        src_label = src_store.name
+    else:
+        src_key = file_digest(src_file)
+        src_label = src_file.name
+    match_key = (
+        file_digest(subj_file), src_key,
+        f"batch:{type_col}" if batch_mode else prop_type,
+        use_cascading, max_comps, rule_mode, category, selection,
+    )
+    job_key = json.dumps(match_key)
+    run_clicked = st.button("🚀 Run Matching", type="primary")
+    if run_clicked and batch_mode:
+        st.session_state["match_job"] = job_runner().submit(
+            "match",
+            batch_job,
+            detached_upload(subj_file),
+            detached_upload(src_file),
+            key=job_key,
+            label=f"{subj_file.name} / {src_label} (every property type)",
+            type_col=type_col,
+            use_cascading=use_cascading,
+            max_comps=max_comps,
+            rule_mode=rule_mode,
+            category=category,
+            rule_sets=rule_sets,
+            selection=selection,
+            workers=int(n_workers) if use_parallel else 1,
+            pool_cache=pool_cache if use_pool_cache else None,
+            comp_cache=comp_cache if use_comp_cache else None,
+            profile=capture_profile,
+        )
+    elif run_clicked:
+        st.session_state["match_job"] = job_runner().submit(
+            "match",
+            match_job,
+            detached_upload(subj_file),
+            None if src_file is None else detached_upload(src_file),
+            key=job_key,
+            label=f"{subj_file.name} / {src_label} ({prop_type})",
+            prop_type=prop_type,
+            use_cascading=use_cascading,
+            max_comps=max_comps,
+            rule_mode=rule_mode,
+            category=category,
+            rule_sets=rule_sets,
+            selection=selection,
+            workers=int(n_workers) if use_parallel else 1,
+            pool_cache=pool_cache if use_pool_cache else None,
+            comp_cache=comp_cache if use_comp_cache else None,
+            profile=capture_profile,
+            src_store=None if src_store is None else src_store.path,
+            store_shards=store_shards,
+        )
 
-                st.download_button(
-                    label="📥 Download Results (Excel)",
-                    data=buffer.getvalue(),
-                    file_name="Automated_Comps_Results.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    # This session's latest run while it's active or if it was for these inputs
+    # and settings, else the newest finished one for them (e.g. from before the
+    # page was reloaded).
+    job = job_runner().store.get(st.session_state.get("match_job"))
+    if job is None or (job["key"] != job_key and job["status"] in FINISHED):
+        job = next((j for j in job_runner().store.jobs("match", job_key) if j["status"] == "done"), None)
+
+    if job is not None and job["status"] not in FINISHED:
+        show_job_status(job["id"])
+    elif job is not None and job["status"] == "failed":
+        st.error(f"An error occurred: {job['error']}")
+    elif job is not None and job["status"] == "cancelled":
+        st.warning("Matching was cancelled.")
+
+    last_match = st.session_state.get("last_match")
+    if job is None or job["status"] != "done":
+        last_match = None
+    elif last_match is None or last_match["job"] != job["id"]:
+        result = job_runner().store.result(job["id"])
+        last_match = None if result is None else dict(result, job=job["id"], output=None)
+        st.session_state["last_match"] = last_match
+        if result is None:
+            st.info("The results of that run are no longer stored; click 🚀 Run Matching again.")
+
+    if last_match is not None and "batch" in last_match:
+        try:
+            show_batch_results(last_match)
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
+    elif last_match is not None:
+        show_diagnostics(last_match["report"], expanded=last_match["comp_table"] is None)
+
+    if last_match is not None and last_match.get("comp_table") is not None:
+        try:
+            output_key = (use_overpaid, overpaid_base_dim, overpaid_pct, output_fmt)
+            if last_match["output"] is None or last_match["output"][0] != output_key:
+                total_subj = len(last_match["subj"])
+                write_bar = st.progress(0)
+
+                def show_subject_progress(i, srow):
+                    write_bar.progress((i + 1) / total_subj)
+
+                output_timer = StageTimer(profile=capture_profile)
+                frames = iter_result_frames(
+                    last_match["subj"],
+                    last_match["src"],
+                    prop_type=prop_type,
+                    use_cascading=use_cascading,
+                    max_comps=max_comps,
+                    rule_mode=rule_mode,
+                    category=category,
+                    rule_sets=rule_sets,
+                    use_overpaid=use_overpaid,
+                    overpaid_base_dim=overpaid_base_dim,
+                    overpaid_pct=overpaid_pct,
+                    subject_progress=show_subject_progress,
+                    comp_table=last_match["comp_table"],
+                )
+                with output_timer.activate():
+                    preview, result_file = write_results_file(frames, output_fmt)
+                write_bar.progress(1.0)
+                last_match["output"] = (output_key, preview, result_file, output_timer)
+            _, preview, result_file, output_timer = last_match["output"]
+
+            st.success(f"✅ Done! Processed {len(last_match['subj'])} subjects.")
+            comp_table = last_match["comp_table"]
+            reused = comp_table.attrs.get("cached_subjects", 0)
+            if reused:
+                st.write(
+                    f"Reused cached comps for {reused} of {len(last_match['subj'])} subjects; "
+                    f"matched {len(last_match['subj']) - reused}."
                 )
+            if comp_table.attrs.get("shards_loaded"):
+                st.write(
+                    f"Loaded {comp_table.attrs['shards_loaded']} tiles of the store, holding at most "
+                    f"{comp_table.attrs['peak_pool_rows']:,} rows at once."
+                )
+            shared = comp_table.attrs.get("shared_subjects", 0)
+            if shared:
+                st.write(
+                    f"{shared} subjects duplicated another subject's matching fields "
+                    f"and shared its comps."
+                )
+            st.dataframe(preview)
+
+            label, mime = OUTPUT_FORMATS[output_fmt]
+            st.download_button(
+                label=f"📥 Download Results ({label})",
+                data=result_file,
+                file_name=f"Automated_Comps_Results.{output_fmt}",
+                mime=mime,
+            )
 
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
+            show_performance(combined([last_match["timer"], output_timer]))
+        except Exception as e:
+            st.error(f"An error occurred: {e}")
 else:
-    st.info("Please upload both Subject and Data Source Excel files to begin.")
+    st.info("Please upload both Subject and Data Source files to begin.")
 
 
 
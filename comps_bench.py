@@ -0,0 +1,348 @@
+"""Matching benchmarks on synthetic county rolls.
+
+Generates subject/source frames shaped like real uploads (clustered
+coordinates, class mixes, null cells), times each pipeline stage at several
+Data Source sizes and writes the timings as JSON so runs can be compared.
+
+Example:
+    python comps_bench.py --sizes 1000,10000,100000 --prop-type Hotel -o bench.json
+    python comps_bench.py --sizes 1000,10000 --compare bench.json
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from comps_engine import (
+    PROPERTY_TYPES,
+    compact_pool,
+    default_overpaid_base,
+    iter_result_frames,
+    match_results,
+    normalize_frame,
+    read_table,
+    required_columns,
+    validate_frames,
+)
+from comps_output import write_results_file
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+XLSX_MAX_ROWS = 100_000  # larger rolls are benchmarked as CSV/Parquet only
+
+# (city, lat, lon): metro areas the generated properties cluster around.
+METROS = [
+    ("Houston", 29.76, -95.37),
+    ("Dallas", 32.78, -96.80),
+    ("Austin", 30.27, -97.74),
+    ("San Antonio", 29.42, -98.49),
+    ("Fort Worth", 32.76, -97.33),
+    ("El Paso", 31.76, -106.49),
+]
+# Hotel class 1 (economy) .. 8 (luxury); most hotels sit in the middle.
+HOTEL_CLASS_WEIGHTS = [0.08, 0.16, 0.22, 0.20, 0.14, 0.10, 0.07, 0.03]
+DESCRIPTIONS = {
+    "Retail": ["Retail Store", "Strip Center", "Shopping Center", "Restaurant", "Auto Service"],
+    "Warehouse": ["Warehouse", "Distribution Center", "Mini Storage", "Light Industrial"],
+    "Office": ["Office", "Medical Office", "Office Low Rise"],
+    "Apartment": ["Apartment", "Garden Apartment", "Mid Rise Apartment"],
+    "Hotel": ["Hotel", "Motel", "Extended Stay"],
+}
+OWNERS = [
+    "Lone Star Hospitality LLC", "Gulf Coast Holdings", "Blue Bonnet Partners LP",
+    "Red Oak Investments", "Sunbelt Realty Trust", "Pecan Grove Properties",
+    "Trinity Capital Group", "Brazos Ventures Inc", "Alamo Asset Mgmt", "Frontier Equity",
+]
+STREETS = ["Main St", "Westheimer Rd", "Commerce St", "Lamar Blvd", "Broadway", "Mesa St", "Elm St"]
+
+
+def make_roll(n, prop_type, *, seed=0, null_rate=0.02, account_start=100000):
+    """A raw county roll of `n` properties, with the columns the app reads for prop_type.
+
+    Coordinates cluster around METROS, values are lognormal and consistent with
+    the size column, and each numeric/text cell is blank with probability
+    `null_rate` (coordinates at half that rate).
+    """
+    rng = np.random.default_rng(seed)
+    is_hotel = prop_type == "Hotel"
+
+    metro = rng.integers(0, len(METROS), n)
+    metro_lat = np.array([m[1] for m in METROS])[metro]
+    metro_lon = np.array([m[2] for m in METROS])[metro]
+    # A few tight sub-market clusters per metro plus some spread.
+    spread = np.where(rng.random(n) < 0.7, 0.05, 0.20)
+    lat = metro_lat + rng.normal(0, 1, n) * spread + rng.integers(-2, 3, n) * 0.08
+    lon = metro_lon + rng.normal(0, 1, n) * spread + rng.integers(-2, 3, n) * 0.08
+
+    if is_hotel:
+        hotel_class = rng.choice(np.arange(1, 9), n, p=HOTEL_CLASS_WEIGHTS)
+        size = rng.integers(20, 120, n) * (1 + hotel_class // 3)
+        per_unit = rng.lognormal(np.log(15_000) + 0.35 * hotel_class, 0.35)
+    elif prop_type == "Apartment":
+        size = rng.integers(8, 600, n)
+        per_unit = rng.lognormal(np.log(65_000), 0.4, n)
+    else:
+        size = np.round(rng.lognormal(np.log(20_000), 0.9, n), -2) + 1_000
+        per_unit = rng.lognormal(np.log(95), 0.45, n)
+    market_value = np.round(size * per_unit, -3)
+    assessed = np.round(market_value * rng.uniform(0.7, 1.0, n), -3)
+
+    street_no = rng.integers(100, 9999, n)
+    street = np.array(STREETS)[rng.integers(0, len(STREETS), n)]
+    owner = np.array(OWNERS)[rng.integers(0, len(OWNERS), n)]
+    city = np.array([m[0] for m in METROS])[metro]
+    df = pd.DataFrame({
+        "Property Account No": [f"{account_start + i:010d}" for i in range(n)],
+        "Property Address": [f"{a} {s}" for a, s in zip(street_no, street)],
+        "Property City": city,
+        "Property County": city + " County",
+        "Property State": "TX",
+        "Property Zip Code": 75000 + metro * 700 + rng.integers(0, 100, n),
+        "Assessed Value-2023": assessed,
+        "description": np.array(DESCRIPTIONS[prop_type])[rng.integers(0, len(DESCRIPTIONS[prop_type]), n)],
+        "Owner Name/ LLC Name": owner,
+        "Owner Street Address": [f"PO Box {b}" for b in rng.integers(1, 5000, n)],
+        "Owner City": city,
+        "Owner State": "TX",
+        "Owner ZIP": 75000 + rng.integers(0, 5000, n),
+        "lat": lat,
+        "lon": lon,
+    })
+    if is_hotel:
+        df["Hotel Name"] = [f"{c} Inn #{i}" for c, i in zip(city, rng.integers(1, 400, n))]
+        df["Rooms"] = size
+        df["VPR"] = np.round(market_value / size, 2)
+        df["Market Value-2023"] = market_value
+        df["Hotel class values"] = hotel_class
+        df["Contact Person"] = ""
+        df["Designation"] = ""
+    else:
+        df["GBA" if prop_type != "Apartment" else "Units"] = size
+        if prop_type == "Apartment":
+            df["GBA"] = size * rng.integers(700, 1100, n)
+        df["VPU"] = np.round(market_value / size, 2)
+        df["Total Market value-2023"] = market_value
+        df["Class"] = rng.integers(1, 6, n)
+
+    blankable = [c for c in df.columns if c not in ("Property Account No", "lat", "lon")]
+    for col in blankable:
+        blank = rng.random(n) < null_rate
+        if blank.any():
+            df[col] = df[col].astype(object)
+            df.loc[blank, col] = np.nan
+    blank = rng.random(n) < null_rate / 2
+    df.loc[blank, ["lat", "lon"]] = np.nan
+    return df
+
+
+def make_subjects(src, n, *, seed=1):
+    """`n` subjects drawn from a roll (as an appeal list would be), with fresh account numbers."""
+    rng = np.random.default_rng(seed)
+    subj = src.iloc[rng.integers(0, len(src), n)].reset_index(drop=True).copy()
+    subj["Property Account No"] = [f"S{i:09d}" for i in range(n)]
+    return subj
+
+
+def timed(fn, repeat=1):
+    """(best seconds, last result) over `repeat` calls."""
+    best, result = math.inf, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def bench_size(prop_type, n_src, *, n_subj, max_comps, null_rate, ingest_formats, repeat, workdir, seed):
+    """Time every stage for one Data Source size; returns result records."""
+    raw_src = make_roll(n_src, prop_type, seed=seed, null_rate=null_rate)
+    raw_subj = make_subjects(raw_src, n_subj, seed=seed + 1)
+    records = []
+
+    def record(stage, seconds, items, unit, **extra):
+        records.append(dict(
+            prop_type=prop_type, source_rows=n_src, subject_rows=n_subj, stage=stage,
+            seconds=round(seconds, 6), items=items, unit=unit,
+            per_second=round(items / seconds, 3) if seconds > 0 else None, **extra,
+        ))
+
+    for fmt in ingest_formats:
+        if fmt == "xlsx" and n_src > XLSX_MAX_ROWS:
+            continue
+        path = os.path.join(workdir, f"roll_{prop_type}_{n_src}.{fmt}")
+        if fmt == "xlsx":
+            raw_src.to_excel(path, index=False)
+        elif fmt == "csv":
+            raw_src.to_csv(path, index=False)
+        else:
+            raw_src.to_parquet(path)
+        seconds, _ = timed(lambda: normalize_frame(read_table(path), prop_type), repeat)
+        record("ingest", seconds, n_src, "source rows", format=fmt, file_bytes=os.path.getsize(path))
+        os.remove(path)
+
+    subj = normalize_frame(raw_subj.copy(), prop_type)
+    src = normalize_frame(raw_src.copy(), prop_type)
+    pool_bytes = int(src.memory_usage(deep=True).sum())
+    seconds, src = timed(lambda: compact_pool(src.copy()), repeat)
+    record(
+        "compact", seconds, n_src, "source rows",
+        bytes_before=pool_bytes, bytes_after=int(src.memory_usage(deep=True).sum()),
+    )
+    report = validate_frames(subj, src, required_columns(prop_type))
+    subj, src = report["subj"], report["src"]
+
+    options = dict(prop_type=prop_type, max_comps=max_comps)
+    seconds, single = timed(lambda: match_results(subj, src, use_cascading=False, **options), repeat)
+    record("match_single", seconds, len(subj), "subjects", comps=len(single))
+    seconds, comp_table = timed(lambda: match_results(subj, src, **options), repeat)
+    record("match", seconds, len(subj), "subjects", comps=len(comp_table))
+
+    assemble_opts = dict(
+        options, comp_table=comp_table,
+        use_overpaid=True, overpaid_base_dim=default_overpaid_base(prop_type), overpaid_pct=0.10,
+    )
+    seconds, results = timed(lambda: pd.concat(iter_result_frames(subj, src, **assemble_opts)), repeat)
+    record("assemble", seconds, len(subj), "subjects", columns=results.shape[1], cells=results.size)
+
+    seconds, (_, data) = timed(
+        lambda: write_results_file(iter_result_frames(subj, src, **assemble_opts), "xlsx"), repeat
+    )
+    record("excel_export", seconds, len(subj), "subjects", file_bytes=len(data))
+    return records
+
+
+def scaling(records):
+    """Per stage: seconds by source size and the log-log slope between consecutive sizes.
+
+    A slope near 1 is linear in the Data Source size, near 0 size-independent.
+    """
+    curves = {}
+    for rec in records:
+        key = rec["stage"] if "format" not in rec else f"{rec['stage']}:{rec['format']}"
+        key = f"{rec['prop_type']}/{key}"
+        curves.setdefault(key, []).append((rec["source_rows"], rec["seconds"]))
+    out = {}
+    for key, points in curves.items():
+        points.sort()
+        slopes = [
+            round(math.log(t2 / t1) / math.log(n2 / n1), 3)
+            for (n1, t1), (n2, t2) in zip(points, points[1:])
+            if t1 > 0 and t2 > 0 and n2 > n1
+        ]
+        out[key] = {"source_rows": [n for n, _ in points], "seconds": [t for _, t in points], "slopes": slopes}
+    return out
+
+
+def report_line(rec):
+    """One console line for a timing record (a stage too fast to time has no rate)."""
+    name = rec["stage"] if "format" not in rec else f"{rec['stage']} ({rec['format']})"
+    rate = "n/a" if rec["per_second"] is None else f"{rec['per_second']:,.1f}"
+    line = f"  {name:<22} {rec['seconds']:9.3f}s  {rate:>12} {rec['unit']}/s"
+    if "bytes_after" in rec:
+        line += f"  ({rec['bytes_before'] / 2**20:,.1f} -> {rec['bytes_after'] / 2**20:,.1f} MB)"
+    return line
+
+
+def record_key(rec):
+    return (rec["prop_type"], rec["source_rows"], rec["subject_rows"], rec["stage"], rec.get("format"))
+
+
+def compare(records, baseline):
+    """Lines of "stage: old -> new (ratio)" for records present in both runs."""
+    old = {record_key(rec): rec for rec in baseline["results"]}
+    lines = []
+    for rec in records:
+        prev = old.get(record_key(rec))
+        if prev is None or not prev["seconds"]:
+            continue
+        ratio = rec["seconds"] / prev["seconds"]
+        name = rec["stage"] if rec.get("format") is None else f"{rec['stage']} ({rec['format']})"
+        lines.append(
+            f"{rec['prop_type']:<10} {rec['source_rows']:>9,} {name:<22} "
+            f"{prev['seconds']:9.3f}s -> {rec['seconds']:9.3f}s  x{ratio:.2f}"
+        )
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark comp matching on synthetic county rolls.")
+    parser.add_argument(
+        "--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+        help="Comma-separated Data Source sizes (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--prop-type", action="append", choices=PROPERTY_TYPES, default=None,
+        help="Property type to benchmark; repeat for several (default: Hotel).",
+    )
+    parser.add_argument("--subjects", type=int, default=1000, help="Subject rows per run (default 1000).")
+    parser.add_argument("--max-comps", type=int, default=3)
+    parser.add_argument("--null-rate", type=float, default=0.02, help="Share of blank cells (default 0.02).")
+    parser.add_argument(
+        "--ingest-formats", default="xlsx,csv,parquet",
+        help=f"Input formats timed for ingestion; xlsx only up to {XLSX_MAX_ROWS:,} rows.",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the best time is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="comps_bench.json", help="JSON results file.")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against.")
+    return parser
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    prop_types = args.prop_type or ["Hotel"]
+    ingest_formats = [f.strip() for f in args.ingest_formats.split(",") if f.strip()]
+
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for prop_type in prop_types:
+            for n_src in sizes:
+                log(f"{prop_type}: {n_src:,} source rows x {args.subjects:,} subjects")
+                for rec in bench_size(
+                    prop_type, n_src,
+                    n_subj=args.subjects, max_comps=args.max_comps,
+                    null_rate=args.null_rate, ingest_formats=ingest_formats,
+                    repeat=args.repeat, workdir=workdir, seed=args.seed,
+                ):
+                    records.append(rec)
+                    log(report_line(rec))
+
+    result = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": records,
+        "scaling": scaling(records),
+    }
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=2)
+    log(f"Wrote {len(records)} timings → {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            for line in compare(records, json.load(fh)):
+                log(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
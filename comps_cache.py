@@ -0,0 +1,255 @@
+"""On-disk caches: parsed + normalized Data Source pools, and per-subject comps.
+
+Parsing a county roll workbook takes minutes; the normalized frame is stored
+as Parquet under a key built from the file's content hash and the
+normalization settings, so a repeat run against the same roll loads it
+straight back. Each subject's chosen comps are kept too (CompCache), so a
+rerun after editing a few subject rows only matches those rows. Entries are
+evicted least-recently-used once a cache grows past its size cap.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 3  # bump when comps_engine.normalize_frame() / compact_pool() output or comp selection changes
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "COMPS_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "comps_matcher"),
+)
+DEFAULT_MAX_BYTES = int(float(os.environ.get("COMPS_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+DEFAULT_COMP_CACHE_BYTES = int(float(os.environ.get("COMPS_COMP_CACHE_MAX_MB", 256)) * 1024 * 1024)
+
+
+def file_digest(file, chunk_size=1 << 20):
+    """sha256 of a path, bytes or file-like (e.g. a Streamlit upload); rewinds file-likes."""
+    h = hashlib.sha256()
+    if isinstance(file, (bytes, bytearray)):
+        h.update(file)
+    elif isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fh:
+            for block in iter(lambda: fh.read(chunk_size), b""):
+                h.update(block)
+    elif hasattr(file, "getvalue"):
+        h.update(file.getvalue())
+    else:
+        pos = file.tell()
+        for block in iter(lambda: file.read(chunk_size), b""):
+            h.update(block)
+        file.seek(pos)
+    return h.hexdigest()
+
+
+def frame_digest(df):
+    """sha256 of a DataFrame's column names, index and values, in row order.
+
+    Float columns are hashed as float64 with a single NaN, so the digest
+    follows the values: not the width compact_pool() narrowed them to, nor
+    the NaN bit pattern a reader produced (Parquet float16 nulls come back
+    as 0x7FFF, a fresh cast gives 0x7E00).
+    """
+    values = df
+    for i, dtype in enumerate(df.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind == "f":
+            if values is df:
+                values = df.copy(deep=False)
+            col = df.iloc[:, i].to_numpy(dtype=np.float64)
+            values.isetitem(i, np.where(np.isnan(col), np.nan, col))
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(values, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class PoolCache:
+    """Directory of cached frames with size-capped LRU eviction.
+
+    Frames are written as Parquet; a frame Parquet can't represent (e.g. an
+    Excel column mixing numbers and text) is pickled instead so values come
+    back unchanged.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, subdir="pools"):
+        self.root = os.path.join(root, subdir)
+        self.max_bytes = max_bytes
+
+    def key(self, digest, settings):
+        payload = json.dumps(
+            {"digest": digest, "settings": settings, "version": CACHE_VERSION},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, f"{key}.{ext}")
+
+    def get(self, key):
+        for ext, reader in (("parquet", pd.read_parquet), ("pkl", pd.read_pickle)):
+            path = self._path(key, ext)
+            if not os.path.exists(path):
+                continue
+            try:
+                df = reader(path)
+            except Exception:
+                os.remove(path)  # corrupt or from an incompatible version
+                return None
+            os.utime(path)  # mark as recently used
+            return df
+        return None
+
+    def put(self, key, df):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._path(key, "tmp")
+        try:
+            df.to_parquet(tmp)
+            ext = "parquet"
+        except Exception:
+            with open(tmp, "wb") as fh:
+                pickle.dump(df, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            ext = "pkl"
+        os.replace(tmp, self._path(key, ext))
+        self.evict()
+
+    def entries(self):
+        """(path, size, last_used) for every cached frame, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        out = []
+        for name in os.listdir(self.root):
+            if not name.endswith((".parquet", ".pkl")):
+                continue
+            path = os.path.join(self.root, name)
+            info = os.stat(path)
+            out.append((path, info.st_size, info.st_mtime))
+        return sorted(out, key=lambda e: e[2])
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Delete every cached frame; returns how many were removed."""
+        entries = self.entries()
+        for path, _, _ in entries:
+            os.remove(path)
+        return len(entries)
+
+
+class CompCache:
+    """Per-subject comp picks in one SQLite file, with size-capped LRU eviction.
+
+    Values are float64 arrays (one row per comp) stored as raw bytes; keys
+    are built by the caller from everything the picks depend on.
+    """
+
+    ENTRY_OVERHEAD = 64  # bytes per row besides the picks, for the size cap
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_COMP_CACHE_BYTES, name="comps.sqlite"):
+        self.path = os.path.join(root, name)
+        self.max_bytes = max_bytes
+
+    def key(self, settings):
+        """Digest of the run-wide part of a key (pool, property type, rules...)."""
+        payload = json.dumps({"settings": settings, "version": CACHE_VERSION}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @contextlib.contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS comps ("
+                "key TEXT PRIMARY KEY, picks BLOB NOT NULL, cols INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS comps_last_used ON comps (last_used)")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys, chunk=500):
+        """{key: picks array} for the keys present; marks them as recently used."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if not keys or not os.path.exists(self.path):
+            return found
+        with self._connect() as conn:
+            for start in range(0, len(keys), chunk):
+                part = keys[start:start + chunk]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, picks, cols FROM comps WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, picks, cols in rows:
+                    found[key] = np.frombuffer(picks, dtype=np.float64).reshape(-1, cols)
+                conn.execute(
+                    f"UPDATE comps SET last_used = ? WHERE key IN ({marks})", [time.time(), *part]
+                )
+        return found
+
+    def put_many(self, items):
+        """Store {key: 2-D picks array}, then evict down to the size cap."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, picks in items.items():
+            picks = np.ascontiguousarray(picks, dtype=np.float64)
+            blob = picks.tobytes()
+            rows.append((key, blob, picks.shape[1], len(blob) + self.ENTRY_OVERHEAD, now))
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO comps VALUES (?, ?, ?, ?, ?)", rows)
+        self.evict()
+
+    def entries(self):
+        if not os.path.exists(self.path):
+            return 0
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM comps").fetchone()[0]
+
+    def size_bytes(self):
+        if not os.path.exists(self.path):
+            return 0
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM comps").fetchone()[0]
+
+    def evict(self):
+        """Drop least-recently-used entries until the total is under max_bytes."""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM comps").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            doomed, freed = [], 0
+            for key, size in conn.execute("SELECT key, size FROM comps ORDER BY last_used"):
+                if freed >= excess:
+                    break
+                doomed.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM comps WHERE key = ?", doomed)
+
+    def clear(self):
+        """Delete every cached subject; returns how many were removed."""
+        n = self.entries()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return n
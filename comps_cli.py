@@ -0,0 +1,378 @@
+"""Command-line comp matching: same pipeline and results file as the Streamlit app.
+
+Example:
+    python comps_cli.py subjects.xlsx county_roll.xlsx --prop-type Hotel --max-comps 5
+    python comps_cli.py subjects.csv county_roll.parquet -o results.parquet
+    python comps_cli.py subjects.xlsx pools/hotel.sqlite --prop-type Hotel   (a store from comps_store.py)
+    python comps_cli.py subjects.xlsx pools/statewide.sqlite --shards   (tile by tile, bounded memory)
+    python comps_cli.py subjects.xlsx county_roll.xlsx --sweep max_radius_miles=5,7,10 --sweep max_gap_pct_value=0.3,0.5
+    python comps_cli.py subjects.xlsx county_roll.xlsx --batch   (every property type, a sheet each)
+"""
+
+import argparse
+import sys
+import time
+
+from comps_cache import DEFAULT_CACHE_DIR, CompCache, PoolCache
+from comps_engine import (
+    PROPERTY_TYPE_COL,
+    PROPERTY_TYPES,
+    SELECTION_STRATEGIES,
+    SWEEP_KEYS,
+    apply_rule_setting,
+    default_overpaid_base,
+    iter_result_frames,
+    match_batch,
+    match_results,
+    match_rules_for,
+    read_batch_inputs,
+    read_inputs,
+    required_columns,
+    rule_grid,
+    sweep_rules,
+    validate_frames,
+)
+from comps_output import OUTPUT_FORMATS, open_result_writer, output_format, write_results_workbook
+from comps_store import (
+    PoolStore,
+    is_store,
+    match_sharded,
+    read_store_inputs,
+    read_store_subjects,
+    validate_store,
+)
+from comps_timing import StageTimer
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Find comparable properties for every subject row.",
+    )
+    parser.add_argument("subject", help="Subject file (.xlsx, .csv or .parquet)")
+    parser.add_argument(
+        "source",
+        help="Data Source file (.xlsx, .csv or .parquet), or a pool store (.sqlite) made by comps_store.py",
+    )
+    parser.add_argument("--prop-type", choices=PROPERTY_TYPES, default="Hotel")
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Match every property type in one run: both files are split on --type-col and the "
+        "workbook gets a sheet per type (--prop-type is ignored).",
+    )
+    parser.add_argument(
+        "--type-col", default=PROPERTY_TYPE_COL,
+        help="Column naming each row's property type, for --batch (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--cascading", action=argparse.BooleanOptionalAction, default=True,
+        help="Relax rules Static → Cat1 → Cat2 → Cat3 to fill comps (default: on).",
+    )
+    parser.add_argument("--max-comps", type=int, default=3)
+    parser.add_argument(
+        "--selection", choices=list(SELECTION_STRATEGIES), default="classic",
+        help="How comps are chosen from the candidates: classic (highest, lowest and middle "
+        "metric per tier) or scored (best distance, metric and value gaps, filling max comps).",
+    )
+    parser.add_argument(
+        "--rule-mode", choices=["Static", "Dynamic"], default="Static",
+        help="Rule set used when cascading is off.",
+    )
+    parser.add_argument(
+        "--category", choices=["Category 1", "Category 2", "Category 3"], default=None,
+        help="Dynamic category used when cascading is off.",
+    )
+    parser.add_argument(
+        "--overpaid-pct", type=float, default=None,
+        help="Calculate the overpaid amount with this percentage (e.g. 10).",
+    )
+    parser.add_argument(
+        "--overpaid-base", choices=["Rooms", "Units", "GBA"], default=None,
+        help="Size column of the overpaid amount (default: Rooms for Hotel, Units for Apartment, GBA otherwise).",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default 1).")
+    parser.add_argument(
+        "--shards", action="store_true",
+        help="With a pool store: load it tile by tile as the subjects need it and drop tiles once "
+        "matched, so memory follows the subjects' footprint (matches in this process).",
+    )
+    parser.add_argument(
+        "--sweep", action="append", default=[], metavar="KEY=V1,V2,...",
+        help=f"Instead of matching, compare rule settings: every combination of the given values "
+        f"(keys: {', '.join(SWEEP_KEYS)}; a value like 7/15/10/15/15 sets each rule tier). "
+        "Writes one row per setting with how many subjects get 0 / 1 / 2 / 3+ comps. Repeatable.",
+    )
+    parser.add_argument(
+        "--cache-dir", default=DEFAULT_CACHE_DIR,
+        help="Where parsed Data Source pools are cached (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Always re-parse the Data Source instead of using the pool cache.",
+    )
+    parser.add_argument(
+        "--no-comp-cache", action="store_true",
+        help="Match every subject instead of reusing cached comps for unchanged ones.",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="Output file (default: Automated_Comps_Results.xlsx, or Rule_Sweep.xlsx with --sweep).",
+    )
+    parser.add_argument(
+        "--format", choices=list(OUTPUT_FORMATS), default=None,
+        help="Output format (default: from the output file extension, else xlsx).",
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="Print wall time and call counts per pipeline stage.",
+    )
+    parser.add_argument("--trace", default=None, help="Write a JSON timing trace to this file.")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Run under cProfile and print the top functions by cumulative time.",
+    )
+    return parser
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def parse_sweep(specs):
+    """rule_grid() settings from --sweep KEY=V1,V2,... arguments; ValueError if malformed."""
+    axes = {}
+    for spec in specs:
+        key, sep, values = spec.partition("=")
+        key = key.strip()
+        if not sep or not values.strip():
+            raise ValueError(f"--sweep {spec!r}: expected KEY=V1,V2,...")
+        try:
+            axes[key] = [
+                tuple(float(v) for v in value.split("/")) if "/" in value else float(value)
+                for value in values.split(",")
+            ]
+        except ValueError:
+            raise ValueError(f"--sweep {spec!r}: values must be numbers (or per-tier a/b/c...)") from None
+    return rule_grid(**axes)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.max_comps < 1:
+        parser.error("--max-comps must be at least 1")
+    if args.rule_mode == "Dynamic" and args.category is None:
+        parser.error("--rule-mode Dynamic needs a --category")
+    if args.shards and not is_store(args.source):
+        parser.error("--shards needs a pool store (.sqlite) as the source")
+    if args.sweep:
+        if args.shards:
+            parser.error("--sweep can't be combined with --shards")
+        try:
+            args.settings = parse_sweep(args.sweep)
+            base = match_rules_for(args.cascading, args.rule_mode, args.category)
+            for setting in args.settings:
+                apply_rule_setting(base, setting)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.output is None:
+        args.output = "Rule_Sweep.xlsx" if args.sweep else "Automated_Comps_Results.xlsx"
+    if args.batch:
+        if is_store(args.source) or args.shards or args.sweep:
+            parser.error("--batch needs a Data Source file and can't be combined with --shards or --sweep")
+        if output_format(args.output, args.format) != "xlsx":
+            parser.error("--batch writes an Excel workbook (a sheet per property type)")
+    timer = StageTimer(profile=args.profile)
+    with timer.activate():
+        status = run(args)
+
+    if args.timings or args.profile:
+        for rec in timer.summary():
+            log(f"{rec['stage']:<40} {rec['calls']:>8} calls {rec['seconds']:10.3f}s {rec['share']:7.1%}")
+    if args.profile:
+        log(timer.profile_text())
+    if args.trace:
+        timer.write_trace(args.trace)
+        log(f"Timing trace → {args.trace}")
+    return status
+
+
+def run(args):
+    started = time.perf_counter()
+    if args.batch:
+        return run_batch(args, started)
+
+    if is_store(args.source):
+        store = PoolStore(args.source)
+        try:
+            store.check_prop_type(args.prop_type)
+        except ValueError as e:
+            log(str(e))
+            return 2
+        if args.shards:
+            subj = read_store_subjects(args.subject, store, args.prop_type)
+            report = validate_store(subj, store, required_columns(args.prop_type))
+        else:
+            match_rules = match_rules_for(args.cascading, args.rule_mode, args.category)
+            if args.sweep:  # load what the loosest setting can reach
+                match_rules = [rules for s in args.settings for rules in apply_rule_setting(match_rules, s)]
+            subj, src = read_store_inputs(args.subject, store, args.prop_type, match_rules)
+            log(f"Loaded {len(src)} of {store.info()['rows']} rows from the pool store {args.source}")
+            report = validate_frames(subj, src, required_columns(args.prop_type))
+    else:
+        cache = None if args.no_cache else PoolCache(args.cache_dir)
+        subj, src = read_inputs(args.subject, args.source, args.prop_type, cache=cache)
+        report = validate_frames(subj, src, required_columns(args.prop_type))
+    if report["missing_subj_cols"] or report["missing_src_cols"]:
+        if report["missing_subj_cols"]:
+            log(f"Subject file is missing required columns: {report['missing_subj_cols']}")
+        if report["missing_src_cols"]:
+            log(f"Data Source file is missing required columns: {report['missing_src_cols']}")
+        return 2
+
+    subj, src = report["subj"], report["src"]
+    src_after = report["src_after"] if src is None else len(src)
+    log(f"Subject rows before filter: {report['subj_before']}, after filter: {len(subj)}")
+    log(f"Source rows before filter: {report['src_before']}, after filter: {src_after}")
+    if len(subj) == 0 or src_after == 0:
+        log("Nothing to match after dropping rows with null required columns.")
+        return 1
+
+    if args.sweep:
+        return run_sweep(args, subj, src, started)
+
+    use_overpaid = args.overpaid_pct is not None
+    overpaid_base = args.overpaid_base
+    if use_overpaid and overpaid_base is None:
+        overpaid_base = default_overpaid_base(args.prop_type)
+
+    match_options = dict(
+        prop_type=args.prop_type,
+        use_cascading=args.cascading,
+        max_comps=args.max_comps,
+        rule_mode=args.rule_mode,
+        category=args.category,
+        selection=args.selection,
+    )
+    if args.shards:
+        comp_table, src = match_sharded(subj, store, required_cols=required_columns(args.prop_type), **match_options)
+        log(
+            f"Matched against {comp_table.attrs['shards_loaded']} shards of the pool store, "
+            f"at most {comp_table.attrs['peak_pool_rows']} rows held at once."
+        )
+    else:
+        comp_table = match_results(
+            subj, src,
+            workers=args.workers,
+            comp_cache=None if args.no_comp_cache else CompCache(args.cache_dir),
+            **match_options,
+        )
+    reused = comp_table.attrs.get("cached_subjects", 0)
+    if reused:
+        log(f"Reused cached comps for {reused} of {len(subj)} subjects.")
+    shared = comp_table.attrs.get("shared_subjects", 0)
+    if shared:
+        log(f"{shared} subjects duplicated another subject's matching fields and shared its comps.")
+
+    frames = iter_result_frames(
+        subj,
+        src,
+        use_overpaid=use_overpaid,
+        overpaid_base_dim=overpaid_base,
+        overpaid_pct=(args.overpaid_pct or 0.0) / 100.0,
+        comp_table=comp_table,
+        **match_options,
+    )
+
+    with open_result_writer(args.output, args.format) as writer:
+        for frame in frames:
+            writer.write_frame(frame)
+    log(f"Processed {writer.rows_written} subjects in {time.perf_counter() - started:.1f}s → {args.output}")
+    return 0
+
+
+def run_batch(args, started):
+    cache = None if args.no_cache else PoolCache(args.cache_dir)
+    try:
+        subj_parts, src_parts = read_batch_inputs(args.subject, args.source, type_col=args.type_col, cache=cache)
+    except ValueError as e:
+        log(str(e))
+        return 2
+    for name, parts in (("Subject", subj_parts), ("Data Source", src_parts)):
+        skipped = len(parts.pop(None, ()))
+        if skipped:
+            log(f"{name} rows without a known {args.type_col} (one of {', '.join(PROPERTY_TYPES)}): {skipped}, skipped")
+
+    batch = match_batch(
+        subj_parts, src_parts,
+        use_cascading=args.cascading,
+        max_comps=args.max_comps,
+        rule_mode=args.rule_mode,
+        category=args.category,
+        selection=args.selection,
+        workers=args.workers,
+        comp_cache=None if args.no_comp_cache else CompCache(args.cache_dir),
+    )
+    for ptype, part in batch.items():
+        report = part["report"]
+        if report["missing_subj_cols"] or report["missing_src_cols"]:
+            log(
+                f"{ptype}: missing required columns (Subject: {report['missing_subj_cols']}, "
+                f"Data Source: {report['missing_src_cols']}); skipped"
+            )
+            continue
+        log(
+            f"{ptype}: subject rows {report['subj_before']} → {report['subj_after']}, "
+            f"source rows {report['src_before']} → {report['src_after']}"
+            + ("" if part["comp_table"] is not None else "; nothing to match")
+        )
+    matched = {ptype: part for ptype, part in batch.items() if part["comp_table"] is not None}
+    if not matched:
+        log("Nothing to match for any property type.")
+        return 1
+
+    use_overpaid = args.overpaid_pct is not None
+    sheets = (
+        (ptype, iter_result_frames(
+            part["subj"], part["src"],
+            prop_type=ptype,
+            use_cascading=args.cascading,
+            max_comps=args.max_comps,
+            rule_mode=args.rule_mode,
+            category=args.category,
+            selection=args.selection,
+            use_overpaid=use_overpaid,
+            overpaid_base_dim=args.overpaid_base or default_overpaid_base(ptype),
+            overpaid_pct=(args.overpaid_pct or 0.0) / 100.0,
+            comp_table=part["comp_table"],
+        ))
+        for ptype, part in matched.items()
+    )
+    write_results_workbook(sheets, args.output)
+    subjects = sum(len(part["subj"]) for part in matched.values())
+    log(
+        f"Processed {subjects} subjects of {len(matched)} property types "
+        f"in {time.perf_counter() - started:.1f}s → {args.output}"
+    )
+    return 0
+
+
+def run_sweep(args, subj, src, started):
+    result = sweep_rules(
+        subj, src, args.settings,
+        prop_type=args.prop_type,
+        use_cascading=args.cascading,
+        max_comps=args.max_comps,
+        rule_mode=args.rule_mode,
+        category=args.category,
+        selection=args.selection,
+    )
+    summary = result["summary"]
+    log(summary.to_string(index=False))
+    with open_result_writer(args.output, args.format) as writer:
+        writer.write_frame(summary)
+    log(f"Swept {len(summary)} rule settings in {time.perf_counter() - started:.1f}s → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2178 @@
+"""Comp matching engine: helpers, rules and matchers used by the Streamlit app.
+
+Kept free of Streamlit so it can be imported by worker processes and scripts.
+"""
+
+import contextvars
+import functools
+import io
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from comps_cache import file_digest, frame_digest
+from comps_timing import counted, stage, timed
+
+try:  # Rust xlsx reader, several times faster than openpyxl when installed
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+# ==========================================
+# 1. HELPER FUNCTIONS
+# ==========================================
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculates distance in miles between two lat/lon points."""
+    try:
+        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+        lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+        dlon = lon2 - lon1
+        dlat = lat2 - lat1
+        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        c = 2 * math.asin(math.sqrt(a))
+        return c * 3956  # miles
+    except Exception:
+        return 999999
+        
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Vectorized haversine (miles); either point may be a scalar or an array."""
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2)
+    )
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    with np.errstate(invalid="ignore"):
+        c = 2 * np.arcsin(np.sqrt(a))
+    # Same fallback as haversine() when the math blows up.
+    return np.where(np.isnan(c), 999999, c * 3956)
+
+
+def norm_desc(s: str) -> str:
+    """Simple normalizer for description text (case-insensitive, strip spaces)."""
+    if pd.isna(s):
+        return ""
+    return str(s).strip().lower()
+
+def norm_class(v):
+    try:
+        return int(float(v))
+    except Exception:
+        return np.nan
+
+
+# ---------- DEDUP KEYS ----------
+# Two rows are the same property when their account numbers match, or when
+# any of these fields share a 6-character prefix of at least 4 characters.
+# normalize_frame() stores each key as a column so comparisons are plain
+# set lookups; rows without the columns fall back to computing them. A
+# compacted pool (compact_pool) holds them as categoricals, and the matcher
+# compares their integer codes instead of strings.
+
+DEDUP_KEY_COLS = {
+    "_key_account": "Property Account No",
+    "_key_owner": "Owner Name/ LLC Name",
+    "_key_hotel": "Hotel Name",  # hotels only
+    "_key_street": "Owner Street Address",  # hotels only
+    "_key_address": "Property Address",
+}
+HOTEL_ONLY_KEYS = ("_key_hotel", "_key_street")
+
+
+def add_dedup_keys(df):
+    """A key column for every DEDUP_KEY_COLS field.
+
+    The account key is the stripped, lowercased account number; the others
+    are the value's first 6 characters once lowercased and stripped of
+    " .-,/", or "" when that's under 4 characters.
+    """
+    for key_col, col in DEDUP_KEY_COLS.items():
+        if col not in df.columns:
+            df[key_col] = ""  # what row.get(col, "") compared as
+            continue
+        # Object dtype keeps Python's str.lower(); Arrow's differs for some letters.
+        values = df[col].astype(object)
+        if key_col == "_key_account":
+            text = values.where(values.notna(), "nan").astype(str).astype(object)
+            df[key_col] = text.str.strip().str.lower()
+            continue
+        text = values.where(values.notna(), "").astype(str).astype(object)
+        prefix = text.str.lower().str.replace(r"[ .\-,/]", "", regex=True).str[:6]
+        df[key_col] = prefix.where(prefix.str.len() >= 4, "")
+    return df
+
+
+EMPTY_KEY = -2  # code of an empty ("") key in dedup_key_arrays()
+
+
+def _with_dedup_keys(df):
+    if all(key_col in df.columns for key_col in DEDUP_KEY_COLS):
+        return df
+    return add_dedup_keys(df[[c for c in DEDUP_KEY_COLS.values() if c in df.columns]].copy())
+
+
+def dedup_key_arrays(subj_df, src_df, is_hotel):
+    """Dedup keys of both frames as [(key column, values, empty value)] lists, for keys_at().
+
+    Where the source column is categorical, values are its codes and the
+    subject's keys are mapped onto them (-1 when no source row has the key);
+    otherwise both are the key strings.
+    """
+    subj_df, src_df = _with_dedup_keys(subj_df), _with_dedup_keys(src_df)
+    s_keys, c_keys = [], []
+    for key_col in DEDUP_KEY_COLS:
+        if not is_hotel and key_col in HOTEL_ONLY_KEYS:
+            continue
+        empty = None if key_col == "_key_account" else ""  # an empty account still identifies
+        src_col, subj_vals = src_df[key_col], subj_df[key_col].to_numpy(dtype=object)
+        if not isinstance(src_col.dtype, pd.CategoricalDtype):
+            s_keys.append((key_col, subj_vals, empty))
+            c_keys.append((key_col, src_col.to_numpy(dtype=object), empty))
+            continue
+        codes = src_col.cat.codes.to_numpy()
+        subj_codes = src_col.cat.categories.get_indexer(subj_vals)
+        if empty is not None:
+            blank = src_col.cat.categories.get_indexer([""])[0]
+            if blank >= 0:
+                codes = np.where(codes == blank, EMPTY_KEY, codes)
+            subj_codes[subj_vals == ""] = EMPTY_KEY
+            empty = EMPTY_KEY
+        s_keys.append((key_col, subj_codes, empty))
+        c_keys.append((key_col, codes, empty))
+    return s_keys, c_keys
+
+
+def keys_at(key_arrays, pos):
+    """Set of (key column, key) pairs of row `pos` (strings or codes), read from dedup_key_arrays().
+
+    A candidate duplicates a subject or chosen comp when the sets intersect.
+    """
+    return {
+        (key_col, values[pos])
+        for key_col, values, empty in key_arrays
+        if values[pos] != empty
+    }
+
+
+# ---------- CLASS RULES ----------
+# Hotels: class 8 only matches 8, 7 matches 6-7, 6 matches 5-7, and lower
+# classes match one below to two above (never 8). Other types: classes
+# within 2 of each other, or either class missing. Subject and comp classes
+# broadcast, so a scalar subject against a column and a (subjects, 1) x
+# (1, comps) block both work. NaN classes never pass the hotel rule.
+
+def class_mask_hotel(subj_c, comp_c):
+    subj_c = np.trunc(np.asarray(subj_c, dtype=float))
+    comp_c = np.trunc(np.asarray(comp_c, dtype=float))
+    return np.where(
+        subj_c == 8, comp_c == 8,
+        np.where(
+            subj_c == 7, (comp_c == 6) | (comp_c == 7),
+            np.where(
+                subj_c == 6, (comp_c >= 5) & (comp_c <= 7),
+                (comp_c != 8) & (comp_c >= subj_c - 1) & (comp_c <= subj_c + 2),
+            ),
+        ),
+    )
+
+
+def class_mask_other(subj_c, comp_c):
+    subj_c = np.trunc(np.asarray(subj_c, dtype=float))
+    comp_c = np.trunc(np.asarray(comp_c, dtype=float))
+    with np.errstate(invalid="ignore"):
+        return ~(np.abs(comp_c - subj_c) > 2)
+
+
+def num_col(df, col, rows=None):
+    """Column as a float array (optionally only `rows` positions); all-NaN when missing."""
+    if col not in df.columns:
+        return np.full(len(df) if rows is None else len(rows), np.nan)
+    values = df[col]
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind == "f":
+        # float64, or float32 / float16 in a compact_pool() frame
+        values = values.to_numpy()
+        values = values if rows is None else values[rows]
+        return values.astype(np.float64, copy=False)
+    values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return values if rows is None else values[rows]
+
+
+def metric_fields(is_hotel, prop_type=None):
+    """(metric, size, value) column names used for a property type."""
+    if is_hotel:
+        return "VPR", "Rooms", "Total Market value-2023"
+    ptype = (prop_type or "").strip().lower()
+    size_field = "Units" if ptype == "apartment" else "GBA"
+    return "VPU", size_field, "Total Market value-2023"
+
+
+def label_codes(df, col, labels=None):
+    """(codes, labels) of df[col] compared as text: codes index labels, -1 for missing or "".
+
+    With `labels` (e.g. the source's), df[col] is coded against them instead;
+    text they lack also gets -1. Categorical columns reuse their codes rather
+    than materializing a string per row.
+    """
+    if labels is not None:
+        text = df[col].astype(object).fillna("").astype(str).to_numpy(dtype=object)
+        codes = labels.get_indexer(text)
+        codes[text == ""] = -1
+        return codes, labels
+    values = df[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # Distinct values can share a text form (1 and "1"); code by the text.
+    text_codes, labels = pd.factorize(np.asarray(uniques.astype(str), dtype=object))
+    text_codes[labels[text_codes] == ""] = -1
+    return np.append(text_codes, -1)[codes], pd.Index(labels, dtype=object)
+
+
+# ---------- SPATIAL INDEX ----------
+
+def search_box(lat, lon, radius_miles):
+    """(lat_lo, lat_hi, lon_lo, lon_hi) in degrees, holding every point within radius_miles.
+
+    None when no box can narrow the search: missing coordinates (every row
+    is then at the 999-mile placeholder), or a box reaching a pole or
+    wrapping the antimeridian.
+    """
+    if pd.isna(lat) or pd.isna(lon):
+        return None
+    lat, lon = float(lat), float(lon)
+    # Degrees spanned by the radius on the 3956-mile sphere, plus slack.
+    dlat = math.degrees(radius_miles / 3956) * 1.01 + 1e-9
+    max_lat = min(abs(lat) + dlat, 90.0)
+    if max_lat >= 89.0:
+        return None
+    dlon = dlat / math.cos(math.radians(max_lat))
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return None
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class SpatialIndex:
+    """Lat/lon grid over a source frame so radius searches only touch nearby cells.
+
+    Build it once per Data Source. query() returns a superset of the rows within
+    the radius; the matcher still applies the exact haversine check. Rows with
+    missing coordinates sit at the 999-mile placeholder distance, so they are
+    only returned when the radius reaches that far.
+    """
+
+    def __init__(self, df, cell_deg=0.25):
+        self.cell_deg = cell_deg
+        self.index = df.index
+        self.size = len(df)
+        lat = num_col(df, "lat")
+        lon = num_col(df, "lon")
+        has_coords = ~np.isnan(lat) & ~np.isnan(lon)
+        self.no_coords = np.flatnonzero(~has_coords)
+
+        pos = np.flatnonzero(has_coords)
+        ilat = np.floor(lat[pos] / cell_deg).astype(np.int64)
+        ilon = np.floor(lon[pos] / cell_deg).astype(np.int64)
+        order = np.lexsort((pos, ilon, ilat))
+        pos, ilat, ilon = pos[order], ilat[order], ilon[order]
+        starts = np.flatnonzero(np.r_[len(pos) > 0, (np.diff(ilat) != 0) | (np.diff(ilon) != 0)])
+        self.cells = {
+            (int(a), int(b)): chunk
+            for a, b, chunk in zip(ilat[starts], ilon[starts], np.split(pos, starts[1:]))
+        }
+
+    def positions(self, lat, lon, radius_miles):
+        """Sorted row positions that may lie within radius_miles, or None for "all rows"."""
+        box = search_box(lat, lon, radius_miles)
+        if box is None:
+            return None
+        lat_lo, lat_hi, lon_lo, lon_hi = (math.floor(deg / self.cell_deg) for deg in box)
+
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) > len(self.cells):
+            hits = [
+                chunk for (a, b), chunk in self.cells.items()
+                if lat_lo <= a <= lat_hi and lon_lo <= b <= lon_hi
+            ]
+        else:
+            hits = []
+            for a in range(lat_lo, lat_hi + 1):
+                for b in range(lon_lo, lon_hi + 1):
+                    chunk = self.cells.get((a, b))
+                    if chunk is not None:
+                        hits.append(chunk)
+        if radius_miles >= 999:
+            hits.append(self.no_coords)
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(hits))
+
+    def query(self, lat, lon, radius_miles, df):
+        """Like positions(), but mapped onto `df` (the indexed frame or a row subset of it)."""
+        pos = self.positions(lat, lon, radius_miles)
+        if pos is None:
+            return None
+        if df.index is self.index and len(df) == self.size:
+            return pos
+        if not self.index.is_unique:
+            return None
+        rows = df.index.get_indexer(self.index[pos])
+        return rows[rows >= 0]
+
+
+# ---------- METRIC INDEX ----------
+
+class MetricIndex:
+    """Source rows partitioned by class and sorted by VPR/VPU within each class.
+
+    The main-metric rule keeps comps with subj * (1 - band) <= metric <= subj,
+    a contiguous run of each sorted partition, so the band is found by binary
+    search and the per-subject cost follows the band size, not the roll size.
+    Bounds are slightly widened; callers still apply the exact band test to
+    what comes back.
+
+    With `groups` (label_codes() of e.g. _desc_norm for Retail / Warehouse)
+    the partitions are keyed by (group, class): a subject only meets rows
+    carrying its own group label, and rows / subjects with an empty label
+    (code -1) meet nothing.
+    """
+
+    def __init__(self, metric, classes, rows=None, metric_field=None, groups=None, group_col=None):
+        """metric / classes / groups are full source columns; only `rows` positions are indexed."""
+        self.metric_field = metric_field
+        self.group_col = group_col
+        self.grouped = groups is not None
+        self.size = len(metric)
+        self.metric = metric
+        rows = np.arange(len(metric)) if rows is None else np.asarray(rows)
+        rows = rows[~np.isnan(metric[rows])]  # a missing metric never passes metric <= subj
+        if self.grouped:
+            rows = rows[groups[rows] >= 0]
+            labels = groups[rows]
+        else:
+            labels = np.zeros(len(rows), dtype=np.int64)
+
+        # label -> ([class keys], [(-metric sorted, positions)])
+        self.parts = {}
+        codes, uniques = pd.factorize(labels)
+        by_label = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[by_label], np.arange(len(uniques) + 1))
+        for u, label in enumerate(uniques):
+            group_rows = rows[by_label[bounds[u]:bounds[u + 1]]]
+            keys = np.trunc(classes[group_rows])
+            nan_key = np.isnan(keys)
+            entry = ([], [])
+            for key in np.unique(keys[~nan_key]).tolist() + ([np.nan] if nan_key.any() else []):
+                pos = group_rows[nan_key] if np.isnan(key) else group_rows[keys == key]
+                neg = -metric[pos]
+                order = np.lexsort((pos, neg))
+                entry[0].append(key)
+                entry[1].append((neg[order], pos[order]))
+            self.parts[label] = entry
+
+    @classmethod
+    def for_frame(cls, df, metric_field, group_col=None):
+        groups = None
+        if group_col is not None:
+            groups, _ = label_codes(df, group_col)
+        return cls(
+            num_col(df, metric_field), num_col(df, "Class_Num"),
+            metric_field=metric_field, groups=groups, group_col=group_col,
+        )
+
+    def pairs(self, subj_metric, subj_class, band, class_mask, subj_group=None):
+        """(subject, position) pairs for arrays of subjects; subject indexes subj_metric."""
+        subj_metric = np.asarray(subj_metric, dtype=float)
+        subj_class = np.asarray(subj_class, dtype=float)
+        with np.errstate(invalid="ignore"):
+            valid = ~np.isnan(subj_metric) & (subj_metric != 0)
+            # Negative subjects pass any band (abs(gap) / subj <= 0), so no lower bound.
+            lo = np.where(
+                subj_metric > 0,
+                subj_metric * (1 - band) - np.abs(subj_metric) * 1e-9,
+                -np.inf,
+            )
+        if self.grouped:
+            labels = np.asarray(subj_group)
+        else:
+            labels = np.zeros(len(subj_metric), dtype=np.int64)
+
+        codes, uniques = pd.factorize(labels)
+        by_label = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[by_label], np.arange(len(uniques) + 1))
+        subj_out, pos_out = [], []
+        for u, label in enumerate(uniques):
+            entry = self.parts.get(label)
+            if entry is None:
+                continue
+            members = by_label[bounds[u]:bounds[u + 1]]
+            members = members[valid[members]]
+            for key, (neg, pos) in zip(*entry):
+                sub = members[class_mask(subj_class[members], key)]
+                if not len(sub):
+                    continue
+                a = np.searchsorted(neg, -subj_metric[sub], side="left")
+                b = np.searchsorted(neg, -lo[sub], side="right")
+                n = b - a
+                total = int(n.sum())
+                if not total:
+                    continue
+                starts = np.repeat(a - (np.cumsum(n) - n), n)
+                subj_out.append(np.repeat(sub, n))
+                pos_out.append(pos[starts + np.arange(total)])
+        if not subj_out:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(subj_out), np.concatenate(pos_out)
+
+
+# ==========================================
+# 2. CORE MATCHING LOGIC
+# ==========================================
+
+def tier_mask(cands, rules):
+    """Which scored candidates satisfy one rule set."""
+    return (
+        (cands["main_pct"] <= rules["max_gap_pct_main"])
+        & (cands["value_pct"] <= rules["max_gap_pct_value"])
+        & (cands["size_pct"] <= rules["max_gap_pct_size"])
+        & (cands["dist"] <= rules["max_radius_miles"])
+    )
+
+
+def assign_tiers(cands, rule_sets):
+    """Per-candidate bitmask of qualifying rule sets, and the tightest (first) one."""
+    tier_bits = np.zeros(len(cands["dist"]), dtype=np.int64)
+    for k, rules in enumerate(rule_sets):
+        tier_bits |= tier_mask(cands, rules).astype(np.int64) << k
+    tier = np.full(len(tier_bits), -1, dtype=np.int64)
+    for k in reversed(range(len(rule_sets))):
+        tier[((tier_bits >> k) & 1) == 1] = k
+    return tier_bits, tier
+
+
+def settle_radius_edges(dist, has_coords, rule_sets, slat, slon, clat, clon):
+    """Recompute rows sitting on a tier radius with the scalar haversine.
+
+    np.sin/np.cos may differ from math.* in the last ulp, which could flip a
+    row that lies exactly on the radius.
+    """
+    edge = np.zeros(len(dist), dtype=bool)
+    for rules in rule_sets:
+        edge |= np.abs(dist - rules["max_radius_miles"]) < 1e-6
+    slat = np.broadcast_to(slat, dist.shape)
+    slon = np.broadcast_to(slon, dist.shape)
+    for k in np.flatnonzero(has_coords & edge):
+        dist[k] = haversine(slat[k], slon[k], clat[k], clon[k])
+
+
+def pick_comps(cands, keep, subj_value, taken, keys_of, max_comps):
+    """Pick comp1 (highest metric, closest value), comp2 (lowest) and comp3 (middle).
+
+    Returns their indices into `cands`, skipping any whose dedup keys
+    (keys_of(source position)) are already in `taken`; `taken` is updated.
+    """
+    idx = np.flatnonzero(keep)
+    if len(idx) == 0:
+        return []
+
+    # Highest metric first; the stable sort keeps source order within ties,
+    # same as list.sort(reverse=True) did. Index-fed candidates already are.
+    metric = cands["metric"]
+    if cands.get("metric_sorted"):
+        ranked = idx
+    else:
+        ranked = idx[np.argsort(-metric[idx], kind="stable")]
+
+    top_group = ranked[metric[ranked] == metric[ranked[0]]]
+    market_diff = np.abs(cands["value"][top_group] - float(subj_value))
+    comp1 = top_group[np.argmin(np.where(np.isnan(market_diff), np.inf, market_diff))]
+    comp2 = ranked[-1]
+    comp3 = ranked[len(ranked) // 2]
+
+    picked = []
+    for k in [comp1, comp2, comp3]:
+        keys = keys_of(cands["rows"][k])
+        if not taken.isdisjoint(keys):
+            continue
+        taken |= keys
+        picked.append(k)
+        if len(picked) == max_comps:
+            break
+    return picked
+
+
+# Weights of the scored selection: distance as a share of the widest rule
+# radius, metric gap and value gap as fractions of the subject's; lower wins.
+SCORE_WEIGHTS = {"distance": 1.0, "metric": 1.0, "value": 1.0}
+
+
+def comp_scores(cands, idx):
+    """Scored-selection score of candidates `idx` (see SCORE_WEIGHTS); NaN scores rank last."""
+    radius = cands.get("max_radius") or 1.0
+    score = (
+        SCORE_WEIGHTS["distance"] * cands["dist"][idx] / radius
+        + SCORE_WEIGHTS["metric"] * cands["main_pct"][idx]
+        + SCORE_WEIGHTS["value"] * cands["value_pct"][idx]
+    )
+    return np.where(np.isnan(score), np.inf, score)
+
+
+def pick_scored(cands, keep, subj_value, taken, keys_of, max_comps):
+    """Pick the max_comps best-scored candidates (comp_scores), best first.
+
+    Same contract as pick_comps. Only the best few are ever sorted: a
+    partial sort (np.partition) finds a window of about 2 * max_comps, and
+    the window doubles only while dedup rejects enough of it to leave slots
+    open, so a subject costs O(n + k log k) rather than a full sort. Ties
+    rank like pick_comps: highest metric, then source position.
+    """
+    idx = np.flatnonzero(keep)
+    if len(idx) == 0 or max_comps <= 0:
+        return []
+    score = comp_scores(cands, idx)
+    rows, metric = cands["rows"][idx], cands["metric"][idx]
+
+    picked = []
+    tried = 0  # candidates already tried, in ranking order
+    window = 2 * max_comps
+    while len(picked) < max_comps and tried < len(idx):
+        if window < len(idx):
+            # Everything tied with the window's worst comes along, so the
+            # ranking never depends on how np.partition broke the tie.
+            best = np.flatnonzero(score <= np.partition(score, window - 1)[window - 1])
+        else:
+            best = np.arange(len(idx))
+        best = best[np.lexsort((rows[best], -metric[best], score[best]))]
+        for j in best[tried:]:
+            k = idx[j]
+            keys = keys_of(cands["rows"][k])
+            if not taken.isdisjoint(keys):
+                continue
+            taken |= keys
+            picked.append(k)
+            if len(picked) == max_comps:
+                break
+        tried = len(best)
+        window *= 2
+    return picked
+
+
+# How each subject's comps are chosen from its candidates. "pick" has
+# pick_comps' signature; with "scores", it also reads comp_scores()' inputs
+# (dist, main_pct, value_pct, max_radius) from the candidates. With "fill", a
+# cascade tier picks around the comps earlier tiers took and fills every open
+# slot, so a looser tier is only reached when the tighter ones run short.
+SELECTION_STRATEGIES = {
+    "classic": {
+        "label": "Classic (highest, lowest and middle metric per tier)",
+        "pick": pick_comps,
+        "scores": False,
+        "fill": False,
+    },
+    "scored": {
+        "label": "Scored top-k (distance, metric gap and value gap)",
+        "pick": pick_scored,
+        "scores": True,
+        "fill": True,
+    },
+}
+
+
+def selection_strategy(selection):
+    """SELECTION_STRATEGIES entry by name; ValueError for an unknown one."""
+    try:
+        return SELECTION_STRATEGIES[selection]
+    except KeyError:
+        raise ValueError(
+            f"Unknown selection {selection!r}; expected one of {sorted(SELECTION_STRATEGIES)}"
+        ) from None
+
+
+def cascade_picks(cands, rule_sets, subj_value, subj_keys, keys_of, max_comps, selection="classic"):
+    """(index into cands, tier) of each comp, walking the rule tiers in order.
+
+    With classic selection each tier picks against the subject alone, then
+    its picks are deduped against the comps taken by earlier tiers; a "fill"
+    strategy (see SELECTION_STRATEGIES) picks around them directly.
+    """
+    strategy = selection_strategy(selection)
+    picks = []
+    taken = set(subj_keys)
+    for tier in range(len(rule_sets)):
+        if len(picks) >= max_comps:
+            break
+        keep = ((cands["tier_bits"] >> tier) & 1) == 1
+        with stage(f"match.select.rule_set:{rule_sets[tier]['name']}", trace=False):
+            if strategy["fill"]:
+                keep[[k for k, _ in picks]] = False
+                tier_picks = strategy["pick"](
+                    cands, keep, subj_value, set(taken), keys_of, max_comps - len(picks),
+                )
+            else:
+                tier_picks = strategy["pick"](
+                    cands, keep, subj_value, set(subj_keys), keys_of, max_comps,
+                )
+        for k in tier_picks:
+            if len(picks) >= max_comps:
+                break
+            keys = keys_of(cands["rows"][k])
+            if not taken.isdisjoint(keys):
+                continue
+            taken |= keys
+            picks.append((k, tier))
+    return picks
+
+
+# ---------- BATCH MATCHING ----------
+
+BATCH_CHUNK_PAIRS = 2_000_000  # subject x source pairs evaluated per block
+
+
+@timed("match.scan")
+def match_candidates_batch(
+    subj_df,
+    src_df,
+    rule_sets,
+    *,
+    is_hotel,
+    use_hotel_class_rule,
+    prop_type=None,
+    desc_rule=False,
+    spatial_index=None,
+    metric_index=None,
+    chunk_size=BATCH_CHUNK_PAIRS,
+    progress=None,
+    gaps=False,
+):
+    """Evaluate all subjects against the source in blocks of subjects x source rows.
+
+    Subjects are bucketed by grid cell of `spatial_index` (built over src_df)
+    so each block only meets the source rows near it; without an index each
+    block sees the whole source. Within a block the source rows are class-
+    partitioned and metric-sorted (a MetricIndex; `metric_index` is reused for
+    whole-source blocks), so only each subject's VPR/VPU band is expanded into
+    pairs. A block holds at most `chunk_size` subjects x rows, which bounds
+    peak memory.
+
+    Returns the long candidate table, sorted by subject, then highest comp
+    metric first, then source position (the selection's ranking order):
+    subject / candidate (row positions in subj_df / src_df), tier (tightest
+    rule set), tier_bits (bit k = qualifies for rule_sets[k]), distance and
+    gap (subject metric minus comp metric). With desc_rule, a candidate's
+    _desc_norm must equal the subject's (and be non-empty); the indexes are
+    then partitioned by description too, so other descriptions are never
+    touched. With gaps, each pair's main_pct, value_pct and size_pct
+    (abs(comp - subj) / subj) come along, for re-thresholding under other rules.
+    """
+    metric_field, size_field, value_field = metric_fields(is_hotel, prop_type)
+    widest = {
+        k: max(rules[k] for rules in rule_sets)
+        for k in ("max_radius_miles", "max_gap_pct_main", "max_gap_pct_value", "max_gap_pct_size")
+    }
+
+    fields = {
+        "class": "Class_Num", "metric": metric_field, "value": value_field,
+        "size": size_field, "lat": "lat", "lon": "lon",
+    }
+    s_cols = {k: num_col(subj_df, col) for k, col in fields.items()}
+    c_cols = {k: num_col(src_df, col) for k, col in fields.items()}
+
+    s_desc = c_desc = group_col = None
+    if desc_rule:
+        group_col = "_desc_norm"
+        c_desc, desc_labels = label_codes(src_df, group_col)
+        s_desc, _ = label_codes(subj_df, group_col, desc_labels)
+
+    class_mask = class_mask_hotel if is_hotel and use_hotel_class_rule else class_mask_other
+    n_src = len(src_df)
+
+    # Group subjects that share a grid cell; they see (nearly) the same source rows.
+    s_lat, s_lon = s_cols["lat"], s_cols["lon"]
+    todo = np.flatnonzero(~np.isnan(s_cols["metric"]))
+    groups = {}
+    for p in todo:
+        rows = None
+        if spatial_index is not None:
+            rows = spatial_index.query(s_lat[p], s_lon[p], widest["max_radius_miles"], src_df)
+        if rows is None:
+            groups.setdefault(None, ([], []))[0].append(p)
+            continue
+        cell = (
+            math.floor(s_lat[p] / spatial_index.cell_deg),
+            math.floor(s_lon[p] / spatial_index.cell_deg),
+        )
+        members, row_sets = groups.setdefault(cell, ([], []))
+        members.append(p)
+        row_sets.append(rows)
+
+    out = []
+    done = len(subj_df) - len(todo)
+    owner = np.full(n_src, -1, dtype=np.int64)
+    for cell, (members, row_sets) in groups.items():
+        if cell is not None:
+            # Union of the members' rows in linear time: keep the one entry
+            # per row that won the scatter (the index sorts them anyway).
+            cat = np.concatenate(row_sets)
+            slot = np.arange(len(cat))
+            owner[cat] = slot
+            cols = cat[owner[cat] == slot]
+            owner[cat] = -1
+            index = MetricIndex(c_cols["metric"], c_cols["class"], cols, groups=c_desc)
+        elif (
+            metric_index is not None
+            and metric_index.metric_field == metric_field
+            and metric_index.group_col == group_col
+            and metric_index.size == n_src
+        ):
+            cols, index = None, metric_index
+        else:
+            cols, index = None, MetricIndex(c_cols["metric"], c_cols["class"], groups=c_desc)
+        n_cols = n_src if cols is None else len(cols)
+        per_block = max(1, chunk_size // max(n_cols, 1))
+        for start in range(0, len(members), per_block):
+            blk = np.array(members[start:start + per_block])
+            out.append(_match_block(
+                blk, index, s_cols, c_cols, rule_sets, widest,
+                class_mask=class_mask, s_desc=s_desc, gaps=gaps,
+            ))
+            done += len(blk)
+            if progress is not None:
+                progress(done, len(subj_df))
+
+    columns = ["subject", "candidate", "tier", "tier_bits", "distance", "gap"]
+    if gaps:
+        columns += ["main_pct", "value_pct", "size_pct"]
+    if not out:
+        return pd.DataFrame({c: np.array([], dtype=float if c in ("distance", "gap") else np.int64) for c in columns})
+    pairs = pd.DataFrame(
+        {c: np.concatenate([part[c] for part in out]) for c in columns}
+    )
+    candidate = pairs["candidate"].to_numpy()
+    order = np.lexsort((candidate, -c_cols["metric"][candidate], pairs["subject"].to_numpy()))
+    return pairs.iloc[order].reset_index(drop=True)
+
+
+def _match_block(blk, index, s_cols, c_cols, rule_sets, widest, *, class_mask, s_desc=None, gaps=False):
+    """One block of match_candidates_batch: subjects `blk` against a MetricIndex."""
+    si, cand = index.pairs(
+        s_cols["metric"][blk], s_cols["class"][blk], widest["max_gap_pct_main"], class_mask,
+        subj_group=None if s_desc is None else s_desc[blk],
+    )
+    subj = blk[si]
+
+    # Exact band test; the index bounds are a hair wide.
+    sm, cm = s_cols["metric"][subj], c_cols["metric"][cand]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mask = (cm <= sm) & (np.abs(cm - sm) / sm <= widest["max_gap_pct_main"])
+    subj, cand = subj[mask], cand[mask]
+
+    def pair_gap_pct(key):
+        # abs(comp - subj) / subj per pair; a missing or zero subject gives NaN / inf, which never pass.
+        s = s_cols[key][subj]
+        return np.abs(c_cols[key][cand] - s) / s
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        main_pct = pair_gap_pct("metric")
+        value_pct = pair_gap_pct("value")
+        size_pct = pair_gap_pct("size")
+    keep = (value_pct <= widest["max_gap_pct_value"]) & (size_pct <= widest["max_gap_pct_size"])
+    subj, cand = subj[keep], cand[keep]
+    main_pct, value_pct, size_pct = main_pct[keep], value_pct[keep], size_pct[keep]
+
+    slat, slon = s_cols["lat"][subj], s_cols["lon"][subj]
+    clat, clon = c_cols["lat"][cand], c_cols["lon"][cand]
+    dist = np.full(len(subj), 999.0)
+    has_coords = ~(np.isnan(slat) | np.isnan(slon) | np.isnan(clat) | np.isnan(clon))
+    dist[has_coords] = haversine_np(
+        slat[has_coords], slon[has_coords], clat[has_coords], clon[has_coords]
+    )
+    settle_radius_edges(dist, has_coords, rule_sets, slat, slon, clat, clon)
+
+    keep = dist <= widest["max_radius_miles"]
+    cands = {
+        "main_pct": main_pct[keep],
+        "value_pct": value_pct[keep],
+        "size_pct": size_pct[keep],
+        "dist": dist[keep],
+    }
+    subj, cand = subj[keep], cand[keep]
+    tier_bits, tier = assign_tiers(cands, rule_sets)
+
+    block = {
+        "subject": subj,
+        "candidate": cand,
+        "tier": tier,
+        "tier_bits": tier_bits,
+        "distance": cands["dist"],
+        "gap": s_cols["metric"][subj] - c_cols["metric"][cand],
+    }
+    if gaps:
+        block.update(main_pct=cands["main_pct"], value_pct=cands["value_pct"], size_pct=cands["size_pct"])
+    return block
+
+
+COMP_TABLE_COLUMNS = ["subject", "rank", "source", "tier", "distance", "gap"]
+
+
+@timed("match.select")
+def select_comp_table(
+    subj_df,
+    src_df,
+    pairs,
+    rule_sets,
+    *,
+    is_hotel,
+    max_comps,
+    prop_type=None,
+    cascading=True,
+    selection="classic",
+    memo=None,
+):
+    """Pick every subject's comps from a long candidate table, returned as a long comp table.
+
+    `pairs` must be in match_candidates_batch order (each subject's candidates
+    already ranked by metric). With cascading the tiers are walked in order
+    (see cascade_picks); otherwise rule_sets[0] is the single rule set.
+    `selection` names a SELECTION_STRATEGIES entry.
+
+    A memo dict shared by calls over the same subjects and candidates (only
+    tier_bits differing, as in sweep_rules) reuses a subject's picks when
+    its tier bits repeat.
+
+    One row per chosen comp, in (subject, rank) order: subject and source
+    positions, the rule tier it matched, distance in miles (NaN without
+    coordinates) and the subject-minus-comp metric gap.
+    """
+    metric_field, _, value_field = metric_fields(is_hotel, prop_type)
+    c_metric = num_col(src_df, metric_field)
+    c_value = num_col(src_df, value_field)
+    s_metric = num_col(subj_df, metric_field)
+    s_value = num_col(subj_df, value_field)
+    s_lat, s_lon = num_col(subj_df, "lat"), num_col(subj_df, "lon")
+    c_lat, c_lon = num_col(src_df, "lat"), num_col(src_df, "lon")
+    s_keys, c_keys = dedup_key_arrays(subj_df, src_df, is_hotel)
+
+    def keys_of(pos):
+        return keys_at(c_keys, pos)
+
+    keys_of = counted("match.select.dedup", keys_of)
+
+    strategy = selection_strategy(selection)
+    subjects = pairs["subject"].to_numpy()
+    bounds = np.searchsorted(subjects, np.arange(len(subj_df) + 1))
+    candidate = pairs["candidate"].to_numpy()
+    tier_bits = pairs["tier_bits"].to_numpy()
+    scored = {}
+    if strategy["scores"]:
+        # What comp_scores() ranks by, for every pair at once.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scored = {
+                "dist": pairs["distance"].to_numpy(),
+                "main_pct": pairs["gap"].to_numpy() / s_metric[subjects],
+                "value_pct": np.abs(c_value[candidate] - s_value[subjects]) / s_value[subjects],
+                "max_radius": max(rules["max_radius_miles"] for rules in rule_sets),
+            }
+
+    out = {c: [] for c in COMP_TABLE_COLUMNS}
+    for i in range(len(subj_df)):
+        a, b = bounds[i], bounds[i + 1]
+        if a == b:
+            continue
+        rows = candidate[a:b]
+        cands = {
+            "rows": rows,
+            "metric": c_metric[rows],
+            "value": c_value[rows],
+            "tier_bits": tier_bits[a:b],
+            "metric_sorted": True,
+        }
+        for key, values in scored.items():
+            cands[key] = values if np.isscalar(values) else values[a:b]
+        picks = None
+        if memo is not None:
+            memo_key = (i, scored.get("max_radius"), cands["tier_bits"].tobytes())
+            picks = memo.get(memo_key)
+        if picks is None and cascading:
+            picks = cascade_picks(
+                cands, rule_sets, s_value[i], keys_at(s_keys, i), keys_of, max_comps, selection,
+            )
+        elif picks is None:
+            picks = [
+                (k, 0)
+                for k in strategy["pick"](
+                    cands, (cands["tier_bits"] & 1) == 1, s_value[i],
+                    keys_at(s_keys, i), keys_of, max_comps,
+                )
+            ]
+        if memo is not None:
+            memo[memo_key] = picks
+        for rank, (k, tier) in enumerate(picks):
+            pos = rows[k]
+            coords = (s_lat[i], s_lon[i], c_lat[pos], c_lon[pos])
+            out["subject"].append(i)
+            out["rank"].append(rank)
+            out["source"].append(pos)
+            out["tier"].append(tier)
+            out["distance"].append(np.nan if np.isnan(coords).any() else haversine(*coords))
+            out["gap"].append(s_metric[i] - c_metric[pos])
+
+    return pd.DataFrame({
+        c: np.array(vals, dtype=float if c in ("distance", "gap") else np.int64)
+        for c, vals in out.items()
+    })
+
+
+def dedup_key_codes(subj_df, src_df, is_hotel):
+    """dedup_key_arrays() as comparable ints: [(subject codes, present), (source codes, present)] per key column.
+
+    Two rows share a key where both are present and their codes are equal.
+    """
+    s_keys, c_keys = dedup_key_arrays(subj_df, src_df, is_hotel)
+    s_out, c_out = [], []
+    for (_, s_vals, empty), (_, c_vals, _) in zip(s_keys, c_keys):
+        if s_vals.dtype == object or c_vals.dtype == object:
+            codes, _ = pd.factorize(np.concatenate([s_vals, c_vals]).astype(object))
+            s_codes, c_codes = codes[:len(s_vals)], codes[len(s_vals):]
+        else:
+            s_codes, c_codes = s_vals.astype(np.int64), c_vals.astype(np.int64)
+        for vals, codes, out in ((s_vals, s_codes, s_out), (c_vals, c_codes, c_out)):
+            present = np.ones(len(vals), dtype=bool) if empty is None else np.asarray(vals != empty, dtype=bool)
+            out.append((codes, present))
+    return s_out, c_out
+
+
+@timed("match.select")
+def select_classic_table(subj_df, src_df, pairs, rule_sets, *, is_hotel, max_comps, prop_type=None, cascading=True, memo=None):
+    """select_comp_table() with classic selection, as array operations over all subjects at once.
+
+    Same comps in the same order: each tier's comp1 / comp2 / comp3
+    (pick_comps) come from grouped operations on the pairs, and the dedup
+    walk (within a tier, then across tiers as in cascade_picks) runs slot by
+    slot for every subject together. For selection repeated over one
+    candidate table, as in sweep_rules(); memo (a dict shared by those calls)
+    keeps each pair's distance.
+    """
+    metric_field, _, value_field = metric_fields(is_hotel, prop_type)
+    c_metric, c_value = num_col(src_df, metric_field), num_col(src_df, value_field)
+    s_metric, s_value = num_col(subj_df, metric_field), num_col(subj_df, value_field)
+    s_lat, s_lon = num_col(subj_df, "lat"), num_col(subj_df, "lon")
+    c_lat, c_lon = num_col(src_df, "lat"), num_col(src_df, "lon")
+    s_keys, c_keys = dedup_key_codes(subj_df, src_df, is_hotel)
+
+    subjects = pairs["subject"].to_numpy()
+    candidate = pairs["candidate"].to_numpy()
+    tier_bits = pairs["tier_bits"].to_numpy()
+
+    def pair_keys(pos):
+        rows = candidate[np.maximum(pos, 0)]
+        return [(codes[rows], present[rows] & (pos >= 0)) for codes, present in c_keys]
+
+    def clash(a, b):
+        out = np.zeros(len(a[0][0]), dtype=bool)
+        for (codes_a, present_a), (codes_b, present_b) in zip(a, b):
+            out |= present_a & present_b & (codes_a == codes_b)
+        return out
+
+    n_tiers = len(rule_sets) if cascading else 1
+    width = min(max_comps, 3 * n_tiers)
+    chosen = np.full((len(subj_df), width), -1, dtype=np.int64)  # pair positions, in pick order
+    chosen_tier = np.zeros((len(subj_df), width), dtype=np.int64)
+    count = np.zeros(len(subj_df), dtype=np.int64)
+
+    for tier in range(n_tiers):
+        kept = np.flatnonzero(((tier_bits >> tier) & 1) == 1)
+        if len(kept) == 0:
+            continue
+        owner = subjects[kept]
+        starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+        sizes = np.diff(np.r_[starts, len(kept)])
+        rows = owner[starts]
+
+        # comp1: closest value among the highest-metric group (first on ties);
+        # comp2: lowest metric; comp3: the middle one.
+        top = c_metric[candidate[kept]] == np.repeat(c_metric[candidate[kept[starts]]], sizes)
+        top_pos, top_owner = kept[top], owner[top]
+        diff = np.abs(c_value[candidate[top_pos]] - s_value[top_owner])
+        diff = np.where(np.isnan(diff), np.inf, diff)
+        order = np.lexsort((top_pos, diff, top_owner))
+        top_pos, top_owner = top_pos[order], top_owner[order]
+        comp1 = top_pos[np.flatnonzero(np.r_[True, top_owner[1:] != top_owner[:-1]])]
+        comp2 = kept[starts + sizes - 1]
+        comp3 = kept[starts + sizes // 2]
+
+        subj_keys = [(codes[rows], present[rows]) for codes, present in s_keys]
+        tier_picks = np.full((len(rows), 3), -1, dtype=np.int64)
+        tier_count = np.zeros(len(rows), dtype=np.int64)
+        for j, slot in enumerate((comp1, comp2, comp3)):
+            keys = pair_keys(slot)
+            ok = (tier_count < max_comps) & ~clash(keys, subj_keys)
+            for q in range(j):
+                ok &= ~clash(keys, pair_keys(tier_picks[:, q]))
+            tier_picks[ok, j] = slot[ok]
+            tier_count += ok
+
+        for j in range(3):
+            slot = tier_picks[:, j]
+            keys = pair_keys(slot)
+            ok = (slot >= 0) & (count[rows] < max_comps)
+            for q in range(width):
+                ok &= ~clash(keys, pair_keys(chosen[rows, q]))
+            take = rows[ok]
+            chosen[take, count[take]] = slot[ok]
+            chosen_tier[take, count[take]] = tier
+            count[take] += 1
+
+    memo = {} if memo is None else memo
+    subject, rank = np.nonzero(chosen >= 0)
+    picked = chosen[subject, rank]
+    source = candidate[picked]
+    for pos in set(picked.tolist()).difference(memo):
+        coords = np.array([s_lat[subjects[pos]], s_lon[subjects[pos]], c_lat[candidate[pos]], c_lon[candidate[pos]]])
+        memo[pos] = np.nan if np.isnan(coords).any() else haversine(*coords)
+    distance = np.array([memo[pos] for pos in picked.tolist()], dtype=float)
+    return pd.DataFrame({
+        "subject": subject.astype(np.int64),
+        "rank": rank.astype(np.int64),
+        "source": source.astype(np.int64),
+        "tier": chosen_tier[subject, rank],
+        "distance": distance,
+        "gap": s_metric[subject] - c_metric[source],
+    })
+
+
+def match_comp_table(
+    subj_df,
+    src_df,
+    rule_sets,
+    *,
+    is_hotel,
+    use_hotel_class_rule,
+    max_comps,
+    prop_type=None,
+    desc_rule=False,
+    cascading=True,
+    spatial_index=None,
+    metric_index=None,
+    chunk_size=BATCH_CHUNK_PAIRS,
+    progress=None,
+    selection="classic",
+):
+    """Batch join + selection: the long comp table (see select_comp_table) for every subject."""
+    pairs = match_candidates_batch(
+        subj_df,
+        src_df,
+        rule_sets,
+        is_hotel=is_hotel,
+        use_hotel_class_rule=use_hotel_class_rule,
+        prop_type=prop_type,
+        desc_rule=desc_rule,
+        spatial_index=spatial_index,
+        metric_index=metric_index,
+        chunk_size=chunk_size,
+        progress=progress,
+    )
+    return select_comp_table(
+        subj_df,
+        src_df,
+        pairs,
+        rule_sets,
+        is_hotel=is_hotel,
+        max_comps=max_comps,
+        prop_type=prop_type,
+        cascading=cascading,
+        selection=selection,
+    )
+
+
+OUTPUT_COLS_HOTEL = [
+    "Property Account No", "Hotel Name", "Rooms", "VPR", "Property Address",
+    "Property City", "Property County", "Property State", "Property Zip Code",
+    "Assessed Value-2023", "Market Value-2023", "Hotel Class", "description",
+    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
+    "Owner State", "Owner ZIP", "Contact Person", "Designation"
+]
+
+OUTPUT_COLS_OTHER = [
+    "Property Account No", "GBA", "VPU", "Property Address",
+    "Property City", "Property County", "Property State", "Property Zip Code",
+    "Assessed Value-2023", "Total Market value-2023", "description",
+    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
+    "Owner State", "Owner ZIP"
+]
+
+
+def output_values(df, col, rows):
+    """Values of output column `col` at positions `rows` (object array); "" if df lacks it."""
+    if col == "Hotel Class":
+        col = "Hotel class values"
+    elif col == "Property County" and col not in df.columns:
+        col = "County"
+    if col not in df.columns:
+        return np.full(len(rows), "", dtype=object)
+    values = df[col].iloc[rows]
+    if values.dtype in (np.float32, np.float16):  # compact_pool() narrowed it losslessly
+        values = values.astype(np.float64)
+    return values.to_numpy(dtype=object)
+
+
+# ==========================================
+# 3. PARALLEL MATCHING
+# ==========================================
+
+# Per-process state for pool workers: the source pool and its indexes arrive
+# once through the initializer instead of being pickled with every task.
+_WORKER_STATE = {}
+
+
+def _init_worker(src_df, spatial_index, metric_index, settings):
+    _WORKER_STATE["src"] = src_df
+    _WORKER_STATE["spatial_index"] = spatial_index
+    _WORKER_STATE["metric_index"] = metric_index
+    _WORKER_STATE["settings"] = settings
+
+
+def _match_worker_chunk(subj_chunk):
+    return match_comp_table(
+        subj_chunk,
+        _WORKER_STATE["src"],
+        spatial_index=_WORKER_STATE["spatial_index"],
+        metric_index=_WORKER_STATE["metric_index"],
+        **_WORKER_STATE["settings"],
+    )
+
+
+@timed("match.parallel")
+def match_comp_table_parallel(
+    subj_df,
+    src_df,
+    rule_sets,
+    *,
+    workers=None,
+    spatial_index=None,
+    metric_index=None,
+    chunks_per_worker=4,
+    progress=None,
+    **settings,
+):
+    """match_comp_table() spread over a process pool; the table stays in subject order.
+
+    Subjects are split into contiguous chunks (about `chunks_per_worker` per
+    worker so progress keeps moving); `progress(done, total)` is called as
+    chunks finish. Falls back to the serial path for one worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = len(subj_df)
+    if workers <= 1 or total <= 1:
+        return match_comp_table(
+            subj_df, src_df, rule_sets,
+            spatial_index=spatial_index, metric_index=metric_index,
+            progress=progress, **settings,
+        )
+
+    n_chunks = min(total, workers * chunks_per_worker)
+    bounds = np.linspace(0, total, n_chunks + 1).astype(int)
+    starts = [a for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    chunks = [subj_df.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    results = [None] * len(chunks)
+    done = 0
+    # "spawn" keeps workers independent of the caller's threads (Streamlit runs
+    # scripts on a thread) and behaves the same on Windows, macOS and Linux.
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(src_df, spatial_index, metric_index, dict(settings, rule_sets=rule_sets)),
+    ) as pool:
+        futures = {pool.submit(_match_worker_chunk, chunk): k for k, chunk in enumerate(chunks)}
+        try:
+            for fut in as_completed(futures):
+                k = futures[fut]
+                table = fut.result()
+                table["subject"] += starts[k]  # chunk positions -> subj_df positions
+                results[k] = table
+                done += len(chunks[k])
+                if progress is not None:
+                    progress(done, total)
+        except BaseException:
+            # e.g. a cancelled job's progress callback: skip the chunks not yet started
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    return pd.concat(results, ignore_index=True)
+
+
+# ==========================================
+# 4. PIPELINE: INGEST → NORMALIZE → MATCH → ASSEMBLE → EXPORT
+# ==========================================
+
+PROPERTY_TYPES = ["Hotel", "Apartment", "Office", "Warehouse", "Retail"]
+DESC_RULE_TYPES = ("Retail", "Warehouse")  # comps must share the description
+
+NUMERIC_COLS = [
+    "Property Zip Code", "Rooms", "Units", "GBA", "VPR", "VPU",
+    "Market Value-2023", "Total Market value-2023", "lat", "lon",
+]
+
+MAIN_BAND = 0.50  # 50–100% VPU/VPR
+
+RULE_SETS = [
+    {
+        "name": "Static_7mi",
+        "max_radius_miles": 7.0,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": 0.50,
+        "max_gap_pct_size": 0.50,
+    },
+    {
+        "name": "Static_15mi",
+        "max_radius_miles": 15.0,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": 0.50,
+        "max_gap_pct_size": 0.50,
+    },
+    {
+        "name": "Category 1",
+        "max_radius_miles": 10.0,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": 0.80,
+        "max_gap_pct_size": 0.80,
+    },
+    {
+        "name": "Category 2",
+        "max_radius_miles": 15.0,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": 1.20,
+        "max_gap_pct_size": 1.20,
+    },
+    {
+        "name": "Category 3",
+        "max_radius_miles": 15.0,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": 1.50,
+        "max_gap_pct_size": 1.50,
+    },
+]
+
+
+def single_mode_rules(rule_mode, category=None):
+    """Distance + bands for the primary (single) mode – used when cascading is OFF."""
+    if rule_mode == "Static":
+        value_size, radius = 0.50, 7.0
+    elif category == "Category 1":
+        value_size, radius = 0.80, 10.0
+    elif category == "Category 2":
+        value_size, radius = 1.20, 15.0
+    else:
+        value_size, radius = 1.50, 15.0
+    return {
+        "name": rule_mode,
+        "max_radius_miles": radius,
+        "max_gap_pct_main": MAIN_BAND,
+        "max_gap_pct_value": value_size,
+        "max_gap_pct_size": value_size,
+    }
+
+
+def required_columns(prop_type):
+    if prop_type == "Hotel":
+        return ["Property Zip Code", "Class_Num", "VPR", "Rooms"]
+    if prop_type == "Apartment":
+        return ["Property Zip Code", "VPU", "Units"]
+    return ["Property Zip Code", "VPU", "GBA"]
+
+
+# Every column the pipeline reads (after header stripping); anything else in
+# the uploaded files is skipped at parse time.
+INGEST_COLS = frozenset(
+    set(OUTPUT_COLS_HOTEL)
+    | set(OUTPUT_COLS_OTHER)
+    | set(NUMERIC_COLS)
+    | {"Concat", "Hotel class values", "Class", "County", "description"}
+)
+ID_TEXT_COLS = ("Property Account No", "Concat")  # keep leading zeros in CSV input
+
+PARALLEL_READ_MIN_BYTES = 8 * 1024 * 1024  # below this, a second process costs more than it saves
+
+
+def table_format(file):
+    """"excel", "csv" or "parquet" from the file name, else from the leading bytes."""
+    name = file if isinstance(file, (str, os.PathLike)) else getattr(file, "name", "")
+    ext = os.path.splitext(str(name))[1].lower()
+    if ext in (".xlsx", ".xlsm", ".xls"):
+        return "excel"
+    if ext in (".csv", ".txt"):
+        return "csv"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fh:
+            head = fh.read(4)
+    elif isinstance(file, (bytes, bytearray)):
+        head = bytes(file[:4])
+    else:
+        pos = file.tell()
+        head = file.read(4)
+        file.seek(pos)
+    if head == b"PAR1":
+        return "parquet"
+    if head.startswith(b"PK"):
+        return "excel"
+    return "csv"
+
+
+@timed("ingest.read")
+def read_table(file, columns=None):
+    """Read an uploaded or on-disk .xlsx / .csv / .parquet file into a DataFrame.
+
+    `columns` (stripped header names) limits parsing to the columns the
+    pipeline uses; missing ones are simply absent.
+    """
+    fmt = table_format(file)
+    if isinstance(file, (bytes, bytearray)):
+        file = io.BytesIO(file)
+    keep = None if columns is None else (lambda c: str(c).strip() in columns)
+
+    if fmt == "parquet":
+        if keep is None:
+            return pd.read_parquet(file)
+        import pyarrow.parquet as pq
+
+        names = pq.ParquetFile(file).schema_arrow.names
+        if hasattr(file, "seek"):
+            file.seek(0)
+        return pd.read_parquet(file, columns=[c for c in names if keep(c)])
+
+    if fmt == "csv":
+        header = pd.read_csv(file, nrows=0).columns
+        if hasattr(file, "seek"):
+            file.seek(0)
+        text_cols = {c: str for c in header if str(c).strip() in ID_TEXT_COLS}
+        return pd.read_csv(
+            file, usecols=keep, dtype=text_cols or None, float_precision="round_trip"
+        )
+
+    return pd.read_excel(file, usecols=keep, engine=EXCEL_ENGINE)
+
+
+@timed("ingest.normalize")
+def normalize_frame(df, prop_type):
+    """Clean headers, account numbers, classes, numerics and longitude sign in place.
+
+    Each file is normalized on its own (so a parsed Data Source can be cached);
+    the description rule only applies when both frames end up with _desc_norm.
+    The _key_* dedup columns are derived last, from the cleaned values.
+    """
+    df.columns = df.columns.str.strip()
+
+    desc_col = "description"
+
+    if desc_col in df.columns and prop_type != "Hotel":
+        df["_desc_norm"] = df[desc_col].apply(norm_desc)
+
+    if "Property Account No" in df.columns:
+        df["Property Account No"] = (
+            df["Property Account No"]
+            .astype(str)
+            .str.strip()
+        )
+    elif "Concat" in df.columns:
+        df["Property Account No"] = (
+            df["Concat"].astype(str).str.extract(r"(\d+)", expand=False)
+        )
+
+    if "Hotel class values" in df.columns:
+        df["Class_Num"] = df["Hotel class values"].apply(norm_class)
+    elif "Class" in df.columns:
+        df["Class_Num"] = df["Class"].apply(norm_class)
+    else:
+        df["Class_Num"] = np.nan
+
+    for c in NUMERIC_COLS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    if "lon" in df.columns:
+        df["lon"] = df["lon"].apply(
+            lambda x: -abs(x) if pd.notna(x) else x
+        )
+
+    add_dedup_keys(df)
+
+    return df
+
+
+# Text columns with at most this share of distinct values become categoricals.
+COMPACT_MAX_DISTINCT = 0.5
+COMPACT_CODED_COLS = ("_desc_norm", *DEDUP_KEY_COLS)  # always categorical: the matcher uses their codes
+
+
+@timed("ingest.compact")
+def compact_pool(df):
+    """Shrink a normalized Data Source in place for matching; returns it.
+
+    Repeated text (cities, owners, descriptions, dedup keys) becomes
+    categorical, other text Arrow-backed strings, and each float64 column
+    the narrowest float that holds every value exactly (Class_Num as
+    float16, zip codes as float32; coordinates usually stay float64), so
+    matches and output values don't change. A 1M-row roll shrinks several
+    times over. Missing values are all the one NaN (see canonical_nans()).
+    """
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == np.float64:
+            arr = values.to_numpy()
+            for dtype in (np.float16, np.float32):
+                with np.errstate(over="ignore"):
+                    narrow = arr.astype(dtype)
+                if np.array_equal(narrow.astype(np.float64), arr, equal_nan=True):
+                    narrow[np.isnan(narrow)] = np.nan
+                    df[col] = narrow
+                    break
+        elif values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+            if col in COMPACT_CODED_COLS or values.nunique() <= len(values) * COMPACT_MAX_DISTINCT:
+                df[col] = values.astype("category")
+            elif values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == "string":
+                df[col] = values.astype("str")
+    return df
+
+
+def canonical_nans(df):
+    """Store every NaN in df's float columns (in place) as numpy's own NaN; returns df.
+
+    NaNs differ in their bits (Parquet reads float16 nulls back as 0x7FFF,
+    a cast gives 0x7E00), which hashing and byte comparisons would see.
+    """
+    for col in df.columns:
+        if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind == "f":
+            arr = df[col].to_numpy()
+            missing = np.isnan(arr)
+            if missing.any():
+                arr = arr.copy()
+                arr[missing] = np.nan
+                df[col] = arr
+    return df
+
+
+def load_source_pool(file, prop_type, cache=None, columns=INGEST_COLS):
+    """read_table + normalize_frame + compact_pool for a Data Source, through a comps_cache.PoolCache when given.
+
+    A cached pool comes back as compact_pool() made it, NaNs included.
+    """
+    if cache is None:
+        return compact_pool(normalize_frame(read_table(file, columns), prop_type))
+
+    settings = {
+        "desc_norm": prop_type != "Hotel",
+        "columns": None if columns is None else sorted(columns),
+    }
+    with stage("ingest.cache"):
+        key = cache.key(file_digest(file), settings)
+        df = cache.get(key)
+        if df is not None:
+            canonical_nans(df)
+    if df is None:
+        df = compact_pool(normalize_frame(read_table(file, columns), prop_type))
+        with stage("ingest.cache"):
+            cache.put(key, df)
+    return df
+
+
+def _file_size(file):
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    if isinstance(file, (bytes, bytearray)):
+        return len(file)
+    return getattr(file, "size", 0) or len(file.getvalue())
+
+
+def _portable(file):
+    # Uploads can't cross a process boundary; hand workers the bytes + name.
+    if isinstance(file, (str, os.PathLike, bytes, bytearray)):
+        return file
+    data = io.BytesIO(file.getvalue())
+    data.name = getattr(file, "name", "")
+    return data
+
+
+@timed("ingest")
+def read_inputs(subj_file, src_file, prop_type, *, cache=None, columns=INGEST_COLS, parallel=True):
+    """Parse and normalize the Subject and Data Source files, concurrently when worthwhile.
+
+    Excel parsing holds the GIL, so two large workbooks are read in two
+    processes; CSV/Parquet readers release it and share a thread pool.
+    """
+    formats = {table_format(subj_file), table_format(src_file)}
+    big = _file_size(subj_file) + _file_size(src_file) >= PARALLEL_READ_MIN_BYTES
+
+    if not parallel or not big:
+        subj = normalize_frame(read_table(subj_file, columns), prop_type)
+        return subj, load_source_pool(src_file, prop_type, cache, columns)
+
+    if "excel" in formats:
+        pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+        subj_file, src_file = _portable(subj_file), _portable(src_file)
+    else:
+        pool = ThreadPoolExecutor(max_workers=2)
+    with pool:
+        if isinstance(pool, ThreadPoolExecutor):
+            # Threads run in a copy of this context so their stages are timed too.
+            subj_job = pool.submit(contextvars.copy_context().run, read_table, subj_file, columns)
+            src_job = pool.submit(
+                contextvars.copy_context().run, load_source_pool, src_file, prop_type, cache, columns
+            )
+        else:
+            subj_job = pool.submit(read_table, subj_file, columns)
+            src_job = pool.submit(load_source_pool, src_file, prop_type, cache, columns)
+        subj = normalize_frame(subj_job.result(), prop_type)
+        return subj, src_job.result()
+
+
+@timed("validate")
+def validate_frames(subj, src, required_cols):
+    """Check required columns and drop rows with nulls in them.
+
+    Returns a report dict: missing columns per file, null counts, row counts
+    before/after and the filtered frames (None when columns are missing).
+    """
+    report = {
+        "missing_subj_cols": [c for c in required_cols if c not in subj.columns],
+        "missing_src_cols": [c for c in required_cols if c not in src.columns],
+        "subj": None,
+        "src": None,
+    }
+    if report["missing_subj_cols"] or report["missing_src_cols"]:
+        return report
+
+    report["subj_nulls"] = {c: int(subj[c].isna().sum()) for c in required_cols}
+    report["src_nulls"] = {c: int(src[c].isna().sum()) for c in required_cols}
+    report["subj_before"], report["src_before"] = len(subj), len(src)
+    report["subj"] = subj.dropna(subset=required_cols)
+    report["src"] = src.dropna(subset=required_cols)
+    return report
+
+
+@timed("assemble")
+def assemble_results(subj_df, src_df, table, *, output_cols, metric_field, max_comps, rule_sets, cascading, rule_mode):
+    """Wide results: Subject_* columns then CompN_* columns for every comp slot.
+
+    Built column by column from the long comp table (select_comp_table): each
+    output field is gathered once for all chosen comps, then scattered into
+    its CompN slot; empty slots are "".
+    """
+    n = len(subj_df)
+    subject = table["subject"].to_numpy()
+    rank = table["rank"].to_numpy()
+    source = table["source"].to_numpy()
+    tier = table["tier"].to_numpy()
+
+    gathered = {c: output_values(src_df, c, source) for c in output_cols}
+    gathered["Match_Method"] = np.array(
+        [f"Within {r['max_radius_miles']} Miles" for r in rule_sets], dtype=object
+    )[tier]
+    if cascading:
+        gathered["Rule_Set"] = np.array([r["name"] for r in rule_sets], dtype=object)[tier]
+    else:
+        gathered["Rule_Set"] = np.full(len(table), rule_mode, dtype=object)
+    distance = table["distance"].to_numpy()
+    gathered["Distance_Miles"] = np.where(
+        np.isnan(distance), "N/A", np.char.mod("%.2f", distance)
+    ).astype(object)
+    gathered[f"{metric_field}_Gap"] = np.char.mod("%.2f", table["gap"].to_numpy()).astype(object)
+
+    all_rows = np.arange(n)
+    columns = {f"Subject_{c}": output_values(subj_df, c, all_rows) for c in output_cols}
+    for k in range(max_comps):
+        in_slot = rank == k
+        slot_subjects = subject[in_slot]
+        for field, values in gathered.items():
+            col = np.full(n, "", dtype=object)
+            col[slot_subjects] = values[in_slot]
+            columns[f"Comp{k+1}_{field}"] = col
+    return pd.DataFrame(columns).infer_objects()
+
+
+def float_or_zero(df, col):
+    """df[col] as floats, 0.0 where the column is missing or a value doesn't parse (NaN stays NaN)."""
+    if col not in df.columns:
+        return np.zeros(len(df))
+    s = df[col]
+    if pd.api.types.is_numeric_dtype(s):
+        return s.to_numpy(dtype=float)
+    parsed = pd.to_numeric(s, errors="coerce")
+    return np.where(parsed.isna() & s.notna(), 0.0, parsed.to_numpy(dtype=float))
+
+
+def comp_metric_matrix(results, metric_field, max_comps):
+    """(metrics, counts) from the CompN_<metric> result columns.
+
+    metrics is subjects x comp slots, NaN where a slot is empty; counts is how
+    many slots per subject hold a comp metric (a NaN metric still counts).
+    """
+    metrics = np.full((len(results), max_comps), np.nan)
+    counts = np.zeros(len(results), dtype=np.int64)
+    for k in range(max_comps):
+        col = results.get(f"Comp{k+1}_{metric_field}")
+        if col is None:
+            continue
+        filled = ~col.isin(["", "N/A"])
+        parsed = pd.to_numeric(col.where(filled), errors="coerce")
+        metrics[:, k] = parsed.to_numpy(dtype=float)
+        counts += (filled & (parsed.notna() | col.isna())).to_numpy()
+    return metrics, counts
+
+
+def overpaid_values(metrics, counts, subj_df, *, is_hotel, base_dim, pct):
+    """Overpaid estimate per subject from the median comp metric; "" when a subject has no comp.
+
+    (market value - median comp metric * base dimension) * pct, with the
+    dimension and market value read as in the results (missing -> 0).
+    """
+    median = np.full(len(metrics), np.nan)
+    has_metric = ~np.isnan(metrics).all(axis=1)
+    median[has_metric] = np.nanmedian(metrics[has_metric], axis=1)
+
+    if base_dim:
+        dim_col = base_dim if base_dim in ("Rooms", "Units") else "GBA"
+        subj_dim = float_or_zero(subj_df, dim_col)
+    else:
+        subj_dim = np.zeros(len(subj_df))
+    subj_mv = float_or_zero(subj_df, "Market Value-2023" if is_hotel else "Total Market value-2023")
+
+    value = subj_mv * pct - median * subj_dim * pct
+    return np.where(counts > 0, value.astype(object), "")
+
+
+@timed("assemble.overpaid")
+def set_overpaid(results, subj_df, *, prop_type, max_comps, use_overpaid, base_dim=None, pct=0.0):
+    """Fill Subject_Overpaid_Value in a results table (or frame) built for subj_df.
+
+    A post-pass over the CompN metric columns, so the overpaid settings can be
+    changed and recomputed without matching again.
+    """
+    is_hotel = prop_type == "Hotel"
+    if use_overpaid:
+        metric_field = "VPR" if is_hotel else "VPU"
+        metrics, counts = comp_metric_matrix(results, metric_field, max_comps)
+        results["Subject_Overpaid_Value"] = overpaid_values(
+            metrics, counts, subj_df, is_hotel=is_hotel, base_dim=base_dim, pct=pct
+        )
+    else:
+        results["Subject_Overpaid_Value"] = ""
+    return results
+
+
+RESULT_CHUNK_SUBJECTS = 500  # subjects per results frame from iter_result_frames()
+
+
+def run_matching(subj, src, **options):
+    """iter_result_frames() concatenated into the results table."""
+    frames = list(iter_result_frames(subj, src, **options))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def match_rules_for(use_cascading=True, rule_mode="Static", category=None, rule_sets=None):
+    """Rule tiers a run matches with: the cascade, or the single rule set of rule_mode."""
+    if use_cascading:
+        return rule_sets if rule_sets is not None else RULE_SETS
+    return [single_mode_rules(rule_mode, category)]
+
+
+# Subject fields that can change a subject's comps: rows equal on all of them
+# get the same comps (see subject_match_hashes).
+MATCH_INPUT_COLS = [
+    "VPR", "VPU", "Rooms", "Units", "GBA", "Market Value-2023", "Total Market value-2023",
+    "Class_Num", "lat", "lon", "_desc_norm", *DEDUP_KEY_COLS,
+]
+COMP_PICK_COLUMNS = ["source", "tier", "distance", "gap"]  # a cached subject's comp table rows
+
+
+def subject_match_hashes(subj):
+    """uint64 hash of each subject row's MATCH_INPUT_COLS.
+
+    Dedup keys missing from `subj` are derived as the matcher derives them,
+    so subjects with different accounts or owners never hash alike.
+    """
+    cols = [c for c in MATCH_INPUT_COLS if c in subj.columns and c not in DEDUP_KEY_COLS]
+    keys = _with_dedup_keys(subj)[list(DEDUP_KEY_COLS)]
+    return pd.util.hash_pandas_object(pd.concat([subj[cols], keys], axis=1), index=False).to_numpy()
+
+
+def subject_cache_keys(subj, run_key, row_hash=None):
+    """One CompCache key per subject row: run_key plus its subject_match_hashes()."""
+    if row_hash is None:
+        row_hash = subject_match_hashes(subj)
+    return [f"{run_key}:{h:016x}" for h in row_hash]
+
+
+def fan_out(table, groups):
+    """Comp table for every subject, from `table` over group representatives.
+
+    groups[i] is the representative (table subject) of subject i; each member
+    gets a copy of its representative's rows.
+    """
+    subjects = table["subject"].to_numpy()
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+    bounds = np.searchsorted(subjects, np.arange(n_groups + 1))
+    lengths = np.diff(bounds)[groups]
+    total = int(lengths.sum())
+    ends = np.cumsum(lengths)
+    rows = np.arange(total) - np.repeat(ends - lengths, lengths) + np.repeat(bounds[:-1][groups], lengths)
+    out = table.iloc[rows].reset_index(drop=True)
+    out["subject"] = np.repeat(np.arange(len(groups), dtype=np.int64), lengths)
+    return out
+
+
+@timed("match")
+def match_results(
+    subj,
+    src,
+    *,
+    prop_type,
+    use_cascading=True,
+    max_comps=3,
+    rule_mode="Static",
+    category=None,
+    rule_sets=None,
+    workers=1,
+    scan_progress=None,
+    comp_cache=None,
+    selection="classic",
+):
+    """Match validated subject/source frames into the long comp table (see select_comp_table).
+
+    iter_result_frames(comp_table=...) builds the results from it, so output
+    settings such as the overpaid analysis can change without matching again.
+    With a comps_cache.CompCache, subjects whose matching fields, pool and
+    settings were seen before reuse their stored comps and only the rest are
+    matched; the table's attrs["cached_subjects"] says how many were reused.
+    Subjects equal on every MATCH_INPUT_COLS field are matched once and share
+    the comps; attrs["shared_subjects"] is the number of matcher runs saved.
+    scan_progress(done, total) follows the candidate scan; `selection` names
+    a SELECTION_STRATEGIES entry.
+    """
+    match_rules = match_rules_for(use_cascading, rule_mode, category, rule_sets)
+    selection_strategy(selection)  # fail before any matching
+    options = dict(
+        prop_type=prop_type, use_cascading=use_cascading, max_comps=max_comps,
+        match_rules=match_rules, workers=workers, scan_progress=scan_progress,
+        selection=selection,
+    )
+
+    # Rows equal on every matching field share one matcher run.
+    row_hash = subject_match_hashes(subj)
+    groups, unique_hash = pd.factorize(row_hash)
+    first = np.full(len(unique_hash), len(subj), dtype=np.int64)
+    np.minimum.at(first, groups, np.arange(len(subj)))
+    unique_subj = subj.iloc[first]
+
+    if comp_cache is None:
+        table, cached = _match_table(unique_subj, src, **options), np.zeros(len(first), dtype=bool)
+    else:
+        table, cached = _match_cached(unique_subj, src, comp_cache, unique_hash, **options)
+    table = fan_out(table, groups)
+    table.attrs["cached_subjects"] = int(cached[groups].sum())
+    table.attrs["shared_subjects"] = len(subj) - len(first)
+    return table
+
+
+def _match_cached(subj, src, comp_cache, row_hash, **options):
+    """_match_table() through a CompCache: (table, which subjects came from the cache)."""
+    with stage("match.cache"):
+        run_key = comp_cache.key({
+            "pool": frame_digest(src),
+            "prop_type": options["prop_type"],
+            "cascading": bool(options["use_cascading"]),
+            "max_comps": int(options["max_comps"]),
+            "selection": options["selection"],
+            "rule_sets": options["match_rules"],
+            "subject_cols": [c for c in MATCH_INPUT_COLS if c in subj.columns],
+        })
+        keys = subject_cache_keys(subj, run_key, row_hash)
+        found = comp_cache.get_many(keys)
+    cached = np.array([key in found for key in keys], dtype=bool)
+    todo = np.flatnonzero(~cached)
+
+    parts = []
+    if len(todo):
+        table = _match_table(subj.iloc[todo], src, **options)
+        subjects = table["subject"].to_numpy()
+        bounds = np.searchsorted(subjects, np.arange(len(todo) + 1))
+        picks = table[COMP_PICK_COLUMNS].to_numpy(dtype=np.float64)
+        with stage("match.cache"):
+            comp_cache.put_many({
+                keys[i]: picks[bounds[k]:bounds[k + 1]] for k, i in enumerate(todo)
+            })
+        table["subject"] = todo[subjects]
+        parts.append(table)
+
+    with stage("match.cache"):
+        hits = [(i, found[keys[i]]) for i in np.flatnonzero(cached)]
+        if hits:
+            rows = np.concatenate([p for _, p in hits])
+            counts = [len(p) for _, p in hits]
+            parts.append(pd.DataFrame({
+                "subject": np.repeat([i for i, _ in hits], counts).astype(np.int64),
+                "rank": np.concatenate([np.arange(n) for n in counts]).astype(np.int64),
+                "source": rows[:, 0].astype(np.int64),
+                "tier": rows[:, 1].astype(np.int64),
+                "distance": rows[:, 2],
+                "gap": rows[:, 3],
+            }))
+        if parts:
+            table = pd.concat(parts, ignore_index=True)
+            table = table.sort_values(["subject", "rank"], kind="stable", ignore_index=True)
+        else:
+            table = _match_table(subj.iloc[:0], src, **options)
+    return table, cached
+
+
+def _match_table(subj, src, *, prop_type, use_cascading, max_comps, match_rules, workers, scan_progress, selection):
+    is_hotel = prop_type == "Hotel"
+    metric_field = "VPR" if is_hotel else "VPU"
+    desc_rule = (
+        prop_type in DESC_RULE_TYPES
+        and "_desc_norm" in subj.columns
+        and "_desc_norm" in src.columns
+    )
+
+    with stage("match.index"):
+        src_index = SpatialIndex(src)
+        metric_index = MetricIndex.for_frame(
+            src, metric_field, group_col="_desc_norm" if desc_rule else None
+        )
+    # The app has always matched without prop_type, so every non-hotel type
+    # (Apartment included) uses the GBA size band; kept for identical output.
+    match_settings = dict(
+        is_hotel=is_hotel,
+        use_hotel_class_rule=is_hotel,
+        max_comps=max_comps,
+        desc_rule=desc_rule,
+        cascading=use_cascading,
+        selection=selection,
+    )
+    if workers and workers > 1:
+        return match_comp_table_parallel(
+            subj, src, match_rules,
+            workers=int(workers), spatial_index=src_index, metric_index=metric_index,
+            progress=scan_progress, **match_settings,
+        )
+    return match_comp_table(
+        subj, src, match_rules,
+        spatial_index=src_index, metric_index=metric_index,
+        progress=scan_progress, **match_settings,
+    )
+
+
+# ---------- RULE SWEEP ----------
+
+SWEEP_KEYS = ("max_radius_miles", "max_gap_pct_main", "max_gap_pct_value", "max_gap_pct_size")
+SWEEP_COVERAGE = ["0 comps", "1 comp", "2 comps", "3+ comps"]
+
+
+def rule_grid(**axes):
+    """Every combination of the given rule values, as sweep_rules() settings.
+
+    rule_grid(max_radius_miles=[5, 7, 10], max_gap_pct_value=[0.3, 0.5]) is
+    six settings. A number applies to every tier of the run; a tuple gives
+    one value per tier (e.g. radii (7, 15, 10, 15, 15) for the cascade).
+    """
+    unknown = sorted(set(axes) - set(SWEEP_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown rule keys {unknown}; expected some of {list(SWEEP_KEYS)}")
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*(axes[k] for k in keys))]
+
+
+def apply_rule_setting(rule_sets, setting):
+    """Copy of rule_sets with a sweep setting's values in place (see rule_grid)."""
+    out = []
+    for k, rules in enumerate(rule_sets):
+        rules = dict(rules)
+        for key, value in setting.items():
+            if key not in SWEEP_KEYS:
+                raise ValueError(f"Unknown rule key {key!r}; expected one of {list(SWEEP_KEYS)}")
+            if isinstance(value, (list, tuple)):
+                if len(value) != len(rule_sets):
+                    raise ValueError(f"{key} gives {len(value)} values for {len(rule_sets)} rule tiers")
+                value = value[k]
+            rules[key] = float(value)
+        out.append(rules)
+    return out
+
+
+def _setting_value(value):
+    """A setting's value for display: the number, or per-tier values as "7/15/10/15/15"."""
+    if isinstance(value, (list, tuple)):
+        return "/".join(f"{float(v):g}" for v in value)
+    return float(value)
+
+
+def setting_label(setting):
+    """"max_radius_miles=10, max_gap_pct_value=0.8" for a sweep setting."""
+    parts = []
+    for key, value in setting.items():
+        value = _setting_value(value)
+        parts.append(f"{key}={value:g}" if isinstance(value, float) else f"{key}={value}")
+    return ", ".join(parts) or "current rules"
+
+
+@timed("sweep")
+def sweep_rules(
+    subj,
+    src,
+    settings,
+    *,
+    prop_type,
+    use_cascading=True,
+    max_comps=3,
+    rule_mode="Static",
+    category=None,
+    rule_sets=None,
+    selection="classic",
+    progress=None,
+):
+    """Match validated frames under many rule settings (rule_grid) from one candidate scan.
+
+    The scan runs once with the loosest value of every rule over all the
+    settings and keeps each pair's distance and gap ratios; a setting then
+    just re-thresholds those into its tiers and picks comps, for all subjects
+    at once with classic selection (select_classic_table); with another
+    strategy, a subject whose tiers hold the same candidates as under an
+    earlier setting reuses those picks. Each setting's comps are what
+    match_results() gives with its rules. progress(done, total) follows the
+    scan.
+
+    Returns {"summary": one row per setting (its values, how many subjects
+    got 0 / 1 / 2 / 3+ comps, mean candidates per subject), "candidates":
+    candidate count per subject (rows) and setting (columns), "comps": the
+    settings' comp tables (see select_comp_table) with a "setting" column}.
+    """
+    if not settings:
+        raise ValueError("No rule settings to sweep.")
+    selection_strategy(selection)  # fail before any matching
+    base = match_rules_for(use_cascading, rule_mode, category, rule_sets)
+    setting_rules = [apply_rule_setting(base, setting) for setting in settings]
+    labels = [setting_label(setting) for setting in settings]
+
+    # The loosest rules, plus each radius so rows on one are settled exactly.
+    envelope = {"name": "sweep", **{
+        key: max(rules[key] for tiers in setting_rules for rules in tiers) for key in SWEEP_KEYS
+    }}
+    radii = sorted({rules["max_radius_miles"] for tiers in setting_rules for rules in tiers})
+    if len(radii) > 62:
+        raise ValueError(f"A sweep can try at most 62 distinct radii, not {len(radii)}.")
+    scan_rules = [envelope] + [dict(envelope, max_radius_miles=radius) for radius in radii]
+
+    is_hotel = prop_type == "Hotel"
+    metric_field = "VPR" if is_hotel else "VPU"
+    desc_rule = prop_type in DESC_RULE_TYPES and "_desc_norm" in subj.columns and "_desc_norm" in src.columns
+    with stage("match.index"):
+        src_index = SpatialIndex(src)
+        metric_index = MetricIndex.for_frame(src, metric_field, group_col="_desc_norm" if desc_rule else None)
+    # No prop_type, like _match_table(): every non-hotel type uses the GBA size band.
+    pairs = match_candidates_batch(
+        subj, src, scan_rules,
+        is_hotel=is_hotel, use_hotel_class_rule=is_hotel, desc_rule=desc_rule,
+        spatial_index=src_index, metric_index=metric_index, progress=progress, gaps=True,
+    )
+    gaps = {key: pairs[key].to_numpy() for key in ("main_pct", "value_pct", "size_pct")}
+    gaps["dist"] = pairs["distance"].to_numpy()
+    subjects = pairs["subject"].to_numpy()
+
+    memo, tables, summary = {}, [], []
+    candidates = np.zeros((len(subj), len(settings)), dtype=np.int64)
+    for k, tiers in enumerate(setting_rules):
+        with stage("sweep.setting", trace=False):
+            tier_bits, _ = assign_tiers(gaps, tiers)
+            pairs["tier_bits"] = tier_bits
+            if selection == "classic":
+                table = select_classic_table(
+                    subj, src, pairs, tiers,
+                    is_hotel=is_hotel, max_comps=max_comps, cascading=use_cascading, memo=memo,
+                )
+            else:
+                table = select_comp_table(
+                    subj, src, pairs, tiers,
+                    is_hotel=is_hotel, max_comps=max_comps, cascading=use_cascading,
+                    selection=selection, memo=memo,
+                )
+        candidates[:, k] = np.bincount(subjects[tier_bits != 0], minlength=len(subj))
+        n_comps = np.bincount(table["subject"].to_numpy(), minlength=len(subj))
+        coverage = np.bincount(np.minimum(n_comps, 3), minlength=4)
+        summary.append({
+            "setting": labels[k],
+            **{key: _setting_value(value) for key, value in settings[k].items()},
+            "subjects": len(subj),
+            **dict(zip(SWEEP_COVERAGE, coverage.tolist())),
+            "mean candidates": float(candidates[:, k].mean()) if len(subj) else 0.0,
+        })
+        table.insert(0, "setting", k)
+        tables.append(table)
+
+    swept = list(dict.fromkeys(key for setting in settings for key in setting))
+    return {
+        "summary": pd.DataFrame(summary, columns=["setting", *swept, "subjects", *SWEEP_COVERAGE, "mean candidates"]),
+        "candidates": pd.DataFrame(candidates, index=subj.index, columns=labels),
+        "comps": pd.concat(tables, ignore_index=True),
+    }
+
+
+# ---------- BATCH (EVERY PROPERTY TYPE) ----------
+
+PROPERTY_TYPE_COL = "Property Type"  # default column a batch splits the files on
+
+
+def property_type_names(values):
+    """PROPERTY_TYPES name of each value ("hotels", " Retail " ...), NaN where unknown."""
+    names = {}
+    for ptype in PROPERTY_TYPES:
+        names[ptype.lower()] = names[ptype.lower() + "s"] = ptype
+    values = pd.Series(values, dtype=object)
+    return values.map({v: names.get(str(v).strip().lower()) for v in pd.unique(values.dropna())})
+
+
+def split_by_property_type(df, type_col=PROPERTY_TYPE_COL):
+    """{property type: its rows of df}, in PROPERTY_TYPES order, plus None: rows of no known type.
+
+    Hotel rows lose _desc_norm, which normalize_frame() only adds for the
+    other types, so each part is what a run of its type alone would read.
+    """
+    names = property_type_names(df[type_col]).to_numpy()
+    parts = {}
+    for ptype in PROPERTY_TYPES:
+        rows = np.flatnonzero(names == ptype)
+        if len(rows):
+            part = df.iloc[rows]
+            parts[ptype] = part.drop(columns="_desc_norm", errors="ignore") if ptype == "Hotel" else part
+    unknown = np.flatnonzero(pd.isna(names))
+    if len(unknown):
+        parts[None] = df.iloc[unknown]
+    return parts
+
+
+def read_batch_inputs(subj_file, src_file, *, type_col=PROPERTY_TYPE_COL, cache=None, columns=INGEST_COLS, parallel=True):
+    """read_inputs() for files mixing property types: (subject parts, source parts) by type.
+
+    Each file is parsed and normalized once, then split on type_col (see
+    split_by_property_type()). ValueError if either file lacks the column.
+    """
+    if columns is not None:
+        columns = frozenset(columns) | {type_col}
+    # Normalized as a non-hotel type (with _desc_norm); the hotel parts drop it.
+    subj, src = read_inputs(subj_file, src_file, "Retail", cache=cache, columns=columns, parallel=parallel)
+    missing = [name for name, df in (("Subject", subj), ("Data Source", src)) if type_col not in df.columns]
+    if missing:
+        files = " and ".join(missing) + (" files have" if len(missing) > 1 else " file has")
+        raise ValueError(f"{files} no {type_col!r} column to split property types on.")
+    return split_by_property_type(subj, type_col), split_by_property_type(src, type_col)
+
+
+def default_overpaid_base(prop_type):
+    """Size column the overpaid amount is usually based on: Rooms, Units or GBA."""
+    return {"Hotel": "Rooms", "Apartment": "Units"}.get(prop_type, "GBA")
+
+
+def match_batch(subj_parts, src_parts, *, progress=None, **options):
+    """validate_frames() + match_results() for each property type of a batch (read_batch_inputs).
+
+    options are match_results()'s but prop_type. Returns {property type:
+    {"report", "subj", "src", "comp_table"}} for every type with subjects:
+    the report without its frames, and comp_table None when validation left
+    nothing to match. progress(prop_type, done, total) follows each scan,
+    from done = 0 as a type starts.
+    """
+    out = {}
+    for ptype, subj in subj_parts.items():
+        if ptype is None:
+            continue
+        src = src_parts.get(ptype)
+        if src is None:
+            src = src_parts[next(iter(src_parts))].iloc[:0] if src_parts else pd.DataFrame()
+        report = validate_frames(subj, src, required_columns(ptype))
+        subj, src = report.pop("subj"), report.pop("src")
+        report["subj_after"] = 0 if subj is None else len(subj)
+        report["src_after"] = 0 if src is None else len(src)
+        part = out[ptype] = {"report": report, "subj": subj, "src": src, "comp_table": None}
+        if subj is None or len(subj) == 0 or len(src) == 0:
+            continue
+        if progress is not None:
+            progress(ptype, 0, len(subj))
+        part["comp_table"] = match_results(
+            subj, src, prop_type=ptype,
+            scan_progress=None if progress is None else functools.partial(progress, ptype),
+            **options,
+        )
+    return out
+
+
+def iter_result_frames(
+    subj,
+    src,
+    *,
+    prop_type,
+    use_cascading=True,
+    max_comps=3,
+    rule_mode="Static",
+    category=None,
+    rule_sets=None,
+    use_overpaid=False,
+    overpaid_base_dim=None,
+    overpaid_pct=0.0,
+    workers=1,
+    scan_progress=None,
+    subject_progress=None,
+    comp_table=None,
+    comp_cache=None,
+    chunk_subjects=RESULT_CHUNK_SUBJECTS,
+    selection="classic",
+):
+    """Match validated subject/source frames, yielding the results table in chunks.
+
+    Each frame covers the next `chunk_subjects` subjects in order, so results
+    can be streamed to a writer (comps_output) without holding the table.
+    A comp_table from match_results() with the same matching options skips
+    the matching; otherwise comp_cache is passed on to it. scan_progress(done, total) follows the candidate scan;
+    subject_progress(i, srow) is called before the frame starting at subject i is built.
+    """
+    if comp_table is None:
+        comp_table = match_results(
+            subj, src,
+            prop_type=prop_type, use_cascading=use_cascading, max_comps=max_comps,
+            rule_mode=rule_mode, category=category, rule_sets=rule_sets,
+            workers=workers, scan_progress=scan_progress, comp_cache=comp_cache,
+            selection=selection,
+        )
+    is_hotel = prop_type == "Hotel"
+    output_cols = OUTPUT_COLS_HOTEL if is_hotel else OUTPUT_COLS_OTHER
+    metric_field = "VPR" if is_hotel else "VPU"
+    match_rules = match_rules_for(use_cascading, rule_mode, category, rule_sets)
+    bounds = np.searchsorted(comp_table["subject"].to_numpy(), np.arange(len(subj) + 1))
+
+    for start in range(0, len(subj), chunk_subjects):
+        stop = min(start + chunk_subjects, len(subj))
+        if subject_progress is not None:
+            subject_progress(start, subj.iloc[start])
+        subj_chunk = subj.iloc[start:stop]
+        part = comp_table.iloc[bounds[start]:bounds[stop]].copy()
+        part["subject"] -= start
+        frame = assemble_results(
+            subj_chunk, src, part,
+            output_cols=output_cols, metric_field=metric_field, max_comps=max_comps,
+            rule_sets=match_rules, cascading=use_cascading, rule_mode=rule_mode,
+        )
+        yield set_overpaid(
+            frame, subj_chunk,
+            prop_type=prop_type, max_comps=max_comps,
+            use_overpaid=use_overpaid, base_dim=overpaid_base_dim, pct=overpaid_pct,
+        )
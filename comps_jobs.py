@@ -0,0 +1,497 @@
+"""Background jobs: long matching runs off the Streamlit script thread.
+
+A JobRunner runs submitted functions on a small local thread pool and keeps
+their state in a JobStore (one SQLite file, plus a pickle per finished
+result), so the UI can poll status, progress and ETA on every rerun, cancel
+a run, and still download a finished job's results after a page reload.
+
+    runner = JobRunner(JobStore())
+    job_id = runner.submit("match", match_job, subj_file, src_file, prop_type="Hotel", ...)
+    runner.store.get(job_id)      # {"status": "running", "phase": "match", "done": 120, "total": 900, ...}
+    runner.cancel(job_id)
+    runner.store.result(job_id)   # match_job's return value once status is "done"
+
+Cancellation is cooperative: a job stops at its next progress report, so a
+phase without reports (e.g. parsing one workbook) finishes first.
+
+Each job records the process that runs it (host:pid). Several servers can
+share a cache dir; a new runner only fails the unfinished jobs of processes
+on its host that have exited.
+"""
+
+import contextlib
+import ctypes
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from comps_cache import DEFAULT_CACHE_DIR
+from comps_engine import (
+    PROPERTY_TYPE_COL,
+    match_batch,
+    match_results,
+    match_rules_for,
+    read_batch_inputs,
+    read_inputs,
+    required_columns,
+    validate_frames,
+)
+from comps_store import PoolStore, match_sharded, read_store_inputs, read_store_subjects, validate_store
+from comps_timing import StageTimer
+
+FINISHED = ("done", "failed", "cancelled")
+
+JOB_COLUMNS = [
+    "id", "kind", "key", "label", "status", "error", "created", "started", "finished",
+    "phase", "phase_started", "done", "total", "owner",
+]
+
+DEFAULT_RESULT_BYTES = int(float(os.environ.get("COMPS_JOB_RESULTS_MAX_MB", 1024)) * 1024 * 1024)
+
+
+def process_owner():
+    """This process as a job owner: "host:pid"."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    if os.name == "nt":  # os.kill() would terminate it
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # someone else's process
+    return True
+
+
+def owner_gone(owner):
+    """Whether `owner` (a process_owner()) is a process on this host that has exited.
+
+    Owners on other hosts are never gone: there is no telling from here.
+    Jobs recorded before owners were (None) count as gone.
+    """
+    if not owner:
+        return True
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return False
+    return not _pid_alive(int(pid))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been cancelled."""
+
+
+class JobStore:
+    """Job records in one SQLite file; results pickled next to it under jobs/.
+
+    Only the newest `keep` finished jobs are kept, and their results only
+    while they total at most max_bytes (least recently used go first; the
+    newest result is always kept).
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, name="jobs.sqlite", keep=20, max_bytes=DEFAULT_RESULT_BYTES):
+        self.path = os.path.join(root, name)
+        self.results_dir = os.path.join(root, "jobs")
+        self.keep = keep
+        self.max_bytes = max_bytes
+
+    @contextlib.contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, key TEXT NOT NULL, label TEXT NOT NULL, "
+                "status TEXT NOT NULL, error TEXT, created REAL NOT NULL, started REAL, finished REAL, "
+                "phase TEXT, phase_started REAL, done INTEGER NOT NULL, total INTEGER NOT NULL, owner TEXT)"
+            )
+            if "owner" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")  # a store from before owners
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, kind, key="", label=""):
+        """New queued job of this process; returns its id."""
+        job_id = uuid.uuid4().hex[:16]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, key, label, status, created, done, total, owner) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, 0, 0, ?)",
+                (job_id, kind, key, label, time.time(), process_owner()),
+            )
+        return job_id
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - set(JOB_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        sets = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {sets} WHERE id = ?", [*fields.values(), job_id])
+
+    def get(self, job_id):
+        """The job's record as a dict, or None."""
+        if not job_id or not os.path.exists(self.path):
+            return None
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def jobs(self, kind=None, key=None, limit=None):
+        """Job records, newest first, optionally of one kind / key."""
+        if not os.path.exists(self.path):
+            return []
+        where, params = [], []
+        for name, value in (("kind", kind), ("key", key)):
+            if value is not None:
+                where.append(f"{name} = ?")
+                params.append(value)
+        sql = "SELECT * FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def _result_path(self, job_id):
+        return os.path.join(self.results_dir, f"{job_id}.pkl")
+
+    def save_result(self, job_id, value):
+        os.makedirs(self.results_dir, exist_ok=True)
+        path = self._result_path(job_id)
+        with open(path + ".tmp", "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def result(self, job_id):
+        """A finished job's return value, or None if there is none (any more)."""
+        path = self._result_path(job_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+        except Exception:
+            os.remove(path)  # corrupt or from an incompatible version
+            return None
+        os.utime(path)  # mark as recently used
+        return value
+
+    def result_entries(self):
+        """(path, size, last_used) for every stored result, oldest first."""
+        if not os.path.isdir(self.results_dir):
+            return []
+        out = []
+        for name in os.listdir(self.results_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.results_dir, name)
+            info = os.stat(path)
+            out.append((path, info.st_size, info.st_mtime))
+        return sorted(out, key=lambda e: e[2])
+
+    def evict(self):
+        """Drop least-recently-used results, all but the newest, until they total max_bytes."""
+        entries = self.result_entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def interrupt_unfinished(self):
+        """Mark queued/running jobs as failed where their process has exited (see owner_gone())."""
+        if not os.path.exists(self.path):
+            return
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            now = time.time()
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted (the app was restarted).', "
+                "finished = ? WHERE id = ?",
+                [(now, row["id"]) for row in rows if owner_gone(row["owner"])],
+            )
+
+    def prune(self):
+        """Drop finished jobs beyond the newest `keep`, with their results."""
+        finished = [job for job in self.jobs() if job["status"] in FINISHED]
+        doomed = [job["id"] for job in finished[self.keep:]]
+        if not doomed:
+            return
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in doomed])
+        for job_id in doomed:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._result_path(job_id))
+
+
+def job_eta(job, now=None):
+    """Seconds left in the job's current phase, from its rate so far (None until known)."""
+    if job["status"] != "running" or not job["done"] or job["total"] <= job["done"]:
+        return None
+    elapsed = (now or time.time()) - job["phase_started"]
+    return elapsed * (job["total"] - job["done"]) / job["done"]
+
+
+class JobContext:
+    """Handed to a running job as its first argument: report progress, notice cancellation.
+
+    Progress writes are throttled to one per `min_interval` seconds.
+    """
+
+    def __init__(self, store, job_id, cancel_event, min_interval=0.5):
+        self.store = store
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.min_interval = min_interval
+        self.last_write = 0.0
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def phase(self, name, total=0):
+        """Start a named phase of `total` steps (0 if unknown)."""
+        self.check()
+        self.last_write = time.time()
+        self.store.update(self.job_id, phase=name, phase_started=self.last_write, done=0, total=total)
+
+    def progress(self, done, total):
+        """`done` of `total` steps of the current phase; raises JobCancelled once cancelled."""
+        self.check()
+        now = time.time()
+        if done < total and now - self.last_write < self.min_interval:
+            return
+        self.last_write = now
+        self.store.update(self.job_id, done=int(done), total=int(total))
+
+
+class JobRunner:
+    """Runs jobs on a local thread pool, recording them in a JobStore.
+
+    One runner per server process (e.g. via st.cache_resource): jobs outlive
+    the script run that submitted them. Jobs beyond `max_workers` queue.
+    """
+
+    def __init__(self, store=None, max_workers=1):
+        self.store = store or JobStore()
+        self.store.interrupt_unfinished()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="comps-job")
+        self.running = {}  # job id -> (future, cancel event)
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, key="", label="", **kwargs):
+        """Queue fn(job_context, *args, **kwargs); returns the job id."""
+        job_id = self.store.create(kind, key=key, label=label)
+        job = JobContext(self.store, job_id, threading.Event())
+        with self.lock:
+            future = self.pool.submit(self._run, job, fn, args, kwargs)
+            self.running[job_id] = (future, job.cancel_event)
+        return job_id
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            if job.cancelled:
+                self.store.update(job.job_id, status="cancelled", finished=time.time())
+                return
+            self.store.update(job.job_id, status="running", started=time.time())
+            try:
+                value = fn(job, *args, **kwargs)
+            except JobCancelled:
+                self.store.update(job.job_id, status="cancelled", finished=time.time())
+            except Exception as e:
+                self.store.update(job.job_id, status="failed", error=str(e) or type(e).__name__,
+                                  finished=time.time())
+            else:
+                self.store.save_result(job.job_id, value)
+                self.store.update(job.job_id, status="done", finished=time.time())
+            self.store.prune()
+        finally:
+            with self.lock:
+                self.running.pop(job.job_id, None)
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; False if it isn't active here."""
+        with self.lock:
+            entry = self.running.get(job_id)
+        if entry is None:
+            return False
+        future, cancel_event = entry
+        cancel_event.set()
+        if future.cancel():  # never started
+            with self.lock:
+                self.running.pop(job_id, None)
+            self.store.update(job_id, status="cancelled", finished=time.time())
+        return True
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job_id in list(self.running):
+                self.cancel(job_id)
+        self.pool.shutdown(wait=True)
+
+
+def match_job(
+    job,
+    subj_file,
+    src_file,
+    *,
+    prop_type,
+    use_cascading=True,
+    max_comps=3,
+    rule_mode="Static",
+    category=None,
+    rule_sets=None,
+    selection="classic",
+    workers=1,
+    pool_cache=None,
+    comp_cache=None,
+    profile=False,
+    src_store=None,
+    store_shards=False,
+):
+    """Read, validate and match as a background job (the app's Run Matching).
+
+    With src_store (a comps_store.PoolStore path) the Data Source is the
+    rows of that store the subjects can match, and src_file is ignored;
+    store_shards matches against them tile by tile (comps_store.match_sharded),
+    in this process and without the comp cache.
+
+    Returns {"report", "subj", "src", "comp_table", "timer"}: the
+    validate_frames() report with row counts in place of its frames
+    (subj_after, src_after), and comp_table None when validation left
+    nothing to match.
+    """
+    timer = StageTimer(profile=profile)
+    out = {"report": None, "subj": None, "src": None, "comp_table": None, "timer": timer}
+    with timer.activate():
+        if src_store is not None and store_shards:
+            return _match_store_shards(
+                job, out, subj_file, PoolStore(src_store),
+                prop_type=prop_type, use_cascading=use_cascading, max_comps=max_comps,
+                rule_mode=rule_mode, category=category, rule_sets=rule_sets, selection=selection,
+            )
+        if src_store is None:
+            job.phase("read")
+            subj, src = read_inputs(subj_file, src_file, prop_type, cache=pool_cache)
+        else:
+            job.phase("store")
+            subj, src = read_store_inputs(
+                subj_file, src_store, prop_type,
+                match_rules_for(use_cascading, rule_mode, category, rule_sets),
+                progress=job.progress,
+            )
+        job.phase("validate")
+        report = validate_frames(subj, src, required_columns(prop_type))
+        subj, src = report["subj"], report["src"]
+        out["report"] = {k: v for k, v in report.items() if k not in ("subj", "src")}
+        out["report"]["subj_after"] = 0 if subj is None else len(subj)
+        out["report"]["src_after"] = 0 if src is None else len(src)
+        if subj is None or len(subj) == 0 or len(src) == 0:
+            return out
+        job.phase("match", len(subj))
+        comp_table = match_results(
+            subj,
+            src,
+            prop_type=prop_type,
+            use_cascading=use_cascading,
+            max_comps=max_comps,
+            rule_mode=rule_mode,
+            category=category,
+            rule_sets=rule_sets,
+            selection=selection,
+            workers=workers,
+            scan_progress=job.progress,
+            comp_cache=comp_cache,
+        )
+    out.update(subj=subj, src=src, comp_table=comp_table)
+    return out
+
+
+def _match_store_shards(job, out, subj_file, store, *, prop_type, **options):
+    """match_job()'s read, validate and match steps for a sharded store run."""
+    job.phase("store")
+    subj = read_store_subjects(subj_file, store, prop_type)
+    job.phase("validate")
+    report = validate_store(subj, store, required_columns(prop_type))
+    subj = report["subj"]
+    out["report"] = {k: v for k, v in report.items() if k not in ("subj", "src")}
+    out["report"]["subj_after"] = 0 if subj is None else len(subj)
+    out["report"].setdefault("src_after", 0)
+    if subj is None or len(subj) == 0 or out["report"]["src_after"] == 0:
+        return out
+    job.phase("match", len(subj))
+    comp_table, src = match_sharded(
+        subj, store, prop_type=prop_type, required_cols=required_columns(prop_type),
+        progress=job.progress, **options,
+    )
+    out.update(subj=subj, src=src, comp_table=comp_table)
+    return out
+
+
+def batch_job(
+    job,
+    subj_file,
+    src_file,
+    *,
+    type_col=PROPERTY_TYPE_COL,
+    pool_cache=None,
+    profile=False,
+    **options,
+):
+    """match_job() for files mixing property types, split on type_col (the app's batch run).
+
+    Both files are read once; each property type is then validated and
+    matched on its own (comps_engine.match_batch(), with match_results()
+    options). Returns {"batch", "skipped", "timer"}: match_batch()'s result,
+    and the subject / source rows of no known type.
+    """
+    timer = StageTimer(profile=profile)
+    with timer.activate():
+        job.phase("read")
+        subj_parts, src_parts = read_batch_inputs(subj_file, src_file, type_col=type_col, cache=pool_cache)
+        skipped = {"subj": len(subj_parts.pop(None, ())), "src": len(src_parts.pop(None, ()))}
+
+        def progress(ptype, done, total):
+            if done == 0:
+                job.phase("match", total)
+            job.progress(done, total)
+
+        batch = match_batch(subj_parts, src_parts, progress=progress, **options)
+    return {"batch": batch, "skipped": skipped, "timer": timer}
+
+
+def import_job(job, src_file, *, prop_type, path):
+    """Import a Data Source into a PoolStore at path as a background job; returns the store's info()."""
+    job.phase("import")
+    return PoolStore.import_file(src_file, prop_type, path, progress=job.progress).info()
@@ -0,0 +1,287 @@
+"""Streaming writers for the results table: rows go to disk as subjects finish.
+
+With max comps at 20 the results sheet is hundreds of columns wide, so the
+table is never assembled in memory. Excel goes through xlsxwriter's
+constant_memory mode (each row is flushed once the next one starts), CSV
+through the csv module, and Parquet through pyarrow in row groups.
+
+    with open_result_writer("results.xlsx") as writer:
+        for frame in iter_result_frames(subj, src, prop_type="Hotel"):
+            writer.write_frame(frame)
+
+write_results_workbook() streams several results tables (e.g. one per
+property type of a batch run) into one workbook, a sheet each.
+"""
+
+import csv
+import datetime
+import decimal
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from comps_engine import NUMERIC_COLS
+from comps_timing import stage, timed
+
+OUTPUT_FORMATS = {
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+# Result columns stored as float64 in Parquet (Subject_VPR, Comp3_GBA, ...);
+# everything else is text there, since comp slots mix values and "" placeholders.
+RESULT_NUMERIC_FIELDS = frozenset(NUMERIC_COLS) | {"Overpaid_Value"}
+
+
+def output_format(target, fmt=None):
+    """Explicit fmt, else the target's extension; Excel when neither says."""
+    if fmt is None and isinstance(target, (str, os.PathLike)):
+        fmt = os.path.splitext(str(target))[1].lstrip(".").lower()
+    fmt = {"xls": "xlsx", "xlsm": "xlsx", "pq": "parquet", "txt": "csv"}.get(fmt, fmt)
+    return fmt if fmt in OUTPUT_FORMATS else "xlsx"
+
+
+def open_result_writer(target, fmt=None):
+    """Writer for a path or binary file object; see output_format()."""
+    fmt = output_format(target, fmt)
+    if fmt == "csv":
+        return CsvResultWriter(target)
+    if fmt == "parquet":
+        return ParquetResultWriter(target)
+    return ExcelResultWriter(target)
+
+
+def write_results_file(frames, fmt, preview_rows=5):
+    """Stream result frames through a temp file; returns (first rows, file bytes).
+
+    Only the preview rows stay in memory while writing; the finished file is
+    read back once (e.g. for a download button).
+    """
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    preview = None
+    try:
+        with open_result_writer(path, fmt) as writer:
+            for frame in frames:
+                writer.write_frame(frame)
+                if preview is None:
+                    preview = frame.head(preview_rows)
+        with open(path, "rb") as fh:
+            data = fh.read()
+    finally:
+        os.remove(path)
+    return (preview if preview is not None else pd.DataFrame()), data
+
+
+def write_results_workbook(parts, target, preview_rows=5):
+    """One Excel workbook with a results sheet per (sheet name, result frames) in parts.
+
+    Sheets are written one after another, streamed like open_result_writer();
+    target is a path or binary file object. Returns {sheet name: first rows}.
+    """
+    workbook = xlsxwriter.Workbook(target, {"constant_memory": True})
+    previews = {}
+    try:
+        for name, frames in parts:
+            with ExcelResultWriter(None, name, workbook=workbook) as writer:
+                for frame in frames:
+                    writer.write_frame(frame)
+                    previews.setdefault(name, frame.head(preview_rows))
+            previews.setdefault(name, pd.DataFrame())
+    finally:
+        with stage("export"):
+            workbook.close()
+    return previews
+
+
+def _is_blank(val):
+    return val is None or (pd.api.types.is_scalar(val) and pd.isna(val))
+
+
+class _ResultWriter:
+    """Column order is fixed by the first row or frame (every results row has the same keys)."""
+
+    columns = None
+    rows_written = 0
+
+    def _start(self, columns):
+        if self.columns is None:
+            self.columns = list(columns)
+            self._write_header(self.columns)
+
+    @timed("export", trace=False)
+    def write_row(self, row):
+        self._start(row)
+        self._write_values([row.get(c, "") for c in self.columns])
+        self.rows_written += 1
+
+    @timed("export")
+    def write_frame(self, frame):
+        """Write every row of a results frame (iter_result_frames)."""
+        self._start(frame.columns)
+        for values in frame[self.columns].itertuples(index=False, name=None):
+            self._write_values(values)
+        self.rows_written += len(frame)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with stage("export"):
+            self.close()
+        return False
+
+
+class ExcelResultWriter(_ResultWriter):
+    """One-sheet workbook in xlsxwriter's constant_memory mode, cells as pandas' to_excel writes them.
+
+    With `workbook`, the sheet is added to that open workbook instead (see
+    write_results_workbook()), which the writer then leaves open.
+    """
+
+    def __init__(self, target, sheet_name="Sheet1", workbook=None):
+        self.owns_workbook = workbook is None
+        self.workbook = xlsxwriter.Workbook(target, {"constant_memory": True}) if workbook is None else workbook
+        self.sheet = self.workbook.add_worksheet(sheet_name)
+        self.row_idx = 0
+
+    def _write_header(self, columns):
+        self._write_values(columns)
+
+    def _write_values(self, values):
+        for col, val in enumerate(values):
+            if _is_blank(val):
+                continue
+            if isinstance(val, (bool, np.bool_)):
+                val = bool(val)
+            elif isinstance(val, (int, np.integer)):
+                val = int(val)
+            elif isinstance(val, (float, np.floating)):
+                val = float(val)
+                if math.isinf(val):
+                    val = "inf" if val > 0 else "-inf"
+            elif not isinstance(val, (decimal.Decimal, datetime.date, datetime.timedelta)):
+                val = str(val)
+            self.sheet.write(self.row_idx, col, val)
+        self.row_idx += 1
+
+    def close(self):
+        if self.columns is None:
+            self._write_header([])
+        if self.owns_workbook:
+            self.workbook.close()
+
+
+class CsvResultWriter(_ResultWriter):
+    def __init__(self, target):
+        if isinstance(target, (str, os.PathLike)):
+            self.fh = open(target, "w", newline="", encoding="utf-8")
+            self.owns_fh = True
+        else:
+            self.fh = _TextAdapter(target)
+            self.owns_fh = False
+        self.writer = csv.writer(self.fh)
+
+    def _write_header(self, columns):
+        self.writer.writerow(columns)
+
+    def _write_values(self, values):
+        self.writer.writerow(["" if _is_blank(v) else v for v in values])
+
+    def close(self):
+        if self.owns_fh:
+            self.fh.close()
+
+
+class _TextAdapter:
+    """Minimal text wrapper over a binary file object that leaves it open."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def write(self, text):
+        return self.raw.write(text.encode("utf-8"))
+
+
+class ParquetResultWriter(_ResultWriter):
+    """Rows buffered into row groups of `batch_rows`; see RESULT_NUMERIC_FIELDS for types.
+
+    A numeric column holding text raises ValueError rather than losing the
+    value (the Excel and CSV writers keep it as written).
+    """
+
+    def __init__(self, target, batch_rows=1000):
+        self.target = target
+        self.batch_rows = batch_rows
+        self.buffer = []
+        self.writer = None
+        self.schema = None
+
+    def _write_header(self, columns):
+        import pyarrow as pa
+
+        fields = []
+        for c in columns:
+            field = c.split("_", 1)[1] if c.startswith(("Subject_", "Comp")) else c
+            numeric = field in RESULT_NUMERIC_FIELDS
+            fields.append(pa.field(c, pa.float64() if numeric else pa.string()))
+        self.schema = pa.schema(fields)
+
+    def _write_values(self, values):
+        self.buffer.append(values)
+        if len(self.buffer) >= self.batch_rows:
+            self._flush()
+
+    @timed("export")
+    def write_frame(self, frame):
+        """Whole frames are converted column by column and written as their own row group."""
+        self._start(frame.columns)
+        if self.buffer:
+            self._flush()
+        self._write_columns([frame[c] for c in self.columns])
+        self.rows_written += len(frame)
+
+    def _flush(self):
+        self._write_columns([[row[k] for row in self.buffer] for k in range(len(self.schema))])
+        self.buffer = []
+
+    def _write_columns(self, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrays = []
+        for field, col in zip(self.schema, columns):
+            if pa.types.is_floating(field.type):
+                arrays.append(pa.array([_as_float(v, field.name) for v in col], type=pa.float64()))
+            else:
+                arrays.append(pa.array(
+                    [None if _is_blank(v) or v == "" else str(v) for v in col], type=pa.string()
+                ))
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.target, self.schema)
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        import pyarrow as pa
+
+        if self.schema is None:
+            self.schema = pa.schema([])
+        if self.buffer or self.writer is None:
+            self._flush()
+        self.writer.close()
+
+
+def _as_float(val, column):
+    if _is_blank(val) or val == "":
+        return None
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Parquet column {column!r} is numeric but holds {val!r}; write CSV or Excel to keep such values"
+        ) from None
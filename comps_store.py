@@ -0,0 +1,639 @@
+"""Data Source pools imported once into SQLite and matched without loading them whole.
+
+Parsing a statewide roll takes minutes and holding it takes gigabytes in
+every process that matches against it. import_file() parses and normalizes
+the roll once into a PoolStore file: the rows in one table, an R*Tree over
+lat/lon and B-tree indexes on Class_Num, VPR/VPU, _desc_norm and the size
+fields. A run then reads only the rows some subject could match (inside
+the subject's widest radius and its metric, value and size bands) and hands
+them to the usual matchers. Several analysts can share one 2M-row pool,
+each process holding just its subjects' neighbourhoods.
+
+For subjects spread over a whole state, match_sharded() goes further: the
+store is read in grid tiles (shards) as a sweep over the subjects reaches
+them, and each tile is dropped once no remaining subject needs it.
+
+    store = PoolStore.import_file("statewide_roll.xlsx", "Hotel", store_path("Hotel - statewide"))
+    subj, src = read_store_inputs("subjects.xlsx", store, "Hotel", RULE_SETS)
+    run_matching(subj, src, prop_type="Hotel")
+
+    subj = read_store_subjects("subjects.xlsx", store, "Hotel")
+    comp_table, src = match_sharded(subj, store, prop_type="Hotel", required_cols=required_columns("Hotel"))
+    iter_result_frames(subj, src, prop_type="Hotel", comp_table=comp_table)
+
+From the command line:
+
+    python comps_store.py statewide_roll.xlsx pools/hotel.sqlite --prop-type Hotel
+    python comps_cli.py subjects.xlsx pools/hotel.sqlite --prop-type Hotel [--shards]
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from comps_cache import DEFAULT_CACHE_DIR, file_digest
+from comps_engine import (
+    COMP_TABLE_COLUMNS,
+    DESC_RULE_TYPES,
+    INGEST_COLS,
+    PROPERTY_TYPES,
+    compact_pool,
+    match_results,
+    match_rules_for,
+    metric_fields,
+    normalize_frame,
+    num_col,
+    read_table,
+    search_box,
+    validate_frames,
+)
+from comps_timing import stage, timed
+
+STORE_VERSION = 2  # bump when the file layout or normalize_frame() output changes
+STORE_EXTENSIONS = (".sqlite", ".db")
+DEFAULT_STORE_DIR = os.path.join(DEFAULT_CACHE_DIR, "stores")
+
+IMPORT_CHUNK_ROWS = 50_000
+QUERY_CELL_DEG = 0.25  # candidate queries cover the pool in tiles of this size
+SHARD_BATCH_ROWS = 200_000  # ShardedPool: most candidate rows matched against at once
+INDEXED_COLS = ("Class_Num", "VPR", "VPU", "_desc_norm", "Rooms", "Units", "GBA")
+
+
+def store_path(name, root=DEFAULT_STORE_DIR):
+    """Path of the store called `name` under root."""
+    return os.path.join(root, f"{name}.sqlite")
+
+
+def is_store(file):
+    """Whether `file` names a PoolStore rather than a Data Source file."""
+    return isinstance(file, (str, os.PathLike)) and str(file).lower().endswith(STORE_EXTENSIONS)
+
+
+def list_stores(root=DEFAULT_STORE_DIR):
+    """Every readable store under root, newest import first."""
+    if not os.path.isdir(root):
+        return []
+    stores = []
+    for name in os.listdir(root):
+        if not name.endswith(STORE_EXTENSIONS):
+            continue
+        store = PoolStore(os.path.join(root, name))
+        if store.info() is not None:
+            stores.append(store)
+    return sorted(stores, key=lambda s: s.info()["imported"], reverse=True)
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_values(values):
+    """A column as Python values for sqlite3, None for missing."""
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "fiub":
+        return values.to_numpy().tolist()  # NaN is stored as NULL
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def _restore(values, dtype):
+    """A loaded column back in its imported dtype."""
+    if dtype == "object":
+        return values.where(values.notna(), np.nan)
+    try:
+        return values.astype(dtype)
+    except (TypeError, ValueError):
+        return values
+
+
+def _tiles(box, deg=QUERY_CELL_DEG):
+    """(tile, box clipped to it) for each grid tile a search box overlaps; one unbounded tile for None."""
+    if box is None:
+        return [(None, None)]
+    lat_lo, lat_hi, lon_lo, lon_hi = box
+    return [
+        ((a, b), (max(lat_lo, a * deg), min(lat_hi, (a + 1) * deg), max(lon_lo, b * deg), min(lon_hi, (b + 1) * deg)))
+        for a in range(math.floor(lat_lo / deg), math.floor(lat_hi / deg) + 1)
+        for b in range(math.floor(lon_lo / deg), math.floor(lon_hi / deg) + 1)
+    ]
+
+
+def _union(a, b):
+    """Smallest (lo, hi, lo, hi, ...) bounds holding both; None (unbounded) if either is."""
+    if a is None or b is None:
+        return None
+    return tuple(min(x, y) if k % 2 == 0 else max(x, y) for k, (x, y) in enumerate(zip(a, b)))
+
+
+def _band(subj_val, pct):
+    """(lo, hi) holding every value v with abs(v - subj_val) / subj_val <= pct, widened a hair.
+
+    None when nothing can pass (missing or zero subject value); a negative
+    subject passes any value, as the matcher's abs(v - s) / s test does.
+    """
+    if pd.isna(subj_val) or subj_val == 0:
+        return None
+    if subj_val < 0:
+        return -math.inf, math.inf
+    slack = abs(subj_val) * 1e-9
+    return subj_val * (1 - pct) - slack, subj_val * (1 + pct) + slack
+
+
+class PoolStore:
+    """One imported Data Source in a SQLite file (see the module docstring).
+
+    Each row keeps its position in the imported frame (`pos`), and loaded
+    rows come back in that order, so the matchers break ties as they would
+    on the whole pool.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self._info = None
+
+    def __repr__(self):
+        return f"PoolStore({self.path!r})"
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Read-only: any number of processes can match against the same file.
+        uri = pathlib.Path(os.path.abspath(self.path)).as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @property
+    def name(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def info(self):
+        """The import's metadata (prop_type, rows, columns, source, digest, imported), or None if unreadable."""
+        if self._info is None:
+            if not os.path.exists(self.path):
+                return None
+            try:
+                with self._connect() as conn:
+                    meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+            except sqlite3.Error:
+                return None
+            if meta.get("version") != STORE_VERSION:
+                return None
+            self._info = meta
+        return self._info
+
+    @classmethod
+    @timed("store.import")
+    def import_frame(cls, df, prop_type, path, *, source="", digest="", progress=None):
+        """Write a normalize_frame() Data Source to a new store at path, replacing any there.
+
+        The file is built next to path and moved into place when complete, so
+        runs reading the old store are not disturbed. progress(done, total)
+        follows the rows written.
+        """
+        path = os.fspath(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp"
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+        columns = list(df.columns)
+        conn = sqlite3.connect(tmp)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            # REAL / INTEGER for numeric columns; no affinity elsewhere, so
+            # e.g. an Excel column mixing numbers and text keeps each value's type.
+            affinity = {"f": " REAL", "i": " INTEGER", "u": " INTEGER", "b": " INTEGER"}
+            decls = []
+            for col in columns:
+                kind = df[col].dtype.kind if isinstance(df[col].dtype, np.dtype) else "O"
+                decls.append(_quote(col) + affinity.get(kind, ""))
+            conn.execute(f"CREATE TABLE pool (pos INTEGER PRIMARY KEY, {', '.join(decls)})")
+
+            insert = f"INSERT INTO pool VALUES ({', '.join('?' * (len(columns) + 1))})"
+            for start in range(0, len(df), IMPORT_CHUNK_ROWS):
+                part = df.iloc[start:start + IMPORT_CHUNK_ROWS]
+                values = [_sql_values(part[col]) for col in columns]
+                conn.executemany(insert, zip(range(start, start + len(part)), *values))
+                if progress is not None:
+                    progress(start + len(part), len(df))
+
+            has_geo = "lat" in columns and "lon" in columns
+            with stage("store.index"):
+                if has_geo:
+                    # The band fields ride along as auxiliary columns, so a box
+                    # query filters them without a lookup into pool per row.
+                    aux = [
+                        _quote(col) if col in columns else "NULL"
+                        for col in (*metric_fields(prop_type == "Hotel"), "_desc_norm")
+                    ]
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE pool_geo USING rtree("
+                        "pos, min_lat, max_lat, min_lon, max_lon, +metric, +size, +value, +desc_norm)"
+                    )
+                    conn.execute(
+                        f"INSERT INTO pool_geo SELECT pos, lat, lat, lon, lon, {', '.join(aux)} FROM pool "
+                        "WHERE lat IS NOT NULL AND lon IS NOT NULL"
+                    )
+                for k, col in enumerate(c for c in INDEXED_COLS if c in columns):
+                    conn.execute(f"CREATE INDEX pool_idx{k} ON pool ({_quote(col)})")
+                conn.execute("ANALYZE")
+
+            meta = {
+                "version": STORE_VERSION,
+                "prop_type": prop_type,
+                "rows": len(df),
+                "columns": [[str(col), str(df[col].dtype)] for col in columns],
+                "has_geo": has_geo,
+                "source": source,
+                "digest": digest,
+                "imported": time.time(),
+            }
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp, path)
+        return cls(path)
+
+    @classmethod
+    def import_file(cls, file, prop_type, path, *, columns=INGEST_COLS, progress=None, force=False):
+        """read_table + normalize_frame a Data Source file into a store at path.
+
+        A store already holding the same file for the same property type is
+        reused as is unless `force`.
+        """
+        digest = file_digest(file)
+        store = cls(path)
+        info = store.info()
+        if not force and info is not None and info["digest"] == digest and info["prop_type"] == prop_type:
+            return store
+        df = normalize_frame(read_table(file, columns), prop_type)
+        source = os.path.basename(os.fspath(file)) if isinstance(file, (str, os.PathLike)) else getattr(file, "name", "")
+        return cls.import_frame(df, prop_type, path, source=source, digest=digest, progress=progress)
+
+    def check_prop_type(self, prop_type):
+        """ValueError unless the store was normalized the way prop_type needs."""
+        info = self.info()
+        if info is None:
+            raise ValueError(f"{self.path} is not a Data Source store (or is from an older version); import it again.")
+        if (info["prop_type"] == "Hotel") != (prop_type == "Hotel"):
+            raise ValueError(
+                f"{self.name} was imported for {info['prop_type']}; import the roll again for {prop_type}."
+            )
+
+    def plan(self, subj, rule_sets, prop_type):
+        """The candidate queries for subj under rule_sets, one per grid tile (shard).
+
+        A superset: bounding box of the widest radius, the widest metric,
+        value and size bands, and the description rule where it applies; the
+        matchers apply the exact rules. Returns {"queries": {tile: [bounds,
+        descriptions]}, "tiles": the tiles each subject needs, "homes": the
+        tile each subject lies in, ...} for positions_for() / ShardedPool.
+        Tile None stands for the whole store (no box narrows the search).
+        """
+        self.check_prop_type(prop_type)
+        info = self.info()
+        stored = {col for col, _ in info["columns"]}
+        is_hotel = prop_type == "Hotel"
+        metric_field, size_field, value_field = metric_fields(is_hotel)
+        widest = {
+            k: max(rules[k] for rules in rule_sets)
+            for k in ("max_radius_miles", "max_gap_pct_main", "max_gap_pct_value", "max_gap_pct_size")
+        }
+        desc_rule = prop_type in DESC_RULE_TYPES and "_desc_norm" in subj.columns and "_desc_norm" in stored
+        # Rows without coordinates sit at the 999-mile placeholder distance.
+        use_geo = widest["max_radius_miles"] < 999
+
+        # Box queries read the band fields from pool_geo's auxiliary columns,
+        # the others pool's indexed columns; a missing column never passes.
+        if use_geo:
+            table = "pool_geo"
+            fields = {"metric": "metric", "value": "value", "size": "size", "desc": "desc_norm"}
+        else:
+            table = "pool"
+            fields = {
+                key: _quote(col) if col in stored else None
+                for key, col in (
+                    ("metric", metric_field), ("value", value_field), ("size", size_field), ("desc", "_desc_norm"),
+                )
+            }
+        plan = {
+            "queries": {}, "tiles": [[] for _ in range(len(subj))], "homes": [None] * len(subj),
+            "table": table, "fields": fields, "desc_rule": desc_rule,
+        }
+        if use_geo and not info["has_geo"]:
+            return plan
+
+        s_metric, s_value, s_size = (num_col(subj, col) for col in (metric_field, value_field, size_field))
+        s_lat, s_lon = num_col(subj, "lat"), num_col(subj, "lon")
+        s_desc = None
+        if desc_rule:
+            s_desc = subj["_desc_norm"].astype(object).fillna("").astype(str).to_numpy()
+
+        # One query per tile of the pool that some subject's box reaches, over
+        # the union of those subjects' boxes (clipped to the tile), bands and
+        # descriptions, so each row is read about once however boxes overlap.
+        queries = plan["queries"]
+        for i in range(len(subj)):
+            metric = _band(s_metric[i], widest["max_gap_pct_main"])
+            value = _band(s_value[i], widest["max_gap_pct_value"])
+            size = _band(s_size[i], widest["max_gap_pct_size"])
+            if metric is None or value is None or size is None:
+                continue
+            box = None
+            if use_geo:
+                if np.isnan(s_lat[i]) or np.isnan(s_lon[i]):
+                    continue
+                box = search_box(s_lat[i], s_lon[i], widest["max_radius_miles"])
+                plan["homes"][i] = (math.floor(s_lat[i] / QUERY_CELL_DEG), math.floor(s_lon[i] / QUERY_CELL_DEG))
+            desc = None
+            if desc_rule:
+                desc = s_desc[i]
+                if desc == "":
+                    continue
+            for tile, clipped in _tiles(box):
+                bounds = [clipped, (metric[0], s_metric[i]), value, size]
+                group = queries.get(tile)
+                if group is None:
+                    queries[tile] = [bounds, set()]
+                else:
+                    group[0] = [_union(a, b) for a, b in zip(group[0], bounds)]
+                if desc is not None:
+                    queries[tile][1].add(desc)
+                plan["tiles"][i].append(tile)
+        return plan
+
+    def tile_positions(self, conn, plan, tile):
+        """Sorted positions of the stored rows matching plan's query for one tile."""
+        (box, metric, value, size), descs = plan["queries"][tile]
+        fields = plan["fields"]
+        where, params = [], []
+        if box is not None:
+            lat_lo, lat_hi, lon_lo, lon_hi = box
+            where.append("min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?")
+            params += [lat_hi, lat_lo, lon_hi, lon_lo]
+        for key, bounds in (("metric", metric), ("value", value), ("size", size)):
+            if fields[key] is None:
+                where.append("0")
+            else:
+                where.append(f"{fields[key]} BETWEEN ? AND ?")
+                params += bounds
+        if plan["desc_rule"]:
+            where.append(f"{fields['desc']} IN ({', '.join('?' * len(descs))})")
+            params += sorted(descs)
+        sql = f"SELECT pos FROM {plan['table']} WHERE " + " AND ".join(where)
+        rows = conn.execute(sql, params).fetchall()
+        return np.sort(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+
+    @timed("store.query")
+    def positions_for(self, subj, rule_sets, prop_type, progress=None):
+        """Sorted positions of every stored row some subject could match under rule_sets (see plan()).
+
+        progress(done, total) follows the queries.
+        """
+        plan = self.plan(subj, rule_sets, prop_type)
+        found = []
+        with self._connect() as conn:
+            for done, tile in enumerate(plan["queries"], 1):
+                found.append(self.tile_positions(conn, plan, tile))
+                if progress is not None:
+                    progress(done, len(plan["queries"]))
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def null_counts(self, cols):
+        """({col: rows where it is null}, rows, rows null in none of cols), counted in the store."""
+        cols = [col for col in cols if col in {c for c, _ in self.info()["columns"]}]
+        nulls = [f"{_quote(col)} IS NULL" for col in cols]
+        sql = "SELECT COUNT(*)" + "".join(f", TOTAL({null})" for null in nulls)
+        sql += f", TOTAL(NOT ({' OR '.join(nulls)}))" if nulls else ", COUNT(*)"
+        with self._connect() as conn:
+            rows, *counts, complete = conn.execute(f"{sql} FROM pool").fetchone()
+        return {col: int(n) for col, n in zip(cols, counts)}, int(rows), int(complete)
+
+    @timed("store.load")
+    def load(self, positions, chunk=100_000):
+        """Rows at `positions`, in pool order and imported dtypes, indexed by position."""
+        info = self.info()
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        names = [col for col, _ in info["columns"]]
+        select = ", ".join(f"p.{_quote(col)}" for col in names)
+        records = []
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE want (pos INTEGER PRIMARY KEY)")
+            for start in range(0, len(positions), chunk):
+                conn.execute("DELETE FROM want")
+                conn.executemany("INSERT INTO want VALUES (?)", ((p,) for p in positions[start:start + chunk].tolist()))
+                records += conn.execute(
+                    f"SELECT {select} FROM want w JOIN pool p ON p.pos = w.pos ORDER BY w.pos"
+                ).fetchall()
+        # Object columns first (no type inference), then each back to its imported dtype.
+        cells = np.empty((len(records), len(names)), dtype=object)
+        if records:
+            cells[:] = records
+        df = pd.DataFrame(cells, columns=names, index=pd.Index(positions), dtype=object)
+        for col, dtype in info["columns"]:
+            df[col] = _restore(df[col], dtype)
+        return df
+
+    def pool_for(self, subj, rule_sets, prop_type, progress=None):
+        """The stored rows some subject could match, compacted like load_source_pool() output."""
+        return compact_pool(self.load(self.positions_for(subj, rule_sets, prop_type, progress)))
+
+
+class ShardedPool:
+    """A PoolStore's candidate rows for some subjects, loaded one grid tile (shard) at a time.
+
+    batches() sweeps the subjects tile by tile. Each batch is matched against
+    just the shards its subjects' search boxes reach: a shard is loaded the
+    first time a subject needs it and dropped once no remaining subject
+    does, so memory follows the subjects' footprint rather than the roll.
+    Neighbouring tiles' subjects share a batch while its pool stays under
+    batch_rows. Rows with nulls in required_cols are dropped as shards load.
+    """
+
+    def __init__(self, store, subj, rule_sets, prop_type, required_cols=(), batch_rows=SHARD_BATCH_ROWS):
+        self.store = store
+        self.plan = store.plan(subj, rule_sets, prop_type)
+        self.required_cols = list(required_cols)
+        self.batch_rows = batch_rows
+        self.positions = {}  # tile -> its query's positions, once queried
+        self.shards = {}  # tile -> loaded rows
+        self.shards_loaded = 0
+        self.peak_rows = 0
+
+    def _load(self, tiles):
+        """Read the given tiles' rows in one go, then split them into shards."""
+        with stage("store.shard"):
+            wanted = np.unique(np.concatenate([self.positions[tile] for tile in tiles]))
+            rows = self.store.load(wanted).dropna(subset=self.required_cols)
+            index = rows.index.to_numpy()
+            for tile in tiles:
+                at = np.searchsorted(index, self.positions[tile])
+                at = at[(at < len(index)) & (index[np.minimum(at, len(index) - 1)] == self.positions[tile])]
+                self.shards[tile] = rows.iloc[at]
+            self.shards_loaded += len(tiles)
+
+    def batches(self):
+        """Yield (subject positions, compacted pool indexed by store position) per batch.
+
+        Subjects no query can serve (e.g. no coordinates under a radius rule)
+        are in no batch: they have no comps.
+        """
+        tiles, homes = self.plan["tiles"], self.plan["homes"]
+        order = sorted(
+            (i for i in range(len(tiles)) if tiles[i]),
+            key=lambda i: (-1, ()) if homes[i] is None else (0, homes[i]),
+        )
+        # Subjects in one tile always share a batch.
+        groups = []
+        for i in order:
+            if groups and homes[groups[-1][0]] == homes[i]:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+        remaining = {}
+        for i in order:
+            for tile in tiles[i]:
+                remaining[tile] = remaining.get(tile, 0) + 1
+
+        with self.store._connect() as conn:
+            k = 0
+            while k < len(groups):
+                batch, needed, size = [], {}, 0
+                while k < len(groups):
+                    new = [t for t in dict.fromkeys(t for i in groups[k] for t in tiles[i]) if t not in needed]
+                    for tile in new:
+                        if tile not in self.positions:
+                            self.positions[tile] = self.store.tile_positions(conn, self.plan, tile)
+                    grown = size + sum(len(self.positions[tile]) for tile in new)
+                    if batch and grown > self.batch_rows:
+                        break
+                    batch += groups[k]
+                    needed.update(dict.fromkeys(new))
+                    size = grown
+                    k += 1
+
+                missing = [tile for tile in needed if tile not in self.shards]
+                if missing:
+                    self._load(missing)
+                self.peak_rows = max(self.peak_rows, sum(len(shard) for shard in self.shards.values()))
+                pool = pd.concat([self.shards[tile] for tile in needed])
+                # A row on a tile edge can be in both tiles' shards.
+                pool = pool[~pool.index.duplicated()].sort_index()
+                rows = np.array(batch, dtype=np.int64)
+                yield rows, compact_pool(pool)
+
+                for i in rows:
+                    for tile in tiles[i]:
+                        remaining[tile] -= 1
+                        if remaining[tile] == 0:
+                            self.shards.pop(tile, None)
+                            self.positions.pop(tile, None)
+
+
+@timed("store.sharded")
+def match_sharded(
+    subj, store, *, prop_type, required_cols=(), rule_sets=None, batch_rows=SHARD_BATCH_ROWS, progress=None, **options,
+):
+    """match_results() against a PoolStore shard by shard (see ShardedPool): (comp_table, src).
+
+    options are match_results()'s (use_cascading, max_comps, rule_mode,
+    category, selection); batches are matched in this process. src holds
+    just the chosen comps' rows, which comp_table's source positions index.
+    progress(done, total) follows the subjects.
+    """
+    match_rules = match_rules_for(
+        options.get("use_cascading", True), options.get("rule_mode", "Static"), options.get("category"), rule_sets,
+    )
+    pool = ShardedPool(store, subj, match_rules, prop_type, required_cols, batch_rows)
+    parts, done, cached, shared = [], 0, 0, 0
+    for rows, src in pool.batches():
+        table = match_results(subj.iloc[rows], src, prop_type=prop_type, rule_sets=rule_sets, **options)
+        cached += table.attrs["cached_subjects"]
+        shared += table.attrs["shared_subjects"]
+        table["subject"] = rows[table["subject"].to_numpy()]
+        table["source"] = src.index.to_numpy()[table["source"].to_numpy()]
+        parts.append(table)
+        done += len(rows)
+        if progress is not None:
+            progress(done, len(subj))
+
+    if parts:
+        table = pd.concat(parts, ignore_index=True)
+        table = table.sort_values(["subject", "rank"], kind="stable", ignore_index=True)
+    else:
+        table = pd.DataFrame({
+            c: np.empty(0, dtype=float if c in ("distance", "gap") else np.int64) for c in COMP_TABLE_COLUMNS
+        })
+    chosen = np.unique(table["source"].to_numpy())
+    src = compact_pool(store.load(chosen))
+    table["source"] = np.searchsorted(chosen, table["source"].to_numpy())
+    table.attrs.update(
+        cached_subjects=cached, shared_subjects=shared,
+        shards_loaded=pool.shards_loaded, peak_pool_rows=pool.peak_rows,
+    )
+    return table, src
+
+
+def read_store_subjects(subj_file, store, prop_type, *, columns=INGEST_COLS):
+    """The normalized subject file for a run against store (checked to suit prop_type)."""
+    store.check_prop_type(prop_type)
+    return normalize_frame(read_table(subj_file, columns), prop_type)
+
+
+def read_store_inputs(subj_file, store, prop_type, rule_sets, *, columns=INGEST_COLS, progress=None):
+    """read_inputs() with the Data Source taken from a PoolStore: (subj, the rows it can match)."""
+    if not isinstance(store, PoolStore):
+        store = PoolStore(store)
+    subj = read_store_subjects(subj_file, store, prop_type, columns=columns)
+    return subj, store.pool_for(subj, rule_sets, prop_type, progress)
+
+
+def validate_store(subj, store, required_cols):
+    """validate_frames() for a sharded run: subjects filtered as usual, the source counted in the store.
+
+    The report's src is None (match_sharded() drops the incomplete rows as
+    shards load) and src_after is the number of complete stored rows.
+    """
+    stub = pd.DataFrame(columns=[col for col, _ in store.info()["columns"]])
+    report = validate_frames(subj, stub, required_cols)
+    if report["subj"] is not None:
+        report["src_nulls"], report["src_before"], report["src_after"] = store.null_counts(required_cols)
+        report["src"] = None
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a Data Source file into a pool store.")
+    parser.add_argument("source", help="Data Source file (.xlsx, .csv or .parquet)")
+    parser.add_argument("store", help="Store file to create or replace (.sqlite)")
+    parser.add_argument("--prop-type", choices=PROPERTY_TYPES, default="Hotel")
+    parser.add_argument("--force", action="store_true", help="Import even if the store already holds this file.")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    store = PoolStore.import_file(args.source, args.prop_type, args.store, force=args.force)
+    info = store.info()
+    print(
+        f"{info['rows']} {info['prop_type']} rows from {info['source'] or args.source} in {store.path} "
+        f"({os.path.getsize(store.path) / 1024 / 1024:.1f} MB, {time.perf_counter() - started:.1f}s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Per-stage wall-time and call-count recording for the matching pipeline.
+
+The engine wraps its stages in stage("name"); nothing is recorded unless a
+StageTimer is active, so the hooks cost next to nothing in normal runs.
+
+    timer = StageTimer(profile=True)
+    with timer.activate():
+        run_matching(subj, src, prop_type="Hotel")
+    timer.summary()            # [{"stage", "calls", "seconds", "share"}, ...]
+    timer.write_trace("trace.json")   # chrome://tracing / Perfetto format
+
+Timers are per context (contextvars), so concurrent Streamlit sessions don't
+mix their numbers. Worker processes are not recorded; their stages show up
+as time in the parent's scan stage.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+_ACTIVE = contextvars.ContextVar("comps_stage_timer", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class StageTimer:
+    """Totals per stage name, plus a trace event for every traced stage entered."""
+
+    def __init__(self, profile=False):
+        self.totals = {}  # name -> [calls, seconds]
+        self.events = []
+        self.profile = cProfile.Profile() if profile else None
+        self.started = None
+        self.elapsed = 0.0
+        self.lock = threading.Lock()  # stages may finish on reader threads
+
+    def __getstate__(self):
+        # Picklable (e.g. as part of a background job's stored result): no lock,
+        # and the profile as pstats data, which comes back as a pstats.Stats.
+        state = dict(self.__dict__, lock=None)
+        if self.profile is not None:
+            stats = self.profile if isinstance(self.profile, pstats.Stats) else pstats.Stats(self.profile)
+            state["profile"] = stats.stats
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        if self.profile is not None:
+            stats = pstats.Stats()
+            stats.stats = self.profile
+            stats.get_top_level_stats()
+            self.profile = stats
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Record stages (and profile, if enabled) for the duration of the block."""
+        token = _ACTIVE.set(self)
+        self.started = time.perf_counter()
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            yield self
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+            self.elapsed += time.perf_counter() - self.started
+            _ACTIVE.reset(token)
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += calls
+            total[1] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name, trace=True):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add(name, end - start)
+            if trace:
+                with self.lock:
+                    self.events.append((name, start, end, threading.get_ident()))
+
+    def summary(self):
+        """One dict per stage, slowest first; share is of the timer's active wall time."""
+        wall = self.elapsed or sum(s for _, s in self.totals.values()) or 1.0
+        rows = [
+            {"stage": name, "calls": calls, "seconds": round(seconds, 6), "share": round(seconds / wall, 4)}
+            for name, (calls, seconds) in self.totals.items()
+        ]
+        return sorted(rows, key=lambda r: r["seconds"], reverse=True)
+
+    def profile_text(self, limit=30, sort="cumulative"):
+        """pstats report of the profiled run ("" without profile=True)."""
+        if self.profile is None:
+            return ""
+        out = io.StringIO()
+        stats = self.profile if isinstance(self.profile, pstats.Stats) else pstats.Stats(self.profile)
+        stats.stream = out
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def trace(self):
+        """Summary plus Chrome trace events (microseconds from the first event)."""
+        origin = min((start for _, start, _, _ in self.events), default=0.0)
+        pid = os.getpid()
+        return {
+            "summary": self.summary(),
+            "wall_seconds": round(self.elapsed, 6),
+            "traceEvents": [
+                {
+                    "name": name, "ph": "X", "pid": pid, "tid": tid,
+                    "ts": round((start - origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1),
+                }
+                for name, start, end, tid in self.events
+            ],
+        }
+
+    def write_trace(self, target):
+        """Write trace() as JSON to a path or text file object."""
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, "w", encoding="utf-8") as fh:
+                json.dump(self.trace(), fh, indent=1)
+        else:
+            json.dump(self.trace(), target, indent=1)
+
+
+def active_timer():
+    return _ACTIVE.get()
+
+
+def stage(name, trace=True):
+    """Context manager timing `name` on the active timer; a no-op without one.
+
+    trace=False only adds to the totals, for stages entered once per subject.
+    """
+    timer = _ACTIVE.get()
+    if timer is None:
+        return _NOOP
+    return timer.stage(name, trace)
+
+
+def timed(name, trace=True):
+    """Decorator form of stage(): every call of the function is timed as `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name, trace):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def combined(timers):
+    """One StageTimer holding the totals, events and profiles of several (e.g. two phases of a run).
+
+    For reporting only: its profile is a pstats.Stats, so it can't be activated.
+    """
+    out = StageTimer()
+    profiles = []
+    for timer in timers:
+        for name, (calls, seconds) in timer.totals.items():
+            out.add(name, seconds, calls)
+        out.events.extend(timer.events)
+        out.elapsed += timer.elapsed
+        if timer.profile is not None:
+            profiles.append(timer.profile)
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        out.profile = stats
+    return out
+
+
+def counted(name, fn):
+    """fn, wrapped to add each call's time to `name` when a timer is active."""
+    timer = _ACTIVE.get()
+    if timer is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timer.add(name, time.perf_counter() - start)
+
+    return wrapper
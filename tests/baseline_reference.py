@@ -0,0 +1,424 @@
+"""The matcher and results loop of the original single-file app, as a reference.
+
+Copied from the app before the engine rewrites (debug printing left out),
+so tests can check that today's pipeline still writes the same results.
+Don't "fix" anything here: it is the behavior the output must keep.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+MAIN_BAND = 0.50
+
+RULE_SETS = [
+    {"name": "Static_7mi", "max_radius_miles": 7.0, "max_gap_pct_main": MAIN_BAND,
+     "max_gap_pct_value": 0.50, "max_gap_pct_size": 0.50},
+    {"name": "Static_15mi", "max_radius_miles": 15.0, "max_gap_pct_main": MAIN_BAND,
+     "max_gap_pct_value": 0.50, "max_gap_pct_size": 0.50},
+    {"name": "Category 1", "max_radius_miles": 10.0, "max_gap_pct_main": MAIN_BAND,
+     "max_gap_pct_value": 0.80, "max_gap_pct_size": 0.80},
+    {"name": "Category 2", "max_radius_miles": 15.0, "max_gap_pct_main": MAIN_BAND,
+     "max_gap_pct_value": 1.20, "max_gap_pct_size": 1.20},
+    {"name": "Category 3", "max_radius_miles": 15.0, "max_gap_pct_main": MAIN_BAND,
+     "max_gap_pct_value": 1.50, "max_gap_pct_size": 1.50},
+]
+
+OUTPUT_COLS_HOTEL = [
+    "Property Account No", "Hotel Name", "Rooms", "VPR", "Property Address",
+    "Property City", "Property County", "Property State", "Property Zip Code",
+    "Assessed Value-2023", "Market Value-2023", "Hotel Class", "description",
+    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
+    "Owner State", "Owner ZIP", "Contact Person", "Designation"
+]
+
+OUTPUT_COLS_OTHER = [
+    "Property Account No", "GBA", "VPU", "Property Address",
+    "Property City", "Property County", "Property State", "Property Zip Code",
+    "Assessed Value-2023", "Total Market value-2023", "description",
+    "Owner Name/ LLC Name", "Owner Street Address", "Owner City",
+    "Owner State", "Owner ZIP"
+]
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    try:
+        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+        lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+        dlon = lon2 - lon1
+        dlat = lat2 - lat1
+        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        c = 2 * math.asin(math.sqrt(a))
+        return c * 3956  # miles
+    except Exception:
+        return 999999
+
+
+def norm_desc(s):
+    if pd.isna(s):
+        return ""
+    return str(s).strip().lower()
+
+
+def norm_class(v):
+    try:
+        return int(float(v))
+    except Exception:
+        return np.nan
+
+
+def tolerance_ok(subj_val, comp_val, pct=0.50):
+    if pd.isna(subj_val) or pd.isna(comp_val) or subj_val == 0:
+        return False
+    return abs(comp_val - subj_val) / subj_val <= pct
+
+
+def get_prefix_6(val):
+    if pd.isna(val):
+        return ""
+    clean = (
+        str(val)
+        .lower()
+        .replace(" ", "")
+        .replace(".", "")
+        .replace("-", "")
+        .replace(",", "")
+        .replace("/", "")
+    )
+    return clean[:6]
+
+
+def unique_ok(subject, candidate, chosen_comps, is_hotel):
+    def norm(x): return str(x).strip().lower()
+    pairs = [(subject, candidate)] + [(c, candidate) for c in chosen_comps]
+    for a, b in pairs:
+        if norm(a.get("Property Account No", "")) == norm(b.get("Property Account No", "")):
+            return False
+        if len(get_prefix_6(a.get("Owner Name/ LLC Name", ""))) >= 4 and \
+           get_prefix_6(a.get("Owner Name/ LLC Name", "")) == get_prefix_6(b.get("Owner Name/ LLC Name", "")):
+            return False
+        if is_hotel:
+            if len(get_prefix_6(a.get("Hotel Name", ""))) >= 4 and \
+               get_prefix_6(a.get("Hotel Name", "")) == get_prefix_6(b.get("Hotel Name", "")):
+                return False
+            if len(get_prefix_6(a.get("Owner Street Address", ""))) >= 4 and \
+               get_prefix_6(a.get("Owner Street Address", "")) == get_prefix_6(b.get("Owner Street Address", "")):
+                return False
+        if len(get_prefix_6(a.get("Property Address", ""))) >= 4 and \
+           get_prefix_6(a.get("Property Address", "")) == get_prefix_6(b.get("Property Address", "")):
+            return False
+    return True
+
+
+def class_ok_hotel(subj_c, comp_c):
+    subj_c = int(subj_c)
+    comp_c = int(comp_c)
+    if subj_c == 8:
+        return comp_c == 8
+    if comp_c == 8:
+        return False
+    if subj_c == 7:
+        return comp_c in (6, 7)
+    if subj_c == 6:
+        return comp_c in (5, 6, 7)
+    return (comp_c >= subj_c - 1) and (comp_c <= subj_c + 2)
+
+
+def class_ok_other(subj_c, comp_c):
+    try:
+        subj_c = int(subj_c)
+        comp_c = int(comp_c)
+    except Exception:
+        return False
+    return abs(comp_c - subj_c) <= 2
+
+
+def find_comps(
+    srow, src_df, *, is_hotel, use_hotel_class_rule, max_radius_miles, max_gap_pct_main,
+    max_gap_pct_value, max_gap_pct_size, max_comps, prop_type=None,
+):
+    if is_hotel:
+        metric_field = "VPR"
+        size_field = "Rooms"
+        value_field = "Total Market value-2023"
+    else:
+        metric_field = "VPU"
+        ptype = (prop_type or "").strip().lower()
+        if ptype == "apartment":
+            size_field = "Units"
+        else:
+            size_field = "GBA"
+        value_field = "Total Market value-2023"
+
+    subj_class = srow.get("Class_Num")
+    subj_metric = srow.get(metric_field)
+    subj_value = srow.get(value_field)
+    subj_size = srow.get(size_field)
+    slat, slon = srow.get("lat"), srow.get("lon")
+
+    if pd.isna(subj_metric):
+        return []
+
+    candidates = []
+    for _, crow in src_df.iterrows():
+        comp_class = crow.get("Class_Num")
+
+        class_ok_flag = True
+        if is_hotel and use_hotel_class_rule:
+            if not class_ok_hotel(subj_class, comp_class):
+                class_ok_flag = False
+        else:
+            if pd.notna(subj_class) and pd.notna(comp_class):
+                if not class_ok_other(subj_class, comp_class):
+                    class_ok_flag = False
+        if not class_ok_flag:
+            continue
+
+        comp_metric = crow.get(metric_field)
+        comp_value = crow.get(value_field)
+        comp_size = crow.get(size_field)
+
+        if pd.isna(comp_metric) or comp_metric > subj_metric:
+            continue
+        if not tolerance_ok(subj_metric, comp_metric, max_gap_pct_main):
+            continue
+        if not tolerance_ok(subj_value, comp_value, max_gap_pct_value):
+            continue
+        if not tolerance_ok(subj_size, comp_size, max_gap_pct_size):
+            continue
+
+        clat, clon = crow.get("lat"), crow.get("lon")
+        dist_miles = 999
+        if pd.notna(slat) and pd.notna(slon) and pd.notna(clat) and pd.notna(clon):
+            dist_miles = haversine(slat, slon, clat, clon)
+        if dist_miles > max_radius_miles:
+            continue
+
+        ccopy = crow.copy()
+        ccopy["Match_Method"] = f"Within {max_radius_miles} Miles"
+        ccopy["Distance_Calc"] = dist_miles if dist_miles != 999 else "N/A"
+        ccopy[f"{metric_field}_Diff"] = float(subj_metric - comp_metric)
+        candidates.append(ccopy)
+
+    if not candidates:
+        return []
+
+    def market_diff(cand_row):
+        cv = cand_row.get(value_field)
+        if pd.isna(subj_value) or pd.isna(cv):
+            return float("inf")
+        return abs(float(cv) - float(subj_value))
+
+    rows_only = candidates[:]
+    rows_only.sort(key=lambda r: r.get(metric_field, 0.0), reverse=True)
+
+    top_metric = rows_only[0].get(metric_field)
+    top_group = [r for r in rows_only if r.get(metric_field) == top_metric]
+    comp1 = min(top_group, key=market_diff) if top_group else rows_only[0]
+    comp2 = rows_only[-1]
+    comp3 = rows_only[len(rows_only) // 2]
+
+    final_comps = []
+    chosen_rows = []
+    for crow in [comp1, comp2, comp3]:
+        if crow is None:
+            continue
+        if not unique_ok(srow, crow, chosen_rows, is_hotel=is_hotel):
+            continue
+        ccopy = crow.copy()
+        final_comps.append(ccopy)
+        chosen_rows.append(ccopy)
+        if len(final_comps) == max_comps:
+            break
+    return final_comps
+
+
+def find_comps_cascading(srow, src_df, *, is_hotel, use_hotel_class_rule, max_comps, rule_sets, prop_type=None):
+    all_comps = []
+    chosen_rows = []
+    for rules in rule_sets:
+        if len(all_comps) >= max_comps:
+            break
+        comps = find_comps(
+            srow, src_df,
+            is_hotel=is_hotel,
+            use_hotel_class_rule=use_hotel_class_rule,
+            max_radius_miles=rules["max_radius_miles"],
+            max_gap_pct_main=rules["max_gap_pct_main"],
+            max_gap_pct_value=rules["max_gap_pct_value"],
+            max_gap_pct_size=rules["max_gap_pct_size"],
+            max_comps=max_comps,
+            prop_type=prop_type,
+        )
+        for crow in comps:
+            if len(all_comps) >= max_comps:
+                break
+            if not unique_ok(srow, crow, chosen_rows, is_hotel=is_hotel):
+                continue
+            ccopy = crow.copy()
+            ccopy["Rule_Set"] = rules["name"]
+            chosen_rows.append(ccopy)
+            all_comps.append(ccopy)
+    return all_comps
+
+
+def get_val(row, col):
+    if col == "Hotel Class":
+        return row.get("Hotel class values", "")
+    if col == "Property County":
+        return row.get("Property County", row.get("County", ""))
+    return row.get(col, "")
+
+
+def single_mode(rule_mode, category):
+    """(radius, main, value, size) the app matched with when cascading was off."""
+    if rule_mode == "Static":
+        return 7.0, MAIN_BAND, 0.50, 0.50
+    if category == "Category 1":
+        return 10.0, MAIN_BAND, 0.80, 0.80
+    if category == "Category 2":
+        return 15.0, MAIN_BAND, 1.20, 1.20
+    return 15.0, MAIN_BAND, 1.50, 1.50
+
+
+def baseline_results(
+    subj_file, src_file, *, prop_type, use_cascading=True, max_comps=3, rule_mode="Static",
+    category=None, use_overpaid=False, overpaid_base_dim=None, overpaid_pct=0.0,
+):
+    """The results table "Run Matching" produced, from two Excel files (None if nothing to match)."""
+    is_hotel = prop_type == "Hotel"
+    use_hotel_class_rule = is_hotel
+    max_radius, max_gap_pct_main, max_gap_pct_value, max_gap_pct_size = single_mode(rule_mode, category)
+
+    subj = pd.read_excel(subj_file)
+    src = pd.read_excel(src_file)
+    subj.columns = subj.columns.str.strip()
+    src.columns = src.columns.str.strip()
+
+    desc_col = "description"
+    if desc_col in subj.columns and desc_col in src.columns and prop_type != "Hotel":
+        subj["_desc_norm"] = subj[desc_col].apply(norm_desc)
+        src["_desc_norm"] = src[desc_col].apply(norm_desc)
+
+    for df in (subj, src):
+        if "Property Account No" in df.columns:
+            df["Property Account No"] = df["Property Account No"].astype(str).str.strip()
+        elif "Concat" in df.columns:
+            df["Property Account No"] = df["Concat"].astype(str).str.extract(r"(\d+)", expand=False)
+
+        if "Hotel class values" in df.columns:
+            df["Class_Num"] = df["Hotel class values"].apply(norm_class)
+        elif "Class" in df.columns:
+            df["Class_Num"] = df["Class"].apply(norm_class)
+        else:
+            df["Class_Num"] = np.nan
+
+        for c in ["Property Zip Code", "Rooms", "Units", "GBA", "VPR", "VPU",
+                  "Market Value-2023", "Total Market value-2023", "lat", "lon"]:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors="coerce")
+
+        if "lon" in df.columns:
+            df["lon"] = df["lon"].apply(lambda x: -abs(x) if pd.notna(x) else x)
+
+    if is_hotel:
+        required_cols = ["Property Zip Code", "Class_Num", "VPR", "Rooms"]
+    elif prop_type == "Apartment":
+        required_cols = ["Property Zip Code", "VPU", "Units"]
+    else:
+        required_cols = ["Property Zip Code", "VPU", "GBA"]
+    subj = subj.dropna(subset=[c for c in required_cols if c in subj.columns])
+    src = src.dropna(subset=[c for c in required_cols if c in src.columns])
+    if len(subj) == 0 or len(src) == 0:
+        return None
+
+    output_cols = OUTPUT_COLS_HOTEL if is_hotel else OUTPUT_COLS_OTHER
+    metric_field = "VPR" if is_hotel else "VPU"
+
+    results = []
+    for _, srow in subj.iterrows():
+        src_candidates = src
+        if prop_type in ("Retail", "Warehouse") and "_desc_norm" in subj.columns and "_desc_norm" in src.columns:
+            subj_desc = srow.get("_desc_norm", "")
+            if subj_desc:
+                src_candidates = src_candidates[src_candidates["_desc_norm"] == subj_desc]
+            else:
+                src_candidates = src_candidates.iloc[0:0]
+
+        if use_cascading:
+            comps = find_comps_cascading(
+                srow, src_candidates,
+                is_hotel=is_hotel, use_hotel_class_rule=use_hotel_class_rule,
+                max_comps=max_comps, rule_sets=RULE_SETS,
+            )
+        else:
+            comps = find_comps(
+                srow, src_candidates,
+                is_hotel=is_hotel, use_hotel_class_rule=use_hotel_class_rule,
+                max_radius_miles=max_radius, max_gap_pct_main=max_gap_pct_main,
+                max_gap_pct_value=max_gap_pct_value, max_gap_pct_size=max_gap_pct_size,
+                max_comps=max_comps,
+            )
+
+        row = {}
+        for c in output_cols:
+            row[f"Subject_{c}"] = get_val(srow, c)
+        for k in range(max_comps):
+            prefix = f"Comp{k+1}"
+            if k < len(comps):
+                crow = comps[k]
+                for c in output_cols:
+                    row[f"{prefix}_{c}"] = get_val(crow, c)
+                row[f"{prefix}_Match_Method"] = crow.get("Match_Method", "N/A")
+                row[f"{prefix}_Rule_Set"] = crow.get("Rule_Set", rule_mode)
+                d = crow.get("Distance_Calc", "N/A")
+                row[f"{prefix}_Distance_Miles"] = f"{d:.2f}" if isinstance(d, (int, float)) else d
+                diff = crow.get(f"{metric_field}_Diff", "")
+                row[f"{prefix}_{metric_field}_Gap"] = f"{diff:.2f}" if isinstance(diff, (int, float)) else diff
+            else:
+                for c in output_cols:
+                    row[f"{prefix}_{c}"] = ""
+                row[f"{prefix}_Match_Method"] = ""
+                row[f"{prefix}_Rule_Set"] = ""
+                row[f"{prefix}_Distance_Miles"] = ""
+                row[f"{prefix}_{metric_field}_Gap"] = ""
+
+        if use_overpaid:
+            comp_metrics = []
+            for k2 in range(max_comps):
+                val = row.get(f"Comp{k2+1}_{metric_field}", None)
+                if val not in (None, "", "N/A"):
+                    try:
+                        comp_metrics.append(float(val))
+                    except Exception:
+                        pass
+            if len(comp_metrics) > 0:
+                median_metric = float(pd.Series(comp_metrics).median())
+                if overpaid_base_dim:
+                    if overpaid_base_dim == "Rooms":
+                        subj_dim = srow.get("Rooms", 0)
+                    elif overpaid_base_dim == "Units":
+                        subj_dim = srow.get("Units", 0)
+                    else:
+                        subj_dim = srow.get("GBA", 0)
+                else:
+                    subj_dim = 0
+                try:
+                    subj_dim = float(subj_dim)
+                except Exception:
+                    subj_dim = 0.0
+                step3_val = median_metric * subj_dim * overpaid_pct
+                subj_mv = srow.get("Market Value-2023" if is_hotel else "Total Market value-2023", 0)
+                try:
+                    subj_mv = float(subj_mv)
+                except Exception:
+                    subj_mv = 0.0
+                overpaid_val = subj_mv * overpaid_pct - step3_val
+            else:
+                overpaid_val = ""
+            row["Subject_Overpaid_Value"] = overpaid_val
+        else:
+            row["Subject_Overpaid_Value"] = ""
+        results.append(row)
+    return pd.DataFrame(results)
@@ -0,0 +1,46 @@
+"""Seeded synthetic rolls for the tests: comps_bench.make_roll, tuned so subjects find comps."""
+
+import numpy as np
+import pandas as pd
+
+from comps_bench import make_roll, make_subjects
+
+NAME_COLS = ("Owner Name/ LLC Name", "Hotel Name", "Owner Street Address")
+
+
+def distinct_names(src):
+    """Number most owner/hotel names so their 6-character prefixes differ.
+
+    The synthetic roll reuses a handful of names, so the duplicate rules would
+    reject nearly every candidate; every fourth row keeps its shared name.
+    """
+    src = src.copy()
+    numbered = pd.Series([f"{i:05d} " for i in range(len(src))], index=src.index)
+    shared = np.arange(len(src)) % 4 == 0
+    for col in NAME_COLS:
+        if col in src.columns:
+            src[col] = src[col].where(shared | src[col].isna(), numbered + src[col].astype(str))
+    return src
+
+
+def sample_roll(prop_type, n_source, n_subjects, *, seed=7):
+    """Raw (subject, source) frames: subjects are drawn from the source roll."""
+    src = distinct_names(make_roll(n_source, prop_type, seed=seed))
+    if prop_type == "Hotel":  # the hotel value band reads this column
+        src["Total Market value-2023"] = src["Market Value-2023"]
+    return make_subjects(src, n_subjects, seed=seed + 4), src
+
+
+def write_roll(subj, src, directory, ext="csv"):
+    """Write both frames as subject.<ext> / source.<ext> in directory; returns the two paths."""
+    paths = []
+    for name, df in (("subject", subj), ("source", src)):
+        path = directory / f"{name}.{ext}"
+        if ext == "xlsx":
+            df.to_excel(path, index=False)
+        elif ext == "parquet":
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+        paths.append(path)
+    return tuple(paths)
@@ -0,0 +1,86 @@
+"""Today's results must match what the original app wrote for the same files."""
+
+import pandas as pd
+import pytest
+
+from baseline_reference import baseline_results
+from comps_engine import read_inputs, required_columns, run_matching, validate_frames
+from comps_output import open_result_writer
+from sample_rolls import sample_roll, write_roll
+
+N_SOURCE = 600
+N_SUBJECTS = 24
+
+
+@pytest.fixture(scope="module")
+def rolls(tmp_path_factory):
+    """Seeded subject/source Excel files per property type."""
+    made = {}
+
+    def files(prop_type):
+        if prop_type not in made:
+            subj, src = sample_roll(prop_type, N_SOURCE, N_SUBJECTS)
+            made[prop_type] = write_roll(subj, src, tmp_path_factory.mktemp(prop_type.lower()), "xlsx")
+        return made[prop_type]
+
+    return files
+
+
+def engine_results(subj_file, src_file, out_file, *, prop_type, **options):
+    """Results as the CLI writes them, read back from the Excel file."""
+    subj, src = read_inputs(subj_file, src_file, prop_type, parallel=False)
+    report = validate_frames(subj, src, required_columns(prop_type))
+    frame = run_matching(report["subj"], report["src"], prop_type=prop_type, **options)
+    with open_result_writer(out_file) as writer:
+        writer.write_frame(frame)
+    return pd.read_excel(out_file)
+
+
+def expected_results(subj_file, src_file, out_file, *, prop_type, **options):
+    """Results as the original app wrote them, read back from the Excel file."""
+    frame = baseline_results(subj_file, src_file, prop_type=prop_type, **options)
+    with pd.ExcelWriter(out_file, engine="xlsxwriter") as writer:
+        frame.to_excel(writer, index=False)
+    return pd.read_excel(out_file)
+
+
+def assert_same_results(rolls, tmp_path, prop_type, **options):
+    subj_file, src_file = rolls(prop_type)
+    got = engine_results(subj_file, src_file, tmp_path / "engine.xlsx", prop_type=prop_type, **options)
+    want = expected_results(subj_file, src_file, tmp_path / "baseline.xlsx", prop_type=prop_type, **options)
+    assert got["Comp1_Property Account No"].notna().any()  # the roll must produce some comps
+    pd.testing.assert_frame_equal(got, want)
+
+
+@pytest.mark.parametrize("prop_type", ["Hotel", "Apartment", "Retail"])
+@pytest.mark.parametrize("use_cascading", [True, False])
+def test_results_match_baseline(rolls, tmp_path, prop_type, use_cascading):
+    assert_same_results(rolls, tmp_path, prop_type, use_cascading=use_cascading)
+
+
+@pytest.mark.parametrize("rule_mode, category", [("Category", "Category 1"), ("Category", "Category 3")])
+def test_single_mode_categories_match_baseline(rolls, tmp_path, rule_mode, category):
+    assert_same_results(rolls, tmp_path, "Retail", use_cascading=False, rule_mode=rule_mode, category=category)
+
+
+def test_county_header_matches_baseline(rolls, tmp_path):
+    """Rolls with a "County" header instead of "Property County" still fill that column."""
+    renamed = []
+    for file in rolls("Retail"):
+        renamed.append(tmp_path / file.name)
+        pd.read_excel(file).rename(columns={"Property County": "County"}).to_excel(renamed[-1], index=False)
+    subj_file, src_file = renamed
+
+    got = engine_results(subj_file, src_file, tmp_path / "engine.xlsx", prop_type="Retail")
+    want = expected_results(subj_file, src_file, tmp_path / "baseline.xlsx", prop_type="Retail")
+    assert got["Subject_Property County"].notna().any()
+    assert got["Comp1_Property County"].notna().any()
+    pd.testing.assert_frame_equal(got, want)
+
+
+@pytest.mark.parametrize("prop_type, base_dim", [("Hotel", "Rooms"), ("Apartment", "Units"), ("Retail", "GBA")])
+def test_more_comps_and_overpaid_match_baseline(rolls, tmp_path, prop_type, base_dim):
+    assert_same_results(
+        rolls, tmp_path, prop_type,
+        max_comps=5, use_overpaid=True, overpaid_base_dim=base_dim, overpaid_pct=0.10,
+    )
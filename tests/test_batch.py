@@ -0,0 +1,102 @@
+"""Batch runs: files mixing property types, each type matched as a run of its own."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comps_cli import main
+from comps_engine import (
+    PROPERTY_TYPE_COL,
+    default_overpaid_base,
+    iter_result_frames,
+    match_batch,
+    property_type_names,
+    read_batch_inputs,
+    read_inputs,
+    required_columns,
+    split_by_property_type,
+    validate_frames,
+)
+from sample_rolls import sample_roll, write_roll
+
+LABELS = {"Hotel": "hotels", "Retail": " Retail ", "Apartment": "APARTMENT"}
+
+
+@pytest.fixture(scope="module")
+def mixed_files(tmp_path_factory):
+    """Subject and source CSVs mixing three types plus rows of no known type, and each type's own pair."""
+    directory = tmp_path_factory.mktemp("batch")
+    subj_parts, src_parts, single = [], [], {}
+    for seed, (ptype, label) in enumerate(LABELS.items()):
+        subj, src = sample_roll(ptype, 600, 12, seed=seed)
+        subj.insert(0, PROPERTY_TYPE_COL, label)
+        src.insert(0, PROPERTY_TYPE_COL, label)
+        subj_parts.append(subj)
+        src_parts.append(src)
+    unknown = src_parts[1].head(5).assign(**{PROPERTY_TYPE_COL: "Farm"})
+    subj = pd.concat(subj_parts, ignore_index=True)
+    src = pd.concat([*src_parts, unknown], ignore_index=True)
+    for ptype, label in LABELS.items():
+        own = directory / ptype
+        own.mkdir()
+        single[ptype] = write_roll(subj[subj[PROPERTY_TYPE_COL] == label], src[src[PROPERTY_TYPE_COL] == label], own)
+    return write_roll(subj, src, directory), single
+
+
+def test_property_type_names():
+    names = property_type_names(["hotels", " Retail ", "office", "Farm", None, 3])
+    assert names.tolist()[:3] == ["Hotel", "Retail", "Office"]
+    assert names.iloc[3:].isna().all()
+
+
+def test_split_by_property_type():
+    df = pd.DataFrame({PROPERTY_TYPE_COL: ["Retail", "Hotel", "x", "retail"], "_desc_norm": ["a", "b", "c", "d"]})
+    parts = split_by_property_type(df)
+    assert list(parts) == ["Hotel", "Retail", None]
+    assert parts["Retail"].index.tolist() == [0, 3]
+    assert "_desc_norm" not in parts["Hotel"].columns
+    assert parts[None].index.tolist() == [2]
+
+
+def test_read_batch_inputs_needs_the_type_column(mixed_files):
+    _, single = mixed_files
+    with pytest.raises(ValueError, match="no 'Use' column"):
+        read_batch_inputs(*single["Retail"], type_col="Use", parallel=False)
+
+
+def test_batch_matches_each_type_like_its_own_run(mixed_files):
+    files, single = mixed_files
+    subj_parts, src_parts = read_batch_inputs(*files, parallel=False)
+    assert len(src_parts.pop(None)) == 5 and None not in subj_parts
+    seen = []
+    batch = match_batch(subj_parts, src_parts, max_comps=4, progress=lambda ptype, done, total: seen.append(ptype))
+    assert list(batch) == ["Hotel", "Apartment", "Retail"] and set(seen) == set(batch)
+    for ptype, part in batch.items():
+        options = dict(
+            prop_type=ptype, max_comps=4, use_overpaid=True,
+            overpaid_base_dim=default_overpaid_base(ptype), overpaid_pct=0.1,
+        )
+        subj, src = read_inputs(*single[ptype], ptype, parallel=False)
+        report = validate_frames(subj, src, required_columns(ptype))
+        expected = pd.concat(iter_result_frames(report["subj"], report["src"], **options), ignore_index=True)
+        got = pd.concat(
+            iter_result_frames(part["subj"], part["src"], comp_table=part["comp_table"], **options),
+            ignore_index=True,
+        )
+        expected = expected.drop(columns=[c for c in expected if c.endswith(PROPERTY_TYPE_COL)])
+        got = got[expected.columns]
+        pd.testing.assert_frame_equal(got, expected, check_dtype=False, obj=ptype)
+        assert part["report"]["subj_after"] == len(report["subj"])
+
+
+@pytest.mark.parametrize("ptype", ["Retail", "Apartment"])
+def test_cli_single_and_batch_runs_share_the_overpaid_base(mixed_files, tmp_path, ptype):
+    files, single = mixed_files
+    common = ["--overpaid-pct", "10", "--no-cache", "--no-comp-cache"]
+    single_out, batch_out = tmp_path / "single.xlsx", tmp_path / "batch.xlsx"
+    assert main([*map(str, single[ptype]), "--prop-type", ptype, "-o", str(single_out), *common]) == 0
+    assert main([*map(str, files), "--batch", "-o", str(batch_out), *common]) == 0
+    alone, batch = pd.read_excel(single_out), pd.read_excel(batch_out, sheet_name=ptype)
+    overpaid = [c for c in alone.columns if "Overpaid" in c]
+    assert overpaid
+    np.testing.assert_allclose(batch[overpaid].to_numpy(float), alone[overpaid].to_numpy(float))
@@ -0,0 +1,53 @@
+import json
+
+import pandas as pd
+import pytest
+
+from comps_bench import main, make_roll, make_subjects, report_line
+from comps_engine import OUTPUT_COLS_HOTEL, OUTPUT_COLS_OTHER, required_columns
+
+
+@pytest.mark.parametrize("prop_type", ["Hotel", "Apartment", "Office"])
+def test_make_roll_is_seeded_and_has_the_app_columns(prop_type):
+    roll = make_roll(500, prop_type, seed=3)
+    pd.testing.assert_frame_equal(roll, make_roll(500, prop_type, seed=3))
+    assert not roll.equals(make_roll(500, prop_type, seed=4))
+    output_cols = OUTPUT_COLS_HOTEL if prop_type == "Hotel" else OUTPUT_COLS_OTHER
+    names = set(roll.columns) | {"Hotel Class"}
+    assert set(required_columns(prop_type)) - {"Class_Num"} <= names
+    assert {c for c in output_cols if c not in ("Contact Person", "Designation")} <= names
+    assert roll["Property Account No"].is_unique
+
+
+def test_make_roll_blanks_about_null_rate_of_the_cells():
+    roll = make_roll(4000, "Retail", seed=1, null_rate=0.1)
+    share = roll["VPU"].isna().mean()
+    assert 0.08 < share < 0.12
+    assert roll["Property Account No"].notna().all()
+
+
+def test_make_subjects_renumbers_accounts():
+    roll = make_roll(100, "Retail")
+    subj = make_subjects(roll, 10)
+    assert len(subj) == 10
+    assert subj["Property Account No"].str.startswith("S").all()
+    assert not set(subj["Property Account No"]) & set(roll["Property Account No"])
+
+
+def test_report_line_without_a_rate():
+    rec = {"stage": "match", "seconds": 0.0, "per_second": None, "unit": "subjects"}
+    assert "n/a subjects/s" in report_line(rec)
+
+
+def test_main_writes_a_timing_per_stage(tmp_path):
+    out = tmp_path / "bench.json"
+    assert main([
+        "--sizes", "200,400", "--prop-type", "Apartment", "--subjects", "20",
+        "--ingest-formats", "csv", "-o", str(out),
+    ]) == 0
+    result = json.loads(out.read_text())
+    stages = {(rec["source_rows"], rec["stage"]) for rec in result["results"]}
+    for n in (200, 400):
+        for stage in ("ingest", "compact", "match_single", "match", "assemble", "excel_export"):
+            assert (n, stage) in stages
+    assert "Apartment/match" in result["scaling"]
@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import comps_engine
+from comps_cache import CompCache, PoolCache, frame_digest
+from comps_engine import load_source_pool, match_results, read_inputs, required_columns, validate_frames
+from sample_rolls import sample_roll, write_roll
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    subj, src = sample_roll("Retail", 200, 5)
+    return write_roll(subj, src, tmp_path)[1]
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Count the files load_source_pool actually parses."""
+    calls = []
+    read_table = comps_engine.read_table
+
+    def counting(file, columns=None):
+        calls.append(file)
+        return read_table(file, columns)
+
+    monkeypatch.setattr(comps_engine, "read_table", counting)
+    return calls
+
+
+def test_pool_cache_skips_the_parse_on_a_repeat_load(tmp_path, source_file, reads):
+    cache = PoolCache(tmp_path / "cache")
+    first = load_source_pool(source_file, "Retail", cache)
+    again = load_source_pool(source_file, "Retail", cache)
+    assert len(reads) == 1
+    assert len(cache.entries()) == 1
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_pool_cache_misses_when_the_file_or_settings_change(tmp_path, source_file, reads):
+    cache = PoolCache(tmp_path / "cache")
+    load_source_pool(source_file, "Retail", cache)
+    load_source_pool(source_file, "Hotel", cache)  # no description column for hotels
+    with open(source_file, "a") as fh:
+        fh.write("\n")
+    load_source_pool(source_file, "Retail", cache)
+    assert len(reads) == 3
+    assert len(cache.entries()) == 3
+
+
+def test_pool_cache_evicts_least_recently_used(tmp_path):
+    frame = pd.DataFrame({"a": range(1000)})
+    cache = PoolCache(tmp_path / "cache")
+    for key in ("old", "mid"):
+        cache.put(key, frame)
+    os.utime(cache._path("old", "parquet"), (1, 1))
+    cache.max_bytes = cache.size_bytes()  # room for two frames
+    cache.put("new", frame)
+    assert cache.get("old") is None
+    assert cache.get("mid") is not None and cache.get("new") is not None
+
+
+def test_pool_cache_pickles_frames_parquet_cannot_hold(tmp_path):
+    mixed = pd.DataFrame({"Property Zip Code": [77001, "770O2", None]}, dtype=object)
+    cache = PoolCache(tmp_path / "cache")
+    cache.put("mixed", mixed)
+    assert [os.path.splitext(path)[1] for path, _, _ in cache.entries()] == [".pkl"]
+    pd.testing.assert_frame_equal(cache.get("mixed"), mixed)
+
+
+def test_pool_cache_drops_corrupt_entries(tmp_path):
+    cache = PoolCache(tmp_path / "cache")
+    cache.put("bad", pd.DataFrame({"a": [1.0]}))
+    with open(cache._path("bad", "parquet"), "wb") as fh:
+        fh.write(b"not parquet")
+    assert cache.get("bad") is None
+    assert cache.entries() == []
+
+
+def test_frame_digest_follows_values_not_float_width_or_nan_bits():
+    base = pd.DataFrame({"Class_Num": np.array([3.0, np.nan, 5.0]), "name": ["a", "b", None]})
+    narrow = base.astype({"Class_Num": np.float16})
+    other_nan = narrow.copy()
+    bits = other_nan["Class_Num"].to_numpy().view(np.uint16).copy()
+    bits[1] = 0x7FFF  # the NaN a Parquet float16 null reads back as
+    other_nan["Class_Num"] = bits.view(np.float16)
+    assert frame_digest(base) == frame_digest(narrow) == frame_digest(other_nan)
+    assert frame_digest(base) != frame_digest(base.assign(Class_Num=[3.0, np.nan, 4.0]))
+    assert frame_digest(base) != frame_digest(base.iloc[::-1])
+
+
+@pytest.fixture
+def hotel_inputs(tmp_path):
+    subj, src = sample_roll("Hotel", 300, 20)
+    files = write_roll(subj, src, tmp_path)
+
+    def read(pool_cache=None):
+        subj, src = read_inputs(*files, "Hotel", cache=pool_cache, parallel=False)
+        report = validate_frames(subj, src, required_columns("Hotel"))
+        return report["subj"].reset_index(drop=True), report["src"]
+
+    return read
+
+
+def test_comp_cache_rerun_reuses_every_subject(tmp_path, hotel_inputs):
+    subj, src = hotel_inputs()
+    comp_cache = CompCache(tmp_path / "cache")
+    first = match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache)
+    again = match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache)
+    assert first.attrs["cached_subjects"] == 0
+    assert again.attrs["cached_subjects"] == len(subj)
+    pd.testing.assert_frame_equal(again, match_results(subj, src, prop_type="Hotel"))
+
+
+def test_comp_cache_rerun_through_the_pool_cache_reuses_every_subject(tmp_path, hotel_inputs):
+    pool_cache, comp_cache = PoolCache(tmp_path / "cache"), CompCache(tmp_path / "cache")
+    subj, fresh = hotel_inputs(pool_cache)
+    first = match_results(subj, fresh, prop_type="Hotel", comp_cache=comp_cache)
+    subj, cached = hotel_inputs(pool_cache)  # the pool now comes back from Parquet
+    again = match_results(subj, cached, prop_type="Hotel", comp_cache=comp_cache)
+    assert again.attrs["cached_subjects"] == len(subj)
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_comp_cache_rematches_only_changed_subjects(tmp_path, hotel_inputs):
+    subj, src = hotel_inputs()
+    comp_cache = CompCache(tmp_path / "cache")
+    match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache)
+
+    edited = subj.copy()
+    edited.loc[3, "VPR"] *= 1.2
+    edited.loc[5, "Hotel Name"] = "Not a matching field"  # output only
+    table = match_results(edited, src, prop_type="Hotel", comp_cache=comp_cache)
+    assert table.attrs["cached_subjects"] == len(subj) - 1
+    pd.testing.assert_frame_equal(table, match_results(edited, src, prop_type="Hotel"))
+
+
+def test_comp_cache_keys_on_the_pool_and_settings(tmp_path, hotel_inputs):
+    subj, src = hotel_inputs()
+    comp_cache = CompCache(tmp_path / "cache")
+    match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache)
+    for options in ({"max_comps": 5}, {"use_cascading": False}, {"selection": "scored"}):
+        table = match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache, **options)
+        assert table.attrs["cached_subjects"] == 0, options
+    smaller = src.iloc[:-1]
+    assert match_results(subj, smaller, prop_type="Hotel", comp_cache=comp_cache).attrs["cached_subjects"] == 0
+
+
+def test_comp_cache_evicts_to_its_size_cap(tmp_path, hotel_inputs):
+    subj, src = hotel_inputs()
+    comp_cache = CompCache(tmp_path / "cache", max_bytes=1)
+    match_results(subj, src, prop_type="Hotel", comp_cache=comp_cache)
+    assert comp_cache.size_bytes() <= 1
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from comps_cli import main
+from comps_engine import required_columns
+from comps_store import PoolStore
+from sample_rolls import sample_roll, write_roll
+
+
+@pytest.fixture
+def retail_files(tmp_path):
+    subj, src = sample_roll("Retail", 300, 12)
+    return write_roll(subj, src, tmp_path)
+
+
+@pytest.fixture
+def matchable_accounts(retail_files):
+    subj = pd.read_csv(retail_files[0], dtype={"Property Account No": str})
+    return list(subj.dropna(subset=required_columns("Retail"))["Property Account No"])
+
+
+def run_cli(retail_files, tmp_path, *extra):
+    out = tmp_path / "out.csv"
+    status = main([
+        str(retail_files[0]), str(retail_files[1]), "--prop-type", "Retail",
+        "-o", str(out), "--no-cache", "--no-comp-cache", *extra,
+    ])
+    return status, out
+
+
+def test_writes_a_row_per_subject(retail_files, tmp_path, matchable_accounts):
+    status, out = run_cli(retail_files, tmp_path, "--max-comps", "4")
+    assert status == 0
+    results = pd.read_csv(out, dtype=str)
+    assert list(results["Subject_Property Account No"]) == matchable_accounts
+    assert "Comp4_Rule_Set" in results.columns
+    assert "Comp5_Rule_Set" not in results.columns
+
+
+@pytest.mark.parametrize("max_comps", ["0", "-2"])
+def test_rejects_max_comps_below_one(retail_files, tmp_path, capsys, max_comps):
+    with pytest.raises(SystemExit) as exc:
+        run_cli(retail_files, tmp_path, "--max-comps", max_comps)
+    assert exc.value.code == 2
+    assert "--max-comps" in capsys.readouterr().err
+
+
+def test_rejects_dynamic_mode_without_category(retail_files, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exc:
+        run_cli(retail_files, tmp_path, "--no-cascading", "--rule-mode", "Dynamic")
+    assert exc.value.code == 2
+    assert "--category" in capsys.readouterr().err
+
+
+def test_dynamic_mode_labels_comps_with_the_mode(retail_files, tmp_path):
+    status, out = run_cli(
+        retail_files, tmp_path, "--no-cascading", "--rule-mode", "Dynamic", "--category", "Category 3",
+    )
+    assert status == 0
+    labels = set(pd.read_csv(out, dtype=str)["Comp1_Rule_Set"].dropna())
+    assert labels == {"Dynamic"}
+
+
+def test_store_runs_write_the_same_file(retail_files, tmp_path):
+    _, plain = run_cli(retail_files, tmp_path)
+    store = tmp_path / "pool.sqlite"
+    PoolStore.import_file(retail_files[1], "Retail", store)
+    for extra in ([], ["--shards"]):
+        out = tmp_path / "store.csv"
+        assert main([str(retail_files[0]), str(store), "--prop-type", "Retail", "-o", str(out), *extra]) == 0
+        assert out.read_bytes() == plain.read_bytes(), extra
+
+
+def test_rejects_shards_without_a_store(retail_files, tmp_path):
+    with pytest.raises(SystemExit):
+        run_cli(retail_files, tmp_path, "--shards")
@@ -0,0 +1,132 @@
+"""Background jobs: status, cancellation, owners and the result store."""
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from comps_engine import match_results, read_inputs, required_columns, validate_frames
+from comps_jobs import JobRunner, JobStore, match_job, process_owner
+from sample_rolls import sample_roll, write_roll
+
+
+def wait(store, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+@pytest.fixture
+def runner(tmp_path):
+    runner = JobRunner(JobStore(tmp_path))
+    yield runner
+    runner.shutdown()
+
+
+def counting_job(job, n):
+    job.phase("count", n)
+    for i in range(n):
+        job.progress(i + 1, n)
+    return {"counted": n}
+
+
+def test_job_runs_and_keeps_its_result(runner):
+    job_id = runner.submit("count", counting_job, 5, key="k", label="five")
+    job = wait(runner.store, job_id)
+    assert (job["status"], job["phase"], job["done"], job["total"]) == ("done", "count", 5, 5)
+    assert job["owner"] == process_owner()
+    assert runner.store.result(job_id) == {"counted": 5}
+    assert [j["id"] for j in runner.store.jobs(kind="count", key="k")] == [job_id]
+
+
+def test_failed_job_records_the_error(runner):
+    def broken(job):
+        raise ValueError("no such column")
+
+    job = wait(runner.store, runner.submit("broken", broken))
+    assert (job["status"], job["error"]) == ("failed", "no such column")
+    assert runner.store.result(job["id"]) is None
+
+
+def test_cancel_stops_a_running_job_and_a_queued_one(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(job):
+        started.set()
+        while not release.wait(0.01):
+            job.progress(0, 1)
+
+    running = runner.submit("block", blocking)
+    queued = runner.submit("count", counting_job, 3)
+    assert started.wait(10)
+    assert runner.cancel(queued) and runner.cancel(running)
+    assert wait(runner.store, running)["status"] == "cancelled"
+    assert wait(runner.store, queued)["status"] == "cancelled"
+    assert runner.store.get(queued)["started"] is None
+    assert not runner.cancel(running)  # no longer active
+
+
+def test_new_runner_only_interrupts_jobs_of_exited_processes(tmp_path):
+    store = JobStore(tmp_path)
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    owners = {
+        "live": process_owner(),
+        "exited": f"{socket.gethostname()}:{int(exited.stdout)}",
+        "other host": "elsewhere.example:1",
+        "unknown": None,
+    }
+    ids = {}
+    for name, owner in owners.items():
+        ids[name] = store.create("match")
+        store.update(ids[name], status="running", owner=owner)
+    JobRunner(store).shutdown()
+    status = {name: store.get(job_id)["status"] for name, job_id in ids.items()}
+    assert status == {"live": "running", "exited": "failed", "other host": "running", "unknown": "failed"}
+
+
+def test_results_are_capped_by_size(tmp_path):
+    store = JobStore(tmp_path, max_bytes=150_000)
+    payload = b"x" * 100_000
+    for job_id in ("a", "b", "c"):
+        store.save_result(job_id, payload)
+        time.sleep(0.01)  # distinct mtimes
+    assert store.result("a") is None and store.result("b") is None
+    assert store.result("c") == payload
+    store.max_bytes = 0
+    store.evict()
+    assert store.result("c") == payload  # the newest result stays
+
+
+def test_prune_keeps_the_newest_finished_jobs(tmp_path):
+    store = JobStore(tmp_path, keep=2)
+    ids = [store.create("count") for _ in range(4)]
+    for job_id in ids:
+        store.update(job_id, status="done")
+        store.save_result(job_id, job_id)
+        time.sleep(0.01)
+    store.prune()
+    assert {job["id"] for job in store.jobs()} == set(ids[2:])
+    assert store.result(ids[0]) is None and store.result(ids[3]) == ids[3]
+
+
+def test_match_job_matches_like_match_results(runner, tmp_path):
+    subj, src = sample_roll("Apartment", 300, 10)
+    files = write_roll(subj, src, tmp_path)
+    job = wait(runner.store, runner.submit("match", match_job, *files, prop_type="Apartment", max_comps=4))
+    assert job["status"] == "done", job["error"]
+    out = runner.store.result(job["id"])
+
+    subj, src = read_inputs(*files, "Apartment", parallel=False)
+    report = validate_frames(subj, src, required_columns("Apartment"))
+    expected = match_results(report["subj"], report["src"], prop_type="Apartment", max_comps=4)
+    assert out["report"]["subj_after"] == len(report["subj"])
+    pd.testing.assert_frame_equal(out["comp_table"], expected)
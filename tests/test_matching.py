@@ -0,0 +1,114 @@
+"""match_results(): subjects sharing one matcher run, and the comp selection strategies."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comps_engine import comp_scores, fan_out, match_results, pick_scored, required_columns, validate_frames
+from sample_rolls import sample_roll
+
+
+@pytest.fixture(scope="module")
+def retail():
+    subj, src = sample_roll("Retail", 2000, 15)
+    report = validate_frames(subj, src, required_columns("Retail"))
+    return report["subj"].reset_index(drop=True), report["src"]
+
+
+def comps_of(table, subject):
+    rows = table[table["subject"] == subject]
+    return rows.drop(columns="subject").reset_index(drop=True)
+
+
+def test_fan_out_copies_each_representatives_rows():
+    table = pd.DataFrame({"subject": [0, 0, 1, 2], "source": [10, 11, 12, 13]})
+    out = fan_out(table, np.array([0, 1, 0, 2, 1]))
+    assert out["subject"].tolist() == [0, 0, 1, 2, 2, 3, 4]
+    assert out["source"].tolist() == [10, 11, 12, 10, 11, 13, 12]
+
+
+def test_equal_subjects_share_one_run(retail):
+    subj, src = retail
+    repeats = [2, 5, 5]
+    doubled = pd.concat([subj, subj.iloc[repeats]], ignore_index=True)
+    doubled.loc[len(subj):, "Property City"] = "Elsewhere"  # output only, still shared
+    table = match_results(doubled, src, prop_type="Retail")
+    assert table.attrs["shared_subjects"] == len(repeats)
+    alone = match_results(subj, src, prop_type="Retail")
+    assert alone.attrs["shared_subjects"] == 0
+    pd.testing.assert_frame_equal(table[table["subject"] < len(subj)].reset_index(drop=True), alone)
+    for k, i in enumerate(repeats):
+        pd.testing.assert_frame_equal(comps_of(table, len(subj) + k), comps_of(alone, i))
+
+
+@pytest.mark.parametrize("column, value", [("GBA", 1e7), ("Property Account No", "other"), ("Owner Name/ LLC Name", "Other Owner")])
+def test_subjects_differing_on_a_matching_field_are_matched_apart(retail, column, value):
+    subj, src = retail
+    changed = pd.concat([subj, subj.iloc[[2]]], ignore_index=True)
+    changed.loc[len(subj), column] = value
+    table = match_results(changed, src, prop_type="Retail")
+    assert table.attrs["shared_subjects"] == 0
+
+
+def random_candidates(rng, n):
+    """A candidate table for pick_scored(), with plenty of score and metric ties."""
+    return {
+        "rows": np.arange(n) * 3,
+        "metric": rng.integers(0, 4, n).astype(np.float64),
+        "dist": rng.integers(0, 3, n).astype(np.float64),
+        "main_pct": rng.integers(0, 3, n) / 4,
+        "value_pct": np.where(rng.random(n) < 0.1, np.nan, rng.integers(0, 3, n) / 4),
+        "max_radius": 2.0,
+    }
+
+
+def scored_by_full_sort(cands, keep, taken, keys_of, max_comps):
+    idx = np.flatnonzero(keep)
+    score = comp_scores(cands, idx)
+    picked = []
+    for j in np.lexsort((cands["rows"][idx], -cands["metric"][idx], score)):
+        keys = keys_of(cands["rows"][idx[j]])
+        if taken.isdisjoint(keys) and len(picked) < max_comps:
+            taken |= keys
+            picked.append(idx[j])
+    return picked
+
+
+def test_pick_scored_ranks_like_a_full_sort():
+    rng = np.random.default_rng(3)
+    for trial in range(200):
+        n = int(rng.integers(1, 60))
+        cands, keep = random_candidates(rng, n), rng.random(n) < 0.8
+        owners = rng.integers(0, max(n // 3, 1), n)  # shared keys make dedup reject candidates
+
+        def keys_of(row):
+            return {("_key_owner", owners[row // 3])}
+
+        max_comps = int(rng.integers(1, 8))
+        got = pick_scored(cands, keep, 0.0, set(), keys_of, max_comps)
+        assert got == scored_by_full_sort(cands, keep, set(), keys_of, max_comps), trial
+
+
+def test_scored_selection_fills_max_comps_best_first(retail):
+    subj, src = retail
+    classic = match_results(subj, src, prop_type="Retail", use_cascading=False, max_comps=6)
+    scored = match_results(subj, src, prop_type="Retail", use_cascading=False, max_comps=6, selection="scored")
+    assert classic.groupby("subject").size().max() <= 3
+    counts = scored.groupby("subject").size()
+    assert counts.max() == 6 and (counts >= classic.groupby("subject").size().reindex(counts.index, fill_value=0)).all()
+    assert (scored.groupby("subject")["rank"].apply(lambda r: r.tolist() == list(range(len(r))))).all()
+
+
+def test_scored_cascade_reaches_looser_tiers_only_when_short(retail):
+    subj, src = retail
+    table = match_results(subj, src, prop_type="Retail", max_comps=5, selection="scored")
+    for _, comps in table.groupby("subject"):
+        assert comps["tier"].is_monotonic_increasing
+        if comps["tier"].nunique() > 1:
+            assert len(comps) <= 5
+
+
+def test_unknown_selection_is_rejected_before_matching(retail):
+    subj, src = retail
+    with pytest.raises(ValueError, match="Unknown selection 'best'"):
+        match_results(subj, src, prop_type="Retail", selection="best")
@@ -0,0 +1,99 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comps_engine import read_inputs, required_columns, run_matching, validate_frames
+from comps_output import open_result_writer, write_results_file, write_results_workbook
+from sample_rolls import sample_roll, write_roll
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    """A Retail results table with filled and empty comp slots."""
+    subj, src = sample_roll("Retail", 300, 12)
+    subj_file, src_file = write_roll(subj, src, tmp_path_factory.mktemp("roll"))
+    subj, src = read_inputs(subj_file, src_file, "Retail", parallel=False)
+    report = validate_frames(subj, src, required_columns("Retail"))
+    frame = run_matching(
+        report["subj"], report["src"], prop_type="Retail", max_comps=4,
+        use_overpaid=True, overpaid_base_dim="GBA", overpaid_pct=0.1,
+    )
+    assert (frame["Comp1_Rule_Set"] != "").any() and (frame["Comp4_Rule_Set"] == "").any()
+    return frame
+
+
+def write(frame, path, chunk=5):
+    with open_result_writer(path) as writer:
+        for start in range(0, len(frame), chunk):
+            writer.write_frame(frame.iloc[start:start + chunk])
+    return writer
+
+
+def as_text(df):
+    """Cells as comparable text: "" for blanks, numbers to 12 digits (Excel keeps 15)."""
+    def cell(v):
+        if v is None or (isinstance(v, float) and np.isnan(v)) or v == "":
+            return ""
+        try:
+            return f"{float(v):.12g}"
+        except ValueError:
+            return str(v)
+    return df.astype(object).apply(lambda col: col.map(cell))
+
+
+@pytest.mark.parametrize("ext", ["xlsx", "csv", "parquet"])
+def test_every_format_keeps_the_values(results, tmp_path, ext):
+    path = tmp_path / f"results.{ext}"
+    writer = write(results, path)
+    assert writer.rows_written == len(results)
+    if ext == "xlsx":
+        back = pd.read_excel(path)
+    elif ext == "csv":
+        back = pd.read_csv(path, dtype=str)
+    else:
+        back = pd.read_parquet(path)
+    assert list(back.columns) == list(results.columns)
+    pd.testing.assert_frame_equal(as_text(back), as_text(results))
+
+
+def test_parquet_types_numeric_fields(results, tmp_path):
+    write(results, tmp_path / "results.parquet")
+    back = pd.read_parquet(tmp_path / "results.parquet")
+    assert back["Subject_VPU"].dtype == np.float64
+    assert back["Comp4_GBA"].dtype == np.float64
+    assert back["Subject_Overpaid_Value"].dtype == np.float64
+    assert back["Comp1_Property Account No"].dtype != np.float64
+
+
+def test_parquet_rejects_text_in_a_numeric_column(tmp_path):
+    frame = pd.DataFrame({"Subject_Property Account No": ["1"], "Subject_GBA": ["12,000 sq ft"]})
+    with pytest.raises(ValueError, match="Subject_GBA"):
+        write(frame, tmp_path / "results.parquet")
+
+
+@pytest.mark.parametrize("ext", ["csv", "parquet"])
+def test_rows_and_frames_write_the_same_file(results, tmp_path, ext):
+    write(results, tmp_path / f"frames.{ext}")
+    with open_result_writer(tmp_path / f"rows.{ext}") as writer:
+        for row in results.to_dict("records"):
+            writer.write_row(row)
+    with open(tmp_path / f"frames.{ext}", "rb") as a, open(tmp_path / f"rows.{ext}", "rb") as b:
+        if ext == "csv":
+            assert a.read() == b.read()
+        else:
+            pd.testing.assert_frame_equal(pd.read_parquet(a), pd.read_parquet(b))
+
+
+def test_results_file_and_workbook(results):
+    preview, data = write_results_file([results.iloc[:7], results.iloc[7:]], "csv", preview_rows=3)
+    assert len(preview) == 3
+    assert len(pd.read_csv(io.BytesIO(data))) == len(results)
+
+    target = io.BytesIO()
+    previews = write_results_workbook([("Retail", [results]), ("Office", [])], target)
+    sheets = pd.read_excel(io.BytesIO(target.getvalue()), sheet_name=None)
+    assert list(sheets) == ["Retail", "Office"]
+    assert len(sheets["Retail"]) == len(results) and sheets["Office"].empty
+    assert previews["Office"].empty
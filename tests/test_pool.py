@@ -0,0 +1,74 @@
+"""compact_pool(): smaller dtypes, same values, one NaN."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comps_cache import CompCache, PoolCache
+from comps_engine import (
+    compact_pool,
+    load_source_pool,
+    match_results,
+    normalize_frame,
+    read_inputs,
+    required_columns,
+    validate_frames,
+)
+from sample_rolls import sample_roll, write_roll
+
+
+def nan_bits(df):
+    """{column: set of NaN bit patterns} over the float columns."""
+    out = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind == "f":
+            arr = df[col].to_numpy()
+            uint = {2: np.uint16, 4: np.uint32, 8: np.uint64}[arr.itemsize]
+            out[col] = set(arr[np.isnan(arr)].view(uint).tolist())
+    return out
+
+
+@pytest.mark.parametrize("prop_type", ["Hotel", "Retail"])
+def test_compact_pool_keeps_values_in_smaller_dtypes(prop_type):
+    _, src = sample_roll(prop_type, 500, 1)
+    normalized = normalize_frame(src, prop_type)
+    compact = compact_pool(normalized.copy())
+    assert compact["Class_Num"].dtype == np.float16
+    assert compact["_key_owner"].dtype == "category"
+    assert compact.memory_usage(deep=True).sum() < normalized.memory_usage(deep=True).sum()
+    for col in normalized.columns:
+        got, want = compact[col].astype(object), normalized[col].astype(object)
+        assert got.isna().equals(want.isna()), col
+        assert got[got.notna()].tolist() == want[want.notna()].tolist(), col
+
+
+def test_compact_pool_stores_one_nan():
+    df = compact_pool(pd.DataFrame({"Class_Num": [3.0, np.nan, 5.0], "zip": [75001.0, np.nan, 10001.0]}))
+    assert (df["Class_Num"].dtype, df["zip"].dtype) == (np.float16, np.float32)
+    assert nan_bits(df) == {"Class_Num": {0x7E00}, "zip": {0x7FC00000}}
+
+
+@pytest.mark.parametrize("prop_type", ["Hotel", "Retail"])
+def test_cached_pool_matches_a_fresh_one_bit_for_bit(tmp_path, prop_type):
+    _, src = sample_roll(prop_type, 400, 1)
+    _, src_file = write_roll(src.iloc[:5], src, tmp_path)
+    cache = PoolCache(tmp_path / "cache")
+    fresh = load_source_pool(src_file, prop_type, cache=cache)
+    cached = load_source_pool(src_file, prop_type, cache=cache)
+    assert cache.entries()
+    pd.testing.assert_frame_equal(cached, fresh)
+    assert nan_bits(cached) == nan_bits(fresh)
+    assert any(nan_bits(fresh).values())
+
+
+def test_second_identical_run_is_served_from_the_caches(tmp_path):
+    subj, src = sample_roll("Retail", 400, 20)
+    files = write_roll(subj, src, tmp_path)
+    pool_cache, comp_cache = PoolCache(tmp_path / "cache"), CompCache(tmp_path / "cache")
+    tables = []
+    for _ in range(2):
+        subj, src = read_inputs(*files, "Retail", cache=pool_cache, parallel=False)
+        report = validate_frames(subj, src, required_columns("Retail"))
+        tables.append(match_results(report["subj"], report["src"], prop_type="Retail", comp_cache=comp_cache))
+    assert tables[1].attrs["cached_subjects"] == len(report["subj"])
+    pd.testing.assert_frame_equal(tables[1], tables[0])
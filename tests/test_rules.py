@@ -0,0 +1,51 @@
+"""The engine's vectorized rules against the original scalar ones (tests/baseline_reference.py)."""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import baseline_reference as baseline
+from comps_engine import DEDUP_KEY_COLS, add_dedup_keys, class_mask_hotel, class_mask_other, dedup_key_arrays, keys_at
+
+CLASSES = [1, 2, 3, 4, 5, 6, 7, 8, 4.6]
+
+
+def test_hotel_class_rule():
+    for subj_c, comp_c in itertools.product(CLASSES, CLASSES):
+        assert bool(class_mask_hotel(subj_c, comp_c)) == baseline.class_ok_hotel(subj_c, comp_c), (subj_c, comp_c)
+
+
+def test_other_class_rule():
+    for subj_c, comp_c in itertools.product(CLASSES, CLASSES):
+        assert bool(class_mask_other(subj_c, comp_c)) == baseline.class_ok_other(subj_c, comp_c), (subj_c, comp_c)
+    # find_comps skipped the rule when either class was missing
+    assert class_mask_other(np.nan, 3) and class_mask_other(3, np.nan)
+
+
+def test_hotel_class_rule_broadcasts_subjects_against_comps():
+    subj = np.array([[8.0], [6.0], [2.0]])
+    comp = np.array([[8.0, 7.0, 5.0, 1.0, np.nan]])
+    assert class_mask_hotel(subj, comp).tolist() == [
+        [True, False, False, False, False],
+        [False, True, True, False, False],
+        [False, False, False, True, False],
+    ]
+
+
+def test_dedup_keys_agree_with_unique_ok():
+    rows = pd.DataFrame({
+        "Property Account No": ["001", " 001 ", "002", "003", "004", "005", np.nan],
+        "Owner Name/ LLC Name": ["Lone Star LLC", "x", "lone-star llc", "ABC", "abc", None, "Red Oak"],
+        "Hotel Name": ["Inn", "Inn", "Best Inn #1", "Best Inn #2", "Motel", "Motel", "Red"],
+        "Owner Street Address": ["PO Box 1", "PO Box 2", "1 Main St", "1 Main St.", "", "9 Elm", "9 Elm"],
+        "Property Address": ["12 Oak", "13 Oak", "100 Broadway", "200 Broadway", "5", "5", "12 Oak"],
+    })
+    keyed = add_dedup_keys(rows.copy())
+    coded = keyed.astype({key_col: "category" for key_col in DEDUP_KEY_COLS})  # as in a compacted pool
+    records = [row for _, row in rows.iterrows()]
+    for is_hotel, src in itertools.product((True, False), (keyed, coded)):
+        s_keys, c_keys = dedup_key_arrays(keyed, src, is_hotel)
+        for i, j in itertools.product(range(len(rows)), repeat=2):
+            clash = not keys_at(s_keys, i).isdisjoint(keys_at(c_keys, j))
+            assert clash == (not baseline.unique_ok(records[i], records[j], [], is_hotel)), (is_hotel, i, j)
@@ -0,0 +1,115 @@
+"""PoolStore: importing a Data Source once and matching against the rows subjects can reach."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import comps_store
+from comps_engine import (
+    iter_result_frames,
+    match_rules_for,
+    normalize_frame,
+    read_inputs,
+    read_table,
+    required_columns,
+    validate_frames,
+)
+from comps_store import PoolStore, match_sharded, read_store_inputs, read_store_subjects, validate_store
+from sample_rolls import sample_roll, write_roll
+
+
+@pytest.fixture(scope="module", params=["Hotel", "Retail"])
+def roll(request, tmp_path_factory):
+    prop_type = request.param
+    subj, src = sample_roll(prop_type, 1500, 25)
+    directory = tmp_path_factory.mktemp(prop_type)
+    subj_file, src_file = write_roll(subj, src, directory)
+    store = PoolStore.import_file(src_file, prop_type, directory / "pool.sqlite")
+    return prop_type, subj_file, src_file, store
+
+
+def results(subj, src, prop_type, **options):
+    report = validate_frames(subj, src, required_columns(prop_type))
+    frames = iter_result_frames(report["subj"], report["src"], prop_type=prop_type, **options)
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_import_keeps_every_row_and_value(roll):
+    prop_type, _, src_file, store = roll
+    expected = normalize_frame(read_table(src_file), prop_type)
+    info = store.info()
+    assert (info["prop_type"], info["rows"]) == (prop_type, len(expected))
+    loaded = store.load(np.arange(len(expected)))
+    pd.testing.assert_frame_equal(loaded.reset_index(drop=True), expected, check_dtype=False)
+    assert [str(t) for t in loaded.dtypes] == [str(t) for t in expected.dtypes]
+
+
+def test_import_reuses_a_store_of_the_same_file(roll, monkeypatch):
+    prop_type, _, src_file, store = roll
+    imports = []
+    monkeypatch.setattr(PoolStore, "import_frame", classmethod(lambda cls, *a, **k: imports.append(a)))
+    assert PoolStore.import_file(src_file, prop_type, store.path).path == store.path
+    assert imports == []
+    PoolStore.import_file(src_file, prop_type, store.path, force=True)
+    assert len(imports) == 1
+
+
+def test_store_rejects_the_other_normalization(roll, tmp_path):
+    prop_type, _, _, store = roll
+    other = "Retail" if prop_type == "Hotel" else "Hotel"
+    with pytest.raises(ValueError, match=f"imported for {prop_type}"):
+        store.check_prop_type(other)
+    store.check_prop_type("Office" if prop_type != "Hotel" else "Hotel")
+    with pytest.raises(ValueError, match="not a Data Source store"):
+        PoolStore(tmp_path / "missing.sqlite").check_prop_type(prop_type)
+
+
+def test_store_pool_is_a_superset_of_the_rows_matched(roll):
+    prop_type, subj_file, src_file, store = roll
+    rules = match_rules_for(True, "Static", None, None)
+    subj, pool = read_store_inputs(subj_file, store.path, prop_type, rules)
+    assert 0 < len(pool) < store.info()["rows"]
+    assert pool.index.is_monotonic_increasing
+
+
+@pytest.mark.parametrize("options", [{}, {"use_cascading": False, "max_comps": 5, "selection": "scored"}])
+def test_store_run_matches_the_in_memory_run(roll, options):
+    prop_type, subj_file, src_file, store = roll
+    rules = match_rules_for(options.get("use_cascading", True), "Static", None, None)
+    expected = results(*read_inputs(subj_file, src_file, prop_type, parallel=False), prop_type, **options)
+    got = results(*read_store_inputs(subj_file, store, prop_type, rules), prop_type, **options)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_validate_store_counts_like_validate_frames(roll):
+    prop_type, subj_file, src_file, store = roll
+    expected = validate_frames(*read_inputs(subj_file, src_file, prop_type, parallel=False), required_columns(prop_type))
+    report = validate_store(read_store_subjects(subj_file, store, prop_type), store, required_columns(prop_type))
+    assert report["src"] is None
+    for key in ("src_before", "src_nulls", "subj_before", "subj_nulls"):
+        assert report[key] == expected[key], key
+    assert report["src_after"] == len(expected["src"])
+    pd.testing.assert_frame_equal(report["subj"], expected["subj"])
+
+
+@pytest.mark.parametrize("batch_rows", [50, 10**6])
+def test_sharded_run_matches_the_in_memory_run(roll, batch_rows):
+    prop_type, subj_file, src_file, store = roll
+    expected = results(*read_inputs(subj_file, src_file, prop_type, parallel=False), prop_type, max_comps=4)
+    required = required_columns(prop_type)
+    subj = validate_store(read_store_subjects(subj_file, store, prop_type), store, required)["subj"]
+    table, src = match_sharded(subj, store, prop_type=prop_type, required_cols=required, batch_rows=batch_rows, max_comps=4)
+    assert len(src) == table["source"].nunique()
+    assert table.attrs["peak_pool_rows"] < store.info()["rows"]
+    if batch_rows == 50:
+        assert table.attrs["shards_loaded"] > 1
+    got = pd.concat(iter_result_frames(subj, src, prop_type=prop_type, max_comps=4, comp_table=table), ignore_index=True)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_cli_imports_a_store(tmp_path, capsys):
+    subj, src = sample_roll("Office", 300, 1)
+    _, src_file = write_roll(subj, src, tmp_path)
+    assert comps_store.main([str(src_file), str(tmp_path / "office.sqlite"), "--prop-type", "Office"]) == 0
+    assert "300 Office rows" in capsys.readouterr().err
+    assert comps_store.list_stores(tmp_path) != []
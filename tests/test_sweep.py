@@ -0,0 +1,103 @@
+"""Rule sweeps: many rule settings matched from one candidate scan."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comps_cli import main
+from comps_engine import (
+    RULE_SETS,
+    SWEEP_COVERAGE,
+    apply_rule_setting,
+    match_results,
+    match_rules_for,
+    normalize_frame,
+    required_columns,
+    rule_grid,
+    sweep_rules,
+    validate_frames,
+)
+from sample_rolls import sample_roll, write_roll
+
+SETTINGS = rule_grid(max_radius_miles=[3, 10, (7, 15, 10, 15, 15)], max_gap_pct_value=[0.2, 0.6])
+
+
+def test_rule_grid_is_every_combination():
+    assert len(SETTINGS) == 6
+    assert SETTINGS[0] == {"max_radius_miles": 3, "max_gap_pct_value": 0.2}
+    with pytest.raises(ValueError, match="max_radius"):
+        rule_grid(max_radius=[5])
+
+
+def test_apply_rule_setting_sets_every_tier():
+    rules = apply_rule_setting(RULE_SETS, {"max_radius_miles": 4, "max_gap_pct_size": (1, 2, 3, 4, 5)})
+    assert [r["max_radius_miles"] for r in rules] == [4.0] * len(RULE_SETS)
+    assert [r["max_gap_pct_size"] for r in rules] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert [r["name"] for r in rules] == [r["name"] for r in RULE_SETS]
+    assert RULE_SETS[0]["max_radius_miles"] != 4  # not changed in place
+    with pytest.raises(ValueError, match="2 values for 5 rule tiers"):
+        apply_rule_setting(RULE_SETS, {"max_radius_miles": (1, 2)})
+    with pytest.raises(ValueError, match="Unknown rule key"):
+        apply_rule_setting(RULE_SETS, {"radius": 1})
+
+
+@pytest.fixture(scope="module", params=["Hotel", "Retail"])
+def roll(request):
+    subj, src = (normalize_frame(df, request.param) for df in sample_roll(request.param, 1500, 30))
+    report = validate_frames(subj, src, required_columns(request.param))
+    return request.param, report["subj"].reset_index(drop=True), report["src"]
+
+
+@pytest.mark.parametrize("selection", ["classic", "scored"])
+def test_each_setting_matches_like_match_results(roll, selection):
+    prop_type, subj, src = roll
+    result = sweep_rules(subj, src, SETTINGS, prop_type=prop_type, max_comps=4, selection=selection)
+    summary, comps = result["summary"], result["comps"]
+    assert list(summary["setting"]) == list(result["candidates"].columns)
+    for k, setting in enumerate(SETTINGS):
+        expected = match_results(
+            subj, src, prop_type=prop_type, max_comps=4, selection=selection,
+            rule_sets=apply_rule_setting(RULE_SETS, setting),
+        )
+        got = comps[comps["setting"] == k].drop(columns="setting").reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected, obj=summary["setting"][k])
+        n_comps = np.bincount(expected["subject"], minlength=len(subj))
+        coverage = np.bincount(np.minimum(n_comps, 3), minlength=4)
+        assert summary.loc[k, SWEEP_COVERAGE].tolist() == coverage.tolist()
+    assert summary["3+ comps"].iloc[1] >= summary["3+ comps"].iloc[0]  # a wider value band
+
+
+def test_single_rule_set_sweep(roll):
+    prop_type, subj, src = roll
+    settings = rule_grid(max_radius_miles=[2, 8])
+    comps = sweep_rules(subj, src, settings, prop_type=prop_type, use_cascading=False)["comps"]
+    for k, setting in enumerate(settings):
+        expected = match_results(
+            subj, src, prop_type=prop_type,
+            rule_sets=apply_rule_setting(match_rules_for(False), setting),
+        )
+        got = comps[comps["setting"] == k].drop(columns="setting").reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected)
+
+
+def test_sweep_needs_settings(roll):
+    prop_type, subj, src = roll
+    with pytest.raises(ValueError, match="No rule settings"):
+        sweep_rules(subj, src, [], prop_type=prop_type)
+
+
+def test_cli_sweep_writes_the_summary(tmp_path, capsys):
+    subj, src = sample_roll("Retail", 600, 10)
+    files = [str(f) for f in write_roll(subj, src, tmp_path)]
+    out = tmp_path / "sweep.csv"
+    args = [*files, "--prop-type", "Retail", "-o", str(out), "--no-cache"]
+    assert main([*args, "--sweep", "max_radius_miles=3,10", "--sweep", "max_gap_pct_value=0.2/0.3/0.4/0.5/0.6"]) == 0
+    summary = pd.read_csv(out)
+    assert list(summary["setting"]) == [
+        "max_radius_miles=3, max_gap_pct_value=0.2/0.3/0.4/0.5/0.6",
+        "max_radius_miles=10, max_gap_pct_value=0.2/0.3/0.4/0.5/0.6",
+    ]
+    assert (summary[SWEEP_COVERAGE].sum(axis=1) == summary["subjects"]).all()
+    with pytest.raises(SystemExit):
+        main([*args, "--sweep", "max_radius_miles=near"])
+    assert "values must be numbers" in capsys.readouterr().err